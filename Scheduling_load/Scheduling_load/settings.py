@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the time of every other middleware is included
+    "scheduling_system.instrumentation.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -85,6 +88,54 @@ DATABASES = {
     }
 }
 
+# Cache for reference data and the version counters of the in-process indexes.
+# LocMem evicts least recently used entries past MAX_ENTRIES; set REDIS_URL to
+# share one cache between workers (configure Redis with maxmemory-policy allkeys-lru).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'scheduling-load',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+        'TIMEOUT': 60 * 60,
+    }
+
+# Request profiling (scheduling_system/instrumentation.py): Server-Timing
+# headers, per-view totals at /metrics, and a logged cProfile report for
+# requests sent with ?profile=1 when PROFILING_CPROFILE is on. Off unless
+# DEBUG or PROFILING_ENABLED is set; outside DEBUG, /metrics answers staff
+# users and scrapers sending "Authorization: Bearer <PROFILING_METRICS_TOKEN>"
+PROFILING_ENABLED = DEBUG or bool(os.environ.get('PROFILING_ENABLED'))
+PROFILING_SERVER_TIMING = DEBUG
+PROFILING_CPROFILE = DEBUG
+PROFILING_METRICS_TOKEN = os.environ.get('PROFILING_METRICS_TOKEN')
+PROFILING_SLOW_SECONDS = 1.0
+PROFILING_DIR = os.environ.get('PROFILING_DIR')  # also dump .prof files here
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain"},
+    },
+    "loggers": {
+        "scheduling_system": {
+            "handlers": ["console"],
+            "level": os.environ.get("LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
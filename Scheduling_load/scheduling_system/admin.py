@@ -1,3 +1,14 @@
 from django.contrib import admin
 
+from .models import Room
+
 # Register your models here.
+
+
+@admin.register(Room)
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ('room_number', 'room_type', 'building', 'campus')
+    list_filter = ('room_type', 'campus')
+    search_fields = ('room_number',)
+    # Room.__str__ and the building/campus columns read both foreign keys
+    list_select_related = ('building', 'campus')
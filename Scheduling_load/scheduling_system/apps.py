@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class SchedulingSystemConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "scheduling_system"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .instrumentation import install_query_wrapper
+
+        # Count each request's queries (see instrumentation.py)
+        connection_created.connect(install_query_wrapper, dispatch_uid='scheduling_system_query_metrics')
@@ -0,0 +1,310 @@
+"""
+Parsing of the availability and qualification JSON stored on instructors and rooms.
+
+`availability_days` is a list of day names ("Monday", "Mon", "M", "Th", ...)
+and `availability_times` a list of windows, either "07:30-12:00" strings,
+["07:30", "12:00"] pairs or {"start": ..., "end": ...} objects, optionally
+keyed by day ({"Monday": ["07:30-12:00"], ...}). An empty list means the
+entity has not restricted itself.
+
+Times are handled as 15-minute slots of the day, so a day's free time fits
+in one integer bit mask (bit n = slot starting at n * 15 minutes). The masks
+of a whole week are stored on InstructorData and Room as `availability_mask`,
+7 x 96 bits packed into 84 bytes (Monday first, little-endian per day), and
+kept in step with the JSON on every save.
+"""
+import re
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy only speeds up screen_masks
+    np = None
+
+
+VALID_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+DAY_BYTES = SLOTS_PER_DAY // 8
+WEEK_BYTES = DAY_BYTES * len(VALID_DAYS)
+
+DAY_ALIASES = {
+    'm': 'Monday', 'mon': 'Monday',
+    't': 'Tuesday', 'tu': 'Tuesday', 'tue': 'Tuesday', 'tues': 'Tuesday',
+    'w': 'Wednesday', 'wed': 'Wednesday',
+    'th': 'Thursday', 'r': 'Thursday', 'thu': 'Thursday', 'thur': 'Thursday', 'thurs': 'Thursday',
+    'f': 'Friday', 'fri': 'Friday',
+    's': 'Saturday', 'sa': 'Saturday', 'sat': 'Saturday',
+    'su': 'Sunday', 'sun': 'Sunday',
+}
+DAY_ALIASES.update({day.lower(): day for day in VALID_DAYS})
+
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p", "%I %p", "%I%p")
+# "07:30" / "7:30:00" without going through strptime, which is slow in bulk
+CLOCK_RE = re.compile(r'(\d{1,2}):(\d{2})(?::\d{2})?')
+
+
+def parse_day(value):
+    """Canonical day name for `value`, or None if it is not recognised."""
+    if not isinstance(value, str):
+        return None
+    return DAY_ALIASES.get(value.strip().lower().rstrip('.'))
+
+
+def parse_minutes(value):
+    """Minutes since midnight for "HH:MM"-like strings or datetime.time values."""
+    if hasattr(value, 'hour'):
+        return value.hour * 60 + value.minute
+    if not isinstance(value, str):
+        return None
+    value = value.strip().upper()
+    match = CLOCK_RE.fullmatch(value)
+    if match and int(match.group(1)) < 24 and int(match.group(2)) < 60:
+        return int(match.group(1)) * 60 + int(match.group(2))
+    for time_format in TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+        return parsed.hour * 60 + parsed.minute
+    return None
+
+
+def parse_window(value):
+    """(start_minute, end_minute) for one time window entry, or None."""
+    if isinstance(value, str):
+        for separator in ('-', '–', ' to '):
+            if separator in value:
+                start, end = value.split(separator, 1)
+                break
+        else:
+            return None
+    elif isinstance(value, (list, tuple)) and len(value) == 2:
+        start, end = value
+    elif isinstance(value, dict):
+        start = value.get('start', value.get('start_time'))
+        end = value.get('end', value.get('end_time'))
+    else:
+        return None
+    start, end = parse_minutes(start), parse_minutes(end)
+    if start is None or end is None or end <= start:
+        return None
+    return start, end
+
+
+def parse_days(days):
+    """Set of canonical day names; every day when `days` is empty."""
+    if not days:
+        return set(VALID_DAYS)
+    if isinstance(days, str):
+        days = days.replace(',', ' ').split()
+    parsed = {parse_day(day) for day in days}
+    parsed.discard(None)
+    return parsed or set(VALID_DAYS)
+
+
+def parse_windows(times):
+    """List of (start_minute, end_minute) windows; the whole day when `times` is empty."""
+    # A single window may be stored bare instead of inside a list
+    if isinstance(times, (str, dict)) or parse_window(times):
+        times = [times]
+    windows = [window for window in (parse_window(time) for time in times or []) if window]
+    return windows or [(0, 24 * 60)]
+
+
+def window_mask(start_minute, end_minute):
+    """Mask of the 15-minute slots fully inside [start_minute, end_minute)."""
+    first = -(-start_minute // SLOT_MINUTES)
+    last = end_minute // SLOT_MINUTES
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def span_mask(start_minute, end_minute):
+    """Mask of every 15-minute slot touched by [start_minute, end_minute)."""
+    first = start_minute // SLOT_MINUTES
+    last = -(-end_minute // SLOT_MINUTES)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def day_masks(days, times):
+    """
+    {day: mask} of available slots for an entity's availability JSON.
+
+    A dict in `times` keyed by day gives per-day windows; otherwise the same
+    windows apply on every listed day.
+    """
+    if isinstance(times, dict) and any(parse_day(key) for key in times):
+        masks = {}
+        for key, windows in times.items():
+            day = parse_day(key)
+            if day is None:
+                continue
+            mask = 0
+            for start, end in parse_windows(windows):
+                mask |= window_mask(start, end)
+            masks[day] = masks.get(day, 0) | mask
+        allowed = parse_days(days)
+        return {day: mask for day, mask in masks.items() if day in allowed}
+
+    mask = 0
+    for start, end in parse_windows(times):
+        mask |= window_mask(start, end)
+    return {day: mask for day in parse_days(days)}
+
+
+def qualified_course_codes(qualified_course):
+    """
+    Upper-cased course codes from an instructor's `qualified_course` JSON.
+
+    Accepts {"IT 101": ..., ...}, {"courses": [...]}, ["IT 101", ...] and lists
+    of {"course_code": ...} objects.
+    """
+    codes = set()
+
+    def collect(value):
+        if isinstance(value, str):
+            if value.strip():
+                codes.add(' '.join(value.split()).upper())
+        elif isinstance(value, dict):
+            code = value.get('course_code', value.get('code'))
+            if code is not None:
+                collect(code)
+                return
+            for key, nested in value.items():
+                if isinstance(nested, (list, dict)):
+                    collect(nested)
+                else:
+                    collect(key)
+        elif isinstance(value, (list, tuple, set)):
+            for item in value:
+                collect(item)
+
+    collect(qualified_course)
+    return codes
+
+
+# Packed weekly masks
+
+def encode_week(masks):
+    """Pack {day: mask} into the 84-byte `availability_mask` format."""
+    return b''.join(masks.get(day, 0).to_bytes(DAY_BYTES, 'little') for day in VALID_DAYS)
+
+
+def decode_week(data):
+    """{day: mask} for a packed week; days without any free slot are left out."""
+    data = bytes(data or b'')
+    if len(data) != WEEK_BYTES:
+        return {}
+    masks = {}
+    for position, day in enumerate(VALID_DAYS):
+        mask = int.from_bytes(data[position * DAY_BYTES:(position + 1) * DAY_BYTES], 'little')
+        if mask:
+            masks[day] = mask
+    return masks
+
+
+def encode_availability(days, times):
+    """Packed week for an entity's availability_days/availability_times JSON."""
+    return encode_week(day_masks(days, times))
+
+
+def week_masks(entity):
+    """
+    {day: mask} for an InstructorData or Room, from the stored mask when it is
+    filled in and from the JSON otherwise.
+    """
+    masks = decode_week(getattr(entity, 'availability_mask', None))
+    if masks or getattr(entity, 'availability_mask', None):
+        return masks
+    return day_masks(entity.availability_days, entity.availability_times)
+
+
+def slot_week(day, start_minute, end_minute):
+    """Packed week with only the slots of [start_minute, end_minute) on `day` set."""
+    return encode_week({day: span_mask(start_minute, end_minute)})
+
+
+def is_available(week, day, start_minute, end_minute):
+    """True if a packed week is free for the whole of [start_minute, end_minute) on `day`."""
+    wanted = span_mask(start_minute, end_minute)
+    return decode_week(week).get(day, 0) & wanted == wanted
+
+
+def intersect_weeks(*weeks):
+    """Packed week of the slots free in every one of `weeks`."""
+    result = int.from_bytes(encode_week({day: FULL_DAY for day in VALID_DAYS}), 'little')
+    for week in weeks:
+        result &= int.from_bytes(bytes(week or b'').ljust(WEEK_BYTES, b'\0'), 'little')
+    return result.to_bytes(WEEK_BYTES, 'little')
+
+
+def union_weeks(*weeks):
+    """Packed week of the slots set in any of `weeks`."""
+    result = 0
+    for week in weeks:
+        result |= int.from_bytes(bytes(week or b'').ljust(WEEK_BYTES, b'\0'), 'little')
+    return result.to_bytes(WEEK_BYTES, 'little')
+
+
+def slot_count(week):
+    """Number of slots set in a packed week."""
+    return int.from_bytes(bytes(week or b''), 'little').bit_count()
+
+
+def free_starts(week, day, length_minutes, step_minutes=30):
+    """Start minutes on `day` at which a `length_minutes` block fits in a packed week."""
+    mask = decode_week(week).get(day, 0)
+    starts = []
+    for start in range(0, 24 * 60 - length_minutes + 1, step_minutes):
+        wanted = span_mask(start, start + length_minutes)
+        if mask & wanted == wanted:
+            starts.append(start)
+    return starts
+
+
+def screen_masks(weeks, day, start_minute, end_minute):
+    """
+    Which of many packed weeks are free for one requested slot.
+
+    `weeks` is a list of 84-byte masks or an (n, 84) uint8 array (see
+    mask_matrix). With NumPy the whole batch is one vectorized AND and compare,
+    returning a boolean array; without it, a list of booleans.
+    """
+    wanted = slot_week(day, start_minute, end_minute)
+    if np is None:
+        return [is_available(week, day, start_minute, end_minute) for week in weeks]
+    matrix = weeks if isinstance(weeks, np.ndarray) else mask_matrix(weeks)
+    wanted = np.frombuffer(wanted, dtype=np.uint8)
+    return ((matrix & wanted) == wanted).all(axis=1)
+
+
+def mask_matrix(weeks):
+    """(n, 84) uint8 array of packed weeks, for repeated screen_masks calls."""
+    data = b''.join(bytes(week or b'').ljust(WEEK_BYTES, b'\0')[:WEEK_BYTES] for week in weeks)
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(weeks), WEEK_BYTES)
+
+
+def slot_totals(weeks):
+    """
+    For many packed weeks, how many have each slot set: a list of 7 x 96
+    counts, Monday 00:00 first.
+    """
+    if not weeks:
+        return [0] * (SLOTS_PER_DAY * len(VALID_DAYS))
+    if np is None:
+        totals = [0] * (SLOTS_PER_DAY * len(VALID_DAYS))
+        for week in weeks:
+            value = int.from_bytes(bytes(week or b'').ljust(WEEK_BYTES, b'\0'), 'little')
+            while value:
+                low = value & -value
+                totals[low.bit_length() - 1] += 1
+                value ^= low
+        return totals
+    bits = np.unpackbits(mask_matrix(weeks), axis=1, bitorder='little')
+    return bits.sum(axis=0).tolist()
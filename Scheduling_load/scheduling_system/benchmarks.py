@@ -0,0 +1,492 @@
+"""
+Benchmarks for the endpoints and engines that decide how fast scheduling feels.
+
+generate_dataset() fills an empty database with a synthetic university:
+campuses, buildings and rooms, programs, courses, instructors with their
+qualifications, and a conflict-free timetable for one semester (conflict
+checks do not look at the semester, so neither does the generator). run_benchmarks()
+then times each endpoint through the test client (every middleware and the
+view, no network) and measures the solver, the conflict engines and the
+search index builds directly. The result is one JSON-serializable dict, so
+runs can be saved and compared (see compare_results and the benchmark
+command, which runs all of this in a throwaway test database).
+"""
+import itertools
+import math
+import platform
+import random
+import statistics
+import time
+from datetime import time as clock
+
+import django
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .availability import day_masks, encode_availability
+from .conflicts import ConflictIndex, find_conflicts_in_db
+from .loads import MAX_UNITS, rebuild_loads
+from .models import Building, Campus, InstructorCourse, InstructorData, Program, ProgramSchedule, Room, Schedule
+from .search import BUILDERS
+from .slot_occupancy import find_conflicts_in_slots, rebuild_occupancy
+from .solver import ClassRequest, Instructor, RoomSlot, TimetableSolver
+from .utilization import rebuild_summaries
+from .versioning import bump_version
+
+
+SIZES = {
+    'tiny': {'instructors': 40, 'courses': 120, 'rooms': 20, 'schedules': 400},
+    'small': {'instructors': 200, 'courses': 1000, 'rooms': 100, 'schedules': 4000},
+    'university': {'instructors': 1000, 'courses': 5000, 'rooms': 500, 'schedules': 20000},
+}
+
+SEMESTER = '1'
+YEAR_LEVELS = ('1', '2', '3', '4')
+# Three-unit classes meeting an hour three times a week, on an hourly grid
+CREDIT_HOURS = 3
+PATTERNS = (('Monday', 'Wednesday', 'Friday'), ('Tuesday', 'Thursday', 'Saturday'))
+STARTS = tuple(range(7 * 60, 19 * 60 + 1, 60))  # 07:00 .. 19:00
+MEETING_MINUTES = 60
+
+FIRST_NAMES = (
+    'Juan', 'Maria', 'Jose', 'Ana', 'Pedro', 'Rosa', 'Carlos', 'Elena', 'Miguel', 'Carmen', 'Luis', 'Teresa',
+    'Ramon', 'Gloria', 'Antonio', 'Lourdes', 'Manuel', 'Cristina', 'Roberto', 'Isabel', 'Fernando', 'Patricia',
+    'Ricardo', 'Angelica', 'Eduardo', 'Victoria', 'Francisco', 'Beatriz', 'Alfredo', 'Josefina', 'Rafael', 'Liza',
+    'Ernesto', 'Marites', 'Andres', 'Rowena', 'Danilo', 'Corazon', 'Rogelio', 'Imelda',
+)
+LAST_NAMES = (
+    'Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Gonzales', 'Bautista', 'Villanueva',
+    'Ramos', 'Aquino', 'Castillo', 'Rivera', 'Dela Cruz', 'Navarro', 'Domingo', 'Salazar', 'Mercado', 'Aguilar',
+    'Pascual', 'Castro', 'Soriano', 'Francisco', 'Manalo', 'Lopez', 'Fernandez', 'Sison', 'Tolentino', 'Valdez',
+)
+DEPARTMENTS = ('IT', 'CS', 'IS', 'EE', 'ME', 'CE', 'MATH', 'PHYS', 'CHEM', 'ENG', 'FIL', 'HIST', 'ECON', 'ACC', 'MGT')
+PROGRAMS = (
+    ('BSIT', 'Bachelor of Science in Information Technology'), ('BSCS', 'Bachelor of Science in Computer Science'),
+    ('BSIS', 'Bachelor of Science in Information Systems'), ('BSEE', 'Bachelor of Science in Electrical Engineering'),
+    ('BSME', 'Bachelor of Science in Mechanical Engineering'), ('BSCE', 'Bachelor of Science in Civil Engineering'),
+    ('BSMATH', 'Bachelor of Science in Mathematics'), ('BSA', 'Bachelor of Science in Accountancy'),
+    ('BSBA', 'Bachelor of Science in Business Administration'), ('BSED', 'Bachelor of Secondary Education'),
+)
+ENDPOINTS = (
+    'search_instructors', 'search_instructors_listing', 'search_courses', 'search_programs', 'search_rooms',
+    'instructor_details', 'course_details', 'program_details', 'room_details', 'qualified_instructors',
+    'free_rooms', 'room_timetable', 'save_program_schedule_conflict', 'save_program_schedule',
+)
+CAMPUSES = ('Main Campus', 'North Campus', 'South Campus')
+BUILDINGS_PER_CAMPUS = 5
+
+
+def minutes_label(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+class Dataset:
+    """What generate_dataset created, and the occupancy it used to keep the timetable conflict-free."""
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.rooms = []        # (room_id, room_number, building_name, campus_name)
+        self.programs = []     # (program_id, program_code, program_name)
+        self.courses = []      # (course_id, course_code, course_name)
+        self.instructors = []  # (instructor_id, name, most classes allowed)
+        self.busy = set()      # (resource, day, start)
+        self.classes = {}      # instructor_id -> classes
+        self.saved = []        # one schedule per class: (program_schedule fields, days, start)
+        self.counts = {}
+        self.seconds = 0.0
+
+    def place(self, instructor, section_key, attempts=60):
+        """A free (room, days, start) for one class, marked busy; None when none was found."""
+        for _ in range(attempts):
+            room = self.random.choice(self.rooms)
+            days = self.random.choice(PATTERNS)
+            start = self.random.choice(STARTS)
+            resources = (('room', room[0]), ('instructor', instructor[0]), ('section', section_key))
+            keys = [(resource, day, start) for resource in resources for day in days]
+            if self.busy.isdisjoint(keys):
+                self.busy.update(keys)
+                self.classes[instructor[0]] = self.classes.get(instructor[0], 0) + 1
+                return room, days, start
+        return None
+
+    def new_class(self):
+        """
+        POST data for a class that conflicts with nothing saved and keeps its
+        instructor within their load limit, on a section of its own. The slot is
+        marked busy, so repeated calls never collide.
+        """
+        program = self.random.choice(self.programs)
+        section = f'Z{len(self.saved)}'
+        for instructor in self.random.sample(self.instructors, len(self.instructors)):
+            if self.classes.get(instructor[0], 0) >= instructor[2]:
+                continue
+            placed = self.place(instructor, (program[0], '1', section))
+            if placed is not None:
+                room, days, start = placed
+                data = self.post_data(instructor, self.random.choice(self.courses), program, room, '1', section,
+                                      days, start)
+                self.saved.append((data, days, start))
+                return data
+        raise ValueError('No free slot left for a new class.')
+
+    def conflicting_class(self):
+        """POST data for a class in a room and time already taken."""
+        data, days, start = self.random.choice(self.saved)
+        instructor = self.random.choice(self.instructors)
+        return {**data, 'instructor_name': instructor[1], 'instructor_id': str(instructor[0]), 'section': 'CONFLICT'}
+
+    @staticmethod
+    def post_data(instructor, course, program, room, year_level, section, days, start):
+        data = {
+            'instructor_name': instructor[1], 'instructor_id': str(instructor[0]),
+            'course_code': course[1], 'course_name': course[2], 'course_id': str(course[0]),
+            'credit_hours': str(CREDIT_HOURS), 'semester': SEMESTER,
+            'program_name': program[2], 'program_code': program[1], 'program_id': str(program[0]),
+            'room_number': room[1], 'room_type': 'Lecture', 'room_id': str(room[0]),
+            'building_name': room[2], 'campus_name': room[3],
+            'year_level': year_level, 'section': section, 'shift': 'Day',
+        }
+        for position, day in enumerate(days):
+            data[f'schedules[{position}][day]'] = day
+            data[f'schedules[{position}][start_time]'] = minutes_label(start)
+            data[f'schedules[{position}][end_time]'] = minutes_label(start + MEETING_MINUTES)
+        return data
+
+
+def generate_dataset(instructors, courses, rooms, schedules, seed=0, batch_size=2000):
+    """
+    Fill an empty database with a synthetic university and return its Dataset.
+
+    About `schedules` Schedule rows are created (three meetings per class),
+    with no room, instructor or section double-booked and no instructor over
+    their MAX_UNITS. Primary keys are assigned here, so bulk inserts work the
+    same on every backend.
+    """
+    if ProgramSchedule.objects.exists() or InstructorData.objects.exists():
+        raise ValueError('generate_dataset needs an empty database.')
+    started = time.perf_counter()
+    dataset = Dataset(seed)
+    rng = dataset.random
+
+    campuses = [Campus(campus_id=n, campus_name=name, address=f'{name} Road') for n, name in enumerate(CAMPUSES, 1)]
+    Campus.objects.bulk_create(campuses)
+    buildings = [
+        Building(building_id=(campus.campus_id - 1) * BUILDINGS_PER_CAMPUS + n,
+                 campus=campus, building_name=f'{campus.campus_name.split()[0]} Building {n}')
+        for campus in campuses for n in range(1, BUILDINGS_PER_CAMPUS + 1)
+    ]
+    Building.objects.bulk_create(buildings)
+
+    room_days, room_times = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'], ['07:00-21:00']
+    room_mask = encode_availability(room_days, room_times)
+    room_rows = []
+    for room_id in range(1, rooms + 1):
+        building = buildings[(room_id - 1) % len(buildings)]
+        number = f"{'ML' if room_id % 5 == 0 else 'LR'} {100 + room_id}"
+        room_rows.append(Room(
+            room_id=room_id, building=building, campus_id=building.campus_id, room_number=number,
+            room_type='Laboratory' if room_id % 5 == 0 else 'Lecture',
+            availability_days=room_days, availability_times=room_times, availability_mask=room_mask,
+        ))
+        dataset.rooms.append((room_id, number, building.building_name, CAMPUSES[building.campus_id - 1]))
+    Room.objects.bulk_create(room_rows, batch_size=batch_size)
+
+    Program.objects.bulk_create([
+        Program(program_id=n, college_id=1, program_code=code, program_name=name)
+        for n, (code, name) in enumerate(PROGRAMS, 1)
+    ])
+    dataset.programs = [(n, code, name) for n, (code, name) in enumerate(PROGRAMS, 1)]
+
+    course_rows = []
+    for course_id in range(1, courses + 1):
+        department = DEPARTMENTS[(course_id - 1) % len(DEPARTMENTS)]
+        code = f'{department} {100 + (course_id - 1) // len(DEPARTMENTS)}'
+        name = f"{rng.choice(('Introduction to', 'Advanced', 'Principles of', 'Topics in'))} {department} {course_id}"
+        course_rows.append(InstructorCourse(
+            course_id=course_id, program_id=(course_id - 1) % len(PROGRAMS) + 1, course_code=code,
+            course_name=name, department=department, credit_hours=CREDIT_HOURS, semester=(course_id - 1) % 2 + 1,
+        ))
+        dataset.courses.append((course_id, code, name))
+    InstructorCourse.objects.bulk_create(course_rows, batch_size=batch_size)
+
+    names = list(itertools.product(FIRST_NAMES, LAST_NAMES))
+    rng.shuffle(names)
+    instructor_rows = []
+    for instructor_id in range(1, instructors + 1):
+        first_name, last_name = names[(instructor_id - 1) % len(names)]
+        if instructor_id > len(names):  # keep names unique past the name lists
+            last_name = f'{last_name} {instructor_id // len(names) + 1}'
+        employment_type = 'cos' if instructor_id % 4 == 0 else 'regular'
+        qualified = sorted({course[1] for course in rng.sample(dataset.courses, min(12, len(dataset.courses)))})
+        instructor_rows.append(InstructorData(
+            instructor_id=instructor_id, college_id=1, first_name=first_name, last_name=last_name,
+            employment_type=employment_type, qualified_course=qualified,
+        ))
+        most_classes = MAX_UNITS[employment_type] // CREDIT_HOURS
+        dataset.instructors.append((instructor_id, f'{first_name} {last_name}', most_classes))
+    InstructorData.objects.bulk_create(instructor_rows, batch_size=batch_size)
+
+    # Classes section by section, each with the next instructor of a shuffled pool
+    # holding every instructor once per class they may still teach
+    program_schedules, meetings = [], []
+    wanted = schedules // len(PATTERNS[0])
+    instructor_pool = [instructor for instructor in dataset.instructors for _ in range(instructor[2])]
+    rng.shuffle(instructor_pool)
+    section_keys = itertools.cycle(
+        (program, year_level, chr(ord('A') + n))
+        for n in range(26) for program in dataset.programs for year_level in YEAR_LEVELS
+    )
+    failures = 0
+    while len(program_schedules) < wanted and instructor_pool and failures <= wanted:
+        program, year_level, section = next(section_keys)
+        instructor = instructor_pool.pop()
+        slot = dataset.place(instructor, (program[0], year_level, section))
+        if slot is None:
+            # Try the instructor again later with another section
+            failures += 1
+            instructor_pool.insert(0, instructor)
+            continue
+        room, days, start = slot
+        course = rng.choice(dataset.courses)
+        program_schedule_id = len(program_schedules) + 1
+        program_schedules.append(ProgramSchedule(
+            id=program_schedule_id,
+            instructor_id=instructor[0], course_id=course[0], program_id=program[0], room_id=room[0],
+            instructor_name=instructor[1], course_code=course[1], course_name=course[2], credit_hours=CREDIT_HOURS,
+            semester=SEMESTER, program_name=program[2], program_code=program[1],
+            room_number=room[1], room_type='Lecture', building_name=room[2], campus_name=room[3],
+            year_level=year_level, section=section, shift='Day',
+        ))
+        for day in days:
+            meetings.append(Schedule(
+                id=len(meetings) + 1, program_schedule_id=program_schedule_id, day=day,
+                start_time=clock(start // 60, start % 60),
+                end_time=clock((start + MEETING_MINUTES) // 60, (start + MEETING_MINUTES) % 60),
+            ))
+        dataset.saved.append((
+            Dataset.post_data(instructor, course, program, room, year_level, section, days, start), days, start,
+        ))
+    ProgramSchedule.objects.bulk_create(program_schedules, batch_size=batch_size)
+    Schedule.objects.bulk_create(meetings, batch_size=batch_size)
+
+    # bulk_create skips signals: rebuild what saves keep current
+    rebuild_summaries()
+    rebuild_loads()
+    rebuild_occupancy()
+    for name in ('schedule', 'room', 'instructor', 'course', 'program'):
+        bump_version(name)
+
+    dataset.counts = {
+        'campuses': len(campuses), 'buildings': len(buildings), 'rooms': rooms, 'programs': len(PROGRAMS),
+        'courses': courses, 'instructors': instructors,
+        'program_schedules': len(program_schedules), 'schedules': len(meetings),
+    }
+    dataset.seconds = time.perf_counter() - started
+    return dataset
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(seconds, queries):
+    seconds = sorted(seconds)
+    return {
+        'runs': len(seconds),
+        'mean_ms': round(statistics.fmean(seconds) * 1000, 3),
+        'p50_ms': round(percentile(seconds, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(seconds, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(seconds, 0.99) * 1000, 3),
+        'max_ms': round(seconds[-1] * 1000, 3),
+        'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def time_calls(call, iterations, warmup=3):
+    """Latency and query count of `call()` over `iterations` runs, after `warmup` untimed ones."""
+    for _ in range(warmup):
+        call()
+    seconds, queries = [], []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            call()
+            seconds.append(time.perf_counter() - started)
+        queries.append(len(captured))
+    return summarize(seconds, queries)
+
+
+def endpoint_cases(dataset, client):
+    """{name in ENDPOINTS: zero-argument callable issuing one request}, each drawing fresh random parameters."""
+    rng = dataset.random
+    xhr = {'X-Requested-With': 'XMLHttpRequest'}
+
+    def get(name, params, headers=None):
+        response = client.get(reverse(name), params, headers=headers)
+        if response.status_code >= 400:
+            raise AssertionError(f'{name} returned {response.status_code}: {response.content[:200]!r}')
+        return response
+
+    def post(name, data, conflict):
+        response = client.post(reverse(name), data)
+        if response.status_code >= 400 or response.json().get('conflict', False) != conflict:
+            raise AssertionError(f'{name} returned {response.status_code}: {response.content[:200]!r}')
+        return response
+
+    def some(items):
+        return rng.choice(items)
+
+    def qualified():
+        data, days, start = some(dataset.saved)
+        return get('qualified_instructors', {
+            'course_id': data['course_id'], 'day': days[0], 'semester': SEMESTER,
+            'start': minutes_label(start), 'end': minutes_label(start + MEETING_MINUTES),
+        })
+
+    def free_rooms():
+        start = some(STARTS)
+        return get('free_rooms', {
+            'day': some(PATTERNS)[0], 'start': minutes_label(start), 'end': minutes_label(start + MEETING_MINUTES),
+        })
+
+    return {
+        'search_instructors': lambda: get('search_instructors', {'q': some(dataset.instructors)[1].split()[-1][:5]}, xhr),
+        'search_instructors_listing': lambda: get('search_instructors', {}, xhr),
+        'search_courses': lambda: get('search_courses', {'q': some(dataset.courses)[1]}),
+        'search_programs': lambda: get('search_programs', {'q': some(dataset.programs)[2].split()[-1]}),
+        'search_rooms': lambda: get('search_rooms', {'q': some(dataset.rooms)[1]}),
+        'instructor_details': lambda: get('instructor_details', {'id': some(dataset.instructors)[0]}),
+        'course_details': lambda: get('course_details', {'id': some(dataset.courses)[0]}),
+        'program_details': lambda: get('program_details', {'program_id': some(dataset.programs)[0]}),
+        'room_details': lambda: get('room_details', {'room_id': some(dataset.rooms)[0]}),
+        'qualified_instructors': qualified,
+        'free_rooms': free_rooms,
+        'room_timetable': lambda: get('room_timetable', {'room_id': some(dataset.rooms)[0], 'semester': SEMESTER}),
+        'save_program_schedule_conflict': lambda: post('save_program_schedule', dataset.conflicting_class(), True),
+        'save_program_schedule': lambda: post('save_program_schedule', dataset.new_class(), False),
+    }
+
+
+def benchmark_endpoints(dataset, iterations, only=None):
+    client = Client()
+    results = {}
+    for name, call in endpoint_cases(dataset, client).items():
+        if only and name not in only:
+            continue
+        results[name] = time_calls(call, iterations)
+    return results
+
+
+def benchmark_conflicts(dataset, iterations):
+    """find_conflicts_in_db, slot_occupancy and ConflictIndex for the same random class checks."""
+    checks = []
+    for _ in range(iterations):
+        data, days, start = dataset.random.choice(dataset.saved)
+        slots = [(day, clock(start // 60, start % 60),
+                  clock((start + MEETING_MINUTES) // 60, (start + MEETING_MINUTES) % 60)) for day in days]
+        resources = {
+            'instructor_name': data['instructor_name'], 'room_number': data['room_number'],
+            'program_name': data['program_name'], 'section': data['section'], 'year_level': data['year_level'],
+            'shift': data['shift'], 'instructor_id': int(data['instructor_id']), 'room_id': int(data['room_id']),
+            'program_id': int(data['program_id']),
+        }
+        checks.append((slots, resources))
+
+    started = time.perf_counter()
+    index = ConflictIndex()
+    index.load()
+    load_seconds = time.perf_counter() - started
+
+    results = {'conflict_index_load_ms': round(load_seconds * 1000, 3)}
+    engines = (
+        ('find_conflicts_in_db', find_conflicts_in_db),
+        ('slot_occupancy', find_conflicts_in_slots),
+        ('conflict_index', index.find_conflicts),
+    )
+    for name, find in engines:
+        def check(find=find, cycle=itertools.cycle(checks)):
+            slots, resources = next(cycle)
+            return find(slots, **resources)
+        results[name] = time_calls(check, iterations)
+    return results
+
+
+def benchmark_search_builds():
+    results = {}
+    for name, build in BUILDERS.items():
+        started = time.perf_counter()
+        build(0)
+        results[f'{name}_index_build_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return results
+
+
+def benchmark_solver(classes=120, rooms=12, instructors=20, seed=0, time_limit=30.0):
+    """Place `classes` synthetic classes from scratch with TimetableSolver, in memory."""
+    rng = random.Random(seed)
+    everyday = day_masks([], [])
+    codes = [f'{DEPARTMENTS[n % len(DEPARTMENTS)]} {100 + n}' for n in range(classes)]
+    instructor_list = [
+        Instructor(n, f'Instructor {n}', set(rng.sample(codes, min(len(codes), classes // 4 or 1))), everyday)
+        for n in range(instructors)
+    ]
+    # Every class has at least two qualified instructors
+    for position, code in enumerate(codes):
+        instructor_list[position % instructors].qualified.add(code)
+        instructor_list[(position + 1) % instructors].qualified.add(code)
+    room_list = [RoomSlot(n, f'R{n}', 'Lecture', everyday) for n in range(rooms)]
+    requests = [
+        ClassRequest(code, code, code, 3, section_key=(1, str(position % 4 + 1), chr(ord('A') + position // 40), 'Day'))
+        for position, code in enumerate(codes)
+    ]
+    solver = TimetableSolver(requests, instructor_list, room_list)
+    result = solver.solve(time_limit=time_limit)
+    return {
+        'classes': classes,
+        'placed': len(result.placements),
+        'unplaced': len(result.unplaced),
+        'seconds': round(result.elapsed, 4),
+        'timed_out': result.timed_out,
+        'nodes': result.nodes,
+        'backtracks': result.backtracks,
+        'objective': result.objective,
+    }
+
+
+def run_benchmarks(dataset, iterations=100, only=None, solver_classes=120):
+    """Every benchmark against the data of `dataset`, as one JSON-serializable dict."""
+    results = {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'iterations': iterations,
+        },
+        'dataset': {**dataset.counts, 'generate_seconds': round(dataset.seconds, 3)},
+        'search_index': benchmark_search_builds(),
+        'endpoints': benchmark_endpoints(dataset, iterations, only),
+        'conflicts': benchmark_conflicts(dataset, iterations),
+    }
+    if solver_classes:
+        results['solver'] = benchmark_solver(classes=solver_classes)
+    return results
+
+
+def compare_results(baseline, current, metric='p50_ms'):
+    """
+    (name, baseline, current, change) rows for every endpoint and conflict
+    engine in both runs; change is the relative difference (+0.1 = 10% slower).
+    """
+    rows = []
+    for section in ('endpoints', 'conflicts'):
+        for name, stats in current.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if not isinstance(stats, dict) or not isinstance(before, dict) or not before.get(metric):
+                continue
+            rows.append((f'{section}.{name}', before[metric], stats[metric], stats[metric] / before[metric] - 1))
+    return rows
@@ -0,0 +1,302 @@
+"""
+Conflict detection for program schedules.
+
+A resource is an instructor, a room or a program section (program, section,
+year level, shift). Two lookups are provided:
+
+* find_conflicts_in_db checks every submitted slot in a single SQL query over
+  program_schedule, with no helper table to keep in step.
+* ConflictIndex keeps one sorted interval list per (resource, day) in memory,
+  where K slots cost K binary searches: the sandbox's overlay of proposed moves.
+
+Saves check against slot_occupancy instead (see slot_occupancy.py); both
+lookups here are also measured against it by benchmarks.py.
+"""
+import bisect
+import threading
+
+from django.db.models import Q
+
+from .models import Schedule
+
+
+# Same shape as the conflict details returned by save_program_schedule
+CONFLICT_FIELDS = (
+    'program_schedule__instructor_name',
+    'program_schedule__course_code',
+    'program_schedule__room_number',
+    'program_schedule__program_name',
+    'program_schedule__section',
+    'program_schedule__year_level',
+    'program_schedule__shift',
+    'day',
+    'start_time',
+    'end_time',
+)
+
+
+def to_minutes(value):
+    """Minutes since midnight for a datetime.time."""
+    return value.hour * 60 + value.minute
+
+
+# Extra columns the in-memory index needs to key rows by their references
+REFERENCE_FIELDS = (
+    'program_schedule__instructor_id',
+    'program_schedule__room_id',
+    'program_schedule__program_id',
+)
+
+
+def resource_keys(instructor_name=None, room_number=None, program_name=None, section=None, year_level=None,
+                  shift=None, instructor_id=None, room_id=None, program_id=None):
+    """
+    Keys of every resource a schedule entry occupies.
+
+    Linked rows are keyed by both their foreign key and their text snapshot, so a
+    renamed instructor or room still collides with entries saved under the old name.
+    """
+    keys = []
+    if instructor_id:
+        keys.append(('instructor_id', instructor_id))
+    if instructor_name:
+        keys.append(('instructor', instructor_name))
+    if room_id:
+        keys.append(('room_id', room_id))
+    if room_number:
+        keys.append(('room', room_number))
+    if None not in (section, year_level, shift):
+        if program_id:
+            keys.append(('section_id', (program_id, section, year_level, shift)))
+        if program_name is not None:
+            keys.append(('section', (program_name, section, year_level, shift)))
+    return keys
+
+
+def slot_overlaps(slot, day, start_time, end_time):
+    return slot[0] == day and slot[1] < end_time and slot[2] > start_time
+
+
+def conflict_query(slots, instructor_name=None, room_number=None, program_name=None, section=None,
+                   year_level=None, shift=None, instructor_id=None, room_id=None, program_id=None):
+    """The saved entries that may overlap `slots`, as a .values() queryset; None when nothing to check."""
+    resource_filter = Q()
+    for kind, value in resource_keys(instructor_name, room_number, program_name, section, year_level, shift,
+                                     instructor_id, room_id, program_id):
+        if kind == 'instructor_id':
+            resource_filter |= Q(program_schedule__instructor_id=value)
+        elif kind == 'instructor':
+            resource_filter |= Q(program_schedule__instructor_name=value)
+        elif kind == 'room_id':
+            resource_filter |= Q(program_schedule__room_id=value)
+        elif kind == 'room':
+            resource_filter |= Q(program_schedule__room_number=value)
+        else:
+            program_field = 'program_schedule__program_id' if kind == 'section_id' else 'program_schedule__program_name'
+            resource_filter |= Q(**{
+                program_field: value[0],
+                'program_schedule__section': value[1],
+                'program_schedule__year_level': value[2],
+                'program_schedule__shift': value[3],
+            })
+    if not resource_filter or not slots:
+        return None
+
+    slot_filter = Q()
+    for day, start_time, end_time in slots:
+        slot_filter |= Q(day=day, start_time__lt=end_time, end_time__gt=start_time)
+
+    return Schedule.objects.filter(resource_filter, slot_filter).order_by('day', 'start_time').values(
+        *CONFLICT_FIELDS, *REFERENCE_FIELDS
+    )
+
+
+def group_conflicts(slots, rows):
+    """Group the matches back onto the slots they overlap."""
+    conflicts = []
+    for position, slot in enumerate(slots):
+        for row in rows:
+            if slot_overlaps(slot, row['day'], row['start_time'], row['end_time']):
+                conflicts.append({**row, 'slot': position})
+    return conflicts
+
+
+def find_conflicts_in_db(slots, **resources):
+    """
+    Return the saved entries overlapping any of `slots`, in one query.
+
+    `slots` is a list of (day, start_time, end_time) tuples and `resources`
+    the keyword arguments of resource_keys. Each result row is keyed like
+    CONFLICT_FIELDS plus 'slot', the index of the submitted slot it clashes
+    with; a row overlapping several slots is reported once per slot.
+    """
+    rows = conflict_query(slots, **resources)
+    if rows is None:
+        return []
+    return group_conflicts(slots, list(rows))
+
+
+def label_conflicts(conflicts, instructor_name=None, room_number=None, program_name=None, section=None,
+                    year_level=None, shift=None, instructor_id=None, room_id=None, program_id=None):
+    """Add the conflict_field/conflict_message pair the conflict modal displays."""
+    for conflict in conflicts:
+        if (conflict['program_schedule__instructor_name'] == instructor_name
+                or (instructor_id and conflict['program_schedule__instructor_id'] == instructor_id)):
+            conflict['conflict_field'] = 'instructor_name'
+            conflict['conflict_message'] = "Instructor's schedule is already booked."
+        elif (conflict['program_schedule__room_number'] == room_number
+                or (room_id and conflict['program_schedule__room_id'] == room_id)):
+            conflict['conflict_field'] = 'room_number'
+            conflict['conflict_message'] = "Room schedule is already booked."
+        elif (
+            (conflict['program_schedule__program_name'] == program_name
+                or (program_id and conflict['program_schedule__program_id'] == program_id)) and
+            conflict['program_schedule__section'] == section and
+            conflict['program_schedule__year_level'] == year_level and
+            conflict['program_schedule__shift'] == shift
+        ):
+            conflict['conflict_field'] = 'program_section_year_shift'
+            conflict['conflict_message'] = "Program, section, year level, or shift schedule is already booked."
+    return conflicts
+
+
+def row_resource_keys(row):
+    return resource_keys(
+        row['program_schedule__instructor_name'],
+        row['program_schedule__room_number'],
+        row['program_schedule__program_name'],
+        row['program_schedule__section'],
+        row['program_schedule__year_level'],
+        row['program_schedule__shift'],
+        row['program_schedule__instructor_id'],
+        row['program_schedule__room_id'],
+        row['program_schedule__program_id'],
+    )
+
+
+class IntervalIndex:
+    """Intervals of a single resource on a single day, sorted by start."""
+
+    __slots__ = ('starts', 'entries', 'max_length')
+
+    def __init__(self):
+        self.starts = []
+        self.entries = []
+        self.max_length = 0
+
+    def add(self, start, end, schedule_id):
+        position = bisect.bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.entries.insert(position, (start, end, schedule_id))
+        self.max_length = max(self.max_length, end - start)
+
+    def remove(self, schedule_id):
+        """
+        Drop one interval. max_length is never shrunk: it stays an upper bound,
+        so overlapping() remains correct and at worst walks further left.
+        """
+        for position, entry in enumerate(self.entries):
+            if entry[2] == schedule_id:
+                del self.starts[position]
+                del self.entries[position]
+                return
+
+    def overlapping(self, start, end):
+        """Yield ids of intervals with entry.start < end and entry.end > start."""
+        # Everything right of `position` starts at or after `end`. Walking left,
+        # no interval starting before `start - max_length` can still be running.
+        position = bisect.bisect_left(self.starts, end) - 1
+        while position >= 0 and self.starts[position] + self.max_length > start:
+            entry = self.entries[position]
+            if entry[1] > start:
+                yield entry[2]
+            position -= 1
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ConflictIndex:
+    """
+    Per-day interval indexes over Schedule rows, loaded from the database or
+    added one by one (a sandbox's proposed meetings).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._buckets = {}
+        self._rows = {}
+
+    def load(self):
+        """(Re)build the index from the database in a single query."""
+        with self._lock:
+            self._buckets = {}
+            self._rows = {}
+            for row in Schedule.objects.order_by('id').values(
+                'id', 'program_schedule_id', *CONFLICT_FIELDS, *REFERENCE_FIELDS,
+            ):
+                self.add_row(row)
+
+    def add_row(self, row):
+        with self._lock:
+            schedule_id = row['id']
+            if schedule_id in self._rows:
+                return
+            self._rows[schedule_id] = row
+            start, end = to_minutes(row['start_time']), to_minutes(row['end_time'])
+            for key in row_resource_keys(row):
+                bucket = self._buckets.get((key, row['day']))
+                if bucket is None:
+                    bucket = self._buckets[(key, row['day'])] = IntervalIndex()
+                bucket.add(start, end, schedule_id)
+
+    def discard(self, schedule_id):
+        with self._lock:
+            row = self._rows.pop(schedule_id, None)
+            if row is None:
+                return
+            for key in row_resource_keys(row):
+                bucket = self._buckets.get((key, row['day']))
+                if bucket is not None:
+                    bucket.remove(schedule_id)
+                    if not bucket:
+                        del self._buckets[(key, row['day'])]
+
+    def discard_entry(self, program_schedule_id):
+        """Drop every row of one ProgramSchedule."""
+        with self._lock:
+            for schedule_id in [
+                schedule_id for schedule_id, row in self._rows.items()
+                if row['program_schedule_id'] == program_schedule_id
+            ]:
+                self.discard(schedule_id)
+
+    def find_conflicts(self, slots, exclude=(), **resources):
+        """
+        Return the indexed entries overlapping any of `slots`, leaving out
+        the rows of the ProgramSchedule ids in `exclude`.
+
+        Same contract as find_conflicts_in_db, answered from memory.
+        """
+        keys = resource_keys(**resources)
+        conflicts = []
+        with self._lock:
+            for position, (day, start_time, end_time) in enumerate(slots):
+                start, end = to_minutes(start_time), to_minutes(end_time)
+                found = set()
+                for key in keys:
+                    bucket = self._buckets.get((key, day))
+                    if bucket is not None:
+                        found.update(bucket.overlapping(start, end))
+                for schedule_id in sorted(found):
+                    row = self._rows[schedule_id]
+                    if row['program_schedule_id'] in exclude:
+                        continue
+                    conflicts.append({
+                        **{field: row[field] for field in CONFLICT_FIELDS + REFERENCE_FIELDS},
+                        'slot': position,
+                    })
+        return conflicts
+
+    def __len__(self):
+        return len(self._rows)
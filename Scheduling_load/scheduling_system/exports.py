@@ -0,0 +1,157 @@
+"""
+Term timetable exports: CSV, XLSX and iCalendar.
+
+Every format reads one Schedule query joined to ProgramSchedule through
+.iterator(), and CSV and iCalendar are produced line by line, so memory
+stays flat however large the term is. XLSX is written with openpyxl's
+write-only workbook (rows are flushed as they are appended) into a
+temporary file that is then streamed.
+"""
+import csv
+import tempfile
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .availability import VALID_DAYS
+from .models import Schedule
+
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover - only needed for XLSX exports
+    openpyxl = None
+
+
+CHUNK_SIZE = 2000
+
+# Header -> Schedule column
+EXPORT_COLUMNS = {
+    'instructor_name': 'program_schedule__instructor_name',
+    'course_code': 'program_schedule__course_code',
+    'course_name': 'program_schedule__course_name',
+    'credit_hours': 'program_schedule__credit_hours',
+    'semester': 'program_schedule__semester',
+    'program_code': 'program_schedule__program_code',
+    'program_name': 'program_schedule__program_name',
+    'year_level': 'program_schedule__year_level',
+    'section': 'program_schedule__section',
+    'shift': 'program_schedule__shift',
+    'room_number': 'program_schedule__room_number',
+    'room_type': 'program_schedule__room_type',
+    'building_name': 'program_schedule__building_name',
+    'campus_name': 'program_schedule__campus_name',
+    'day': 'day',
+    'start_time': 'start_time',
+    'end_time': 'end_time',
+}
+
+DEFAULT_TERM_WEEKS = 18
+
+
+def export_rows(semester=None, instructor_id=None, room_id=None, program_id=None):
+    """Tuples in EXPORT_COLUMNS order, streamed from the database."""
+    lookups = {
+        'program_schedule__semester': semester,
+        'program_schedule__instructor_id': instructor_id,
+        'program_schedule__room_id': room_id,
+        'program_schedule__program_id': program_id,
+    }
+    schedules = Schedule.objects.filter(**{key: value for key, value in lookups.items() if value is not None})
+    schedules = schedules.values_list('id', *EXPORT_COLUMNS.values()).order_by('program_schedule_id', 'id')
+    return schedules.iterator(chunk_size=CHUNK_SIZE)
+
+
+class Echo:
+    """File-like object whose write() hands the line back, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(list(EXPORT_COLUMNS))
+    for row in rows:
+        yield writer.writerow(row[1:])
+
+
+def write_xlsx(rows, handle):
+    """Write rows into `handle` (a path or binary file) with a write-only workbook."""
+    if openpyxl is None:
+        raise ValueError("XLSX export requires openpyxl (pip install openpyxl).")
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Timetable')
+    sheet.append(list(EXPORT_COLUMNS))
+    for row in rows:
+        sheet.append([value.strftime('%H:%M') if hasattr(value, 'strftime') else value for value in row[1:]])
+    workbook.save(handle)
+
+
+def xlsx_file(rows):
+    """A temporary file holding the XLSX export, rewound for reading; deleted when closed."""
+    handle = tempfile.TemporaryFile()
+    write_xlsx(rows, handle)
+    handle.seek(0)
+    return handle
+
+
+# iCalendar
+
+def ics_escape(value):
+    return str(value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def ics_fold(line):
+    """Split a content line into 75-octet pieces as RFC 5545 requires."""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    pieces, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # Do not cut a multi-byte character in half
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        pieces.append(data[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def first_meeting(term_start, day):
+    """Date of the first `day` on or after `term_start`."""
+    return term_start + timedelta(days=(VALID_DAYS.index(day) - term_start.weekday()) % 7)
+
+
+def ics_lines(rows, term_start, weeks=DEFAULT_TERM_WEEKS, name='Timetable'):
+    """
+    A VCALENDAR with one weekly recurring VEVENT per meeting, from the first
+    matching weekday on or after `term_start` for `weeks` weeks. Times are
+    floating (the campus' local time).
+    """
+    columns = list(EXPORT_COLUMNS)
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
+    yield from map(ics_fold, (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Scheduling Load//Timetable//EN',
+        'CALSCALE:GREGORIAN', f'X-WR-CALNAME:{ics_escape(name)}',
+    ))
+    for row in rows:
+        schedule_id, data = row[0], dict(zip(columns, row[1:]))
+        if data['day'] not in VALID_DAYS:
+            continue
+        date = first_meeting(term_start, data['day'])
+        start = datetime.combine(date, data['start_time'])
+        end = datetime.combine(date, data['end_time'])
+        summary = f"{data['course_code']} {data['program_code']} {data['year_level']}-{data['section']}"
+        yield from map(ics_fold, (
+            'BEGIN:VEVENT',
+            f'UID:schedule-{schedule_id}@scheduling-load',
+            f'DTSTAMP:{stamp}',
+            f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}",
+            f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}",
+            f'RRULE:FREQ=WEEKLY;COUNT={weeks}',
+            f'SUMMARY:{ics_escape(summary)}',
+            f"DESCRIPTION:{ics_escape(data['course_name'])}\\n{ics_escape(data['instructor_name'])}",
+            f"LOCATION:{ics_escape(' '.join(filter(None, (data['room_number'], data['building_name'], data['campus_name']))))}",
+            'END:VEVENT',
+        ))
+    yield ics_fold('END:VCALENDAR')
@@ -0,0 +1,498 @@
+"""
+Bulk import of instructors, courses, rooms and schedules from CSV or XLSX.
+
+Files are read one row at a time (XLSX through openpyxl's read-only mode)
+and written in chunks of `batch_size` rows with bulk_create, or bulk_update
+for rows whose primary key already exists. Rows that fail validation are
+reported with their line number and skipped; the rest of the file still
+imports.
+
+Schedules are one row per meeting. Rows describing the same class (same
+instructor, course, semester, program section and room) are grouped into
+one ProgramSchedule, `batch_size` classes at a time; a meeting listed after
+its class was written is added to it with a later chunk. Each chunk is
+checked and written under the locks of the resources it books (locks.py):
+against slot_occupancy, which holds the saved timetable and the chunks
+before it, and against the classes of the chunk itself on the same 15-minute
+grid (slot_occupancy.PendingSlots). A clashing class is reported and
+skipped, and nothing saved while the file imports can be double-booked.
+Memory stays flat apart from the key and id of each class written (and, in
+a dry run, which writes nothing, the bookings of the whole file).
+"""
+import csv
+import json
+from datetime import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Max
+
+from .availability import encode_availability, parse_day, parse_minutes
+from .conflicts import label_conflicts, resource_keys
+from .loads import rebuild_loads
+from .locks import locked
+from .models import Building, Campus, InstructorCourse, InstructorData, ProgramSchedule, Room, Schedule
+from .references import ReferenceMaps
+from .slot_occupancy import PendingSlots, find_batch_conflicts, occupy, schedule_resources
+from .utilization import rebuild_summaries
+from .versioning import bump_version_on_commit
+
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover - only needed for .xlsx files
+    openpyxl = None
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def read_rows(path, file_format=None):
+    """Yield (line number, {column: value}) for each data row of a CSV or XLSX file."""
+    file_format = file_format or ('xlsx' if str(path).lower().endswith('.xlsx') else 'csv')
+    if file_format == 'xlsx':
+        if openpyxl is None:
+            raise ValueError("Reading .xlsx files requires openpyxl (pip install openpyxl).")
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(column or '').strip() for column in next(rows, ())]
+            for line, values in enumerate(rows, start=2):
+                if any(value not in (None, '') for value in values):
+                    yield line, {column: value for column, value in zip(header, values) if column}
+        finally:
+            workbook.close()
+        return
+
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        reader = csv.DictReader(handle)
+        reader.fieldnames = [column.strip() for column in reader.fieldnames or []]
+        for row in reader:
+            if any(row.values()):
+                yield reader.line_num, row
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def text(row, column, default=''):
+    value = row.get(column)
+    if value is None:
+        return default
+    return str(value).strip()
+
+
+def required(row, column):
+    value = text(row, column)
+    if not value:
+        raise ValueError(f"{column} is required")
+    return value
+
+
+def optional_int(row, column):
+    value = text(row, column)
+    if not value:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        raise ValueError(f"{column} must be a number, got {value!r}")
+
+
+def json_list(row, column, default=None):
+    """JSON from a cell, or a comma/semicolon separated list when it is not JSON."""
+    value = row.get(column)
+    if value in (None, ''):
+        return [] if default is None else default
+    if not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return [item.strip() for item in value.replace(';', ',').split(',') if item.strip()]
+
+
+def minute_time(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+def describe(error):
+    if isinstance(error, ValidationError) and hasattr(error, 'message_dict'):
+        return '; '.join(f"{field}: {' '.join(messages)}" for field, messages in error.message_dict.items())
+    if isinstance(error, ValidationError):
+        return ' '.join(error.messages)
+    return str(error)
+
+
+class Importer:
+    """Chunked create-or-update of one model; subclasses turn a row into an instance."""
+    model = None
+    # Resolved by the importer itself, so full_clean should not query them
+    exclude = ()
+    version = None
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.pk_name = self.model._meta.pk.attname
+        self.update_fields = [
+            field.attname for field in self.model._meta.concrete_fields if not field.primary_key
+        ]
+
+    def parse(self, row):
+        raise NotImplementedError
+
+    def run(self, rows):
+        for chunk in chunked(rows, self.batch_size):
+            self.import_chunk(chunk)
+        if self.version and not self.dry_run:
+            bump_version_on_commit(self.version)
+        return self
+
+    def clean(self, instance):
+        """full_clean without queries; empty JSON lists/dicts are valid, as the model defaults are."""
+        exclude = [
+            *self.exclude,
+            *(field.name for field in self.model._meta.concrete_fields
+              if isinstance(field, models.JSONField) and getattr(instance, field.attname) in ([], {})),
+        ]
+        instance.full_clean(exclude=exclude, validate_unique=False, validate_constraints=False)
+
+    def validated(self, chunk):
+        instances = []
+        for line, row in chunk:
+            try:
+                instance = self.parse(row)
+                self.clean(instance)
+            except (ValueError, ValidationError) as error:
+                self.errors.append((line, describe(error)))
+                continue
+            instances.append(instance)
+        return instances
+
+    def import_chunk(self, chunk):
+        instances = self.validated(chunk)
+        keys = [getattr(instance, self.pk_name) for instance in instances if getattr(instance, self.pk_name)]
+        existing = set(self.model.objects.filter(pk__in=keys).values_list('pk', flat=True)) if keys else set()
+        new = [instance for instance in instances if getattr(instance, self.pk_name) not in existing]
+        changed = [instance for instance in instances if getattr(instance, self.pk_name) in existing]
+        if not self.dry_run:
+            with transaction.atomic():
+                self.model.objects.bulk_create(new, batch_size=self.batch_size)
+                if changed:
+                    self.model.objects.bulk_update(changed, self.update_fields, batch_size=self.batch_size)
+        self.created += len(new)
+        self.updated += len(changed)
+
+
+class InstructorImporter(Importer):
+    model = InstructorData
+    version = 'instructor'
+
+    def parse(self, row):
+        instructor = InstructorData(
+            instructor_id=optional_int(row, 'instructor_id'),
+            college_id=optional_int(row, 'college_id') or 0,
+            last_name=required(row, 'last_name'),
+            first_name=required(row, 'first_name'),
+            middle_initial=text(row, 'middle_initial')[:1] or None,
+            employment_type=text(row, 'employment_type', 'regular').lower() or 'regular',
+            qualified_course=json_list(row, 'qualified_course'),
+            availability_days=json_list(row, 'availability_days'),
+            availability_times=json_list(row, 'availability_times'),
+        )
+        # bulk_create skips save(), which normally fills the mask
+        instructor.availability_mask = encode_availability(instructor.availability_days, instructor.availability_times)
+        return instructor
+
+
+class CourseImporter(Importer):
+    model = InstructorCourse
+    version = 'course'
+
+    def parse(self, row):
+        return InstructorCourse(
+            course_id=optional_int(row, 'course_id'),
+            program_id=optional_int(row, 'program_id') or 0,
+            course_code=text(row, 'course_code') or None,
+            course_name=text(row, 'course_name') or None,
+            department=text(row, 'department') or None,
+            credit_hours=optional_int(row, 'credit_hours'),
+            prerequisites=json_list(row, 'prerequisites', default=None) or None,
+            school_year=text(row, 'school_year') or None,
+            semester=optional_int(row, 'semester'),
+        )
+
+
+class RoomImporter(Importer):
+    model = Room
+    exclude = ('building', 'campus')
+    version = 'room'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.campuses = {name: campus_id for campus_id, name in Campus.objects.values_list('campus_id', 'campus_name')}
+        self.buildings = {}
+        for building_id, campus_id, name in Building.objects.values_list('building_id', 'campus_id', 'building_name'):
+            self.buildings.setdefault((campus_id, name), building_id)
+
+    def parse(self, row):
+        campus_name, building_name = text(row, 'campus_name'), text(row, 'building_name')
+        campus_id = self.campuses.get(campus_name)
+        if campus_id is None:
+            raise ValueError(f"Unknown campus {campus_name!r}")
+        building_id = self.buildings.get((campus_id, building_name))
+        if building_id is None:
+            raise ValueError(f"Unknown building {building_name!r} on {campus_name}")
+        room = Room(
+            room_id=optional_int(row, 'room_id'),
+            campus_id=campus_id,
+            building_id=building_id,
+            room_number=text(row, 'room_number'),
+            room_type=text(row, 'room_type'),
+            availability_days=json_list(row, 'availability_days'),
+            availability_times=json_list(row, 'availability_times'),
+        )
+        room.availability_mask = encode_availability(room.availability_days, room.availability_times)
+        return room
+
+
+# Columns that identify one class; its meetings are the rows sharing them
+CLASS_COLUMNS = (
+    'instructor_name', 'course_code', 'semester', 'program_name', 'program_code',
+    'year_level', 'section', 'shift', 'room_number',
+)
+
+
+class ScheduleImporter(Importer):
+    model = ProgramSchedule
+    exclude = ('instructor', 'course', 'program', 'room')
+    version = 'schedule'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.references = ReferenceMaps()
+        self.slots = {}
+        self.conflicts = 0
+        self.semesters = set()
+        # A dry run writes nothing, so its checks keep the whole file's bookings here
+        self.pending = PendingSlots()
+
+    def parse(self, row):
+        entry = ProgramSchedule(
+            instructor_name=text(row, 'instructor_name'),
+            bachelor_degree=text(row, 'bachelor_degree') or None,
+            master_degree=text(row, 'master_degree') or None,
+            course_code=text(row, 'course_code'),
+            course_name=text(row, 'course_name') or 'Untitled Course',
+            credit_hours=optional_int(row, 'credit_hours') or 0,
+            semester=text(row, 'semester'),
+            program_name=text(row, 'program_name'),
+            program_code=text(row, 'program_code'),
+            room_number=text(row, 'room_number'),
+            room_type=text(row, 'room_type'),
+            building_name=text(row, 'building_name'),
+            campus_name=text(row, 'campus_name'),
+            year_level=text(row, 'year_level'),
+            section=text(row, 'section'),
+            shift=text(row, 'shift'),
+            **self.references.resolve({column: text(row, column) for column in (
+                'instructor_id', 'course_id', 'program_id', 'room_id', 'instructor_name', 'course_code',
+                'program_name', 'program_code', 'room_number', 'building_name',
+            )}),
+        )
+        return entry
+
+    def slot(self, row):
+        # Timetables reuse a handful of meeting times; parse each only once
+        raw = (text(row, 'day'), row.get('start_time'), row.get('end_time'))
+        parsed = self.slots.get(raw)
+        if parsed is None:
+            parsed = self.slots[raw] = self.parse_slot(row)
+        return Schedule(day=parsed[0], start_time=parsed[1], end_time=parsed[2])
+
+    def parse_slot(self, row):
+        day = parse_day(text(row, 'day'))
+        if day is None:
+            raise ValueError(f"Invalid day {text(row, 'day')!r}")
+        start, end = parse_minutes(row.get('start_time')), parse_minutes(row.get('end_time'))
+        if start is None or end is None or end <= start:
+            raise ValueError(f"Invalid time range {row.get('start_time')!r}-{row.get('end_time')!r}")
+        return day, minute_time(start), minute_time(end)
+
+    def run(self, rows):
+        # Only the classes of the current chunk are held, plus the id of every
+        # class written so far, for its meetings further down the file
+        chunk = {}
+        written = {}
+        for line, row in rows:
+            key = tuple(text(row, column) for column in CLASS_COLUMNS)
+            if key in written and written[key] is None:
+                self.errors.append((line, "Not imported: the rest of this class was rejected."))
+                continue
+            try:
+                meeting = self.slot(row)
+                if key not in chunk:
+                    if len(chunk) == self.batch_size:
+                        self.import_chunk(chunk, written)
+                        chunk = {}
+                    entry = written.get(key)
+                    if entry is None:
+                        entry = self.parse(row)
+                        self.clean(entry)
+                    chunk[key] = (entry, [], [])
+            except (ValueError, ValidationError) as error:
+                self.errors.append((line, describe(error)))
+                continue
+            chunk[key][1].append(meeting)
+            chunk[key][2].append(line)
+        if chunk:
+            self.import_chunk(chunk, written)
+
+        if not self.dry_run:
+            # bulk_create bypasses the incremental totals; recount the semesters touched
+            for semester in sorted(self.semesters):
+                rebuild_summaries(semester)
+                rebuild_loads(semester)
+            bump_version_on_commit(self.version)
+        return self
+
+    def import_chunk(self, chunk, written):
+        """
+        Check and write one chunk of classes. `written` maps the key of every
+        class imported so far to its id (to the unsaved entry in a dry run) and
+        of every rejected one to None; meetings of a written class found in a
+        later chunk are added to it.
+        """
+        ids = [entry for entry, _, _ in chunk.values() if isinstance(entry, int)]
+        saved_entries = ProgramSchedule.objects.in_bulk(ids) if ids else {}
+        keys, classes = [], []
+        for key, (entry, meetings, lines) in chunk.items():
+            if isinstance(entry, int):
+                entry = saved_entries.get(entry)
+                if entry is None:
+                    self.errors += [(line, "Not imported: its class was deleted meanwhile.") for line in lines]
+                    continue
+            keys.append(key)
+            classes.append((entry, meetings, lines))
+
+        if self.dry_run:
+            accepted, rejected = self.check_chunk(classes, self.pending)
+            self.report(rejected)
+        else:
+            accepted = self.save_chunk(classes)
+        accepted = {id(entry) for entry, _, _ in accepted}
+        for key, (entry, _, _) in zip(keys, classes):
+            if key in written:
+                continue
+            if id(entry) in accepted:
+                written[key] = entry if self.dry_run else entry.pk
+                self.created += 1
+                self.semesters.add(entry.semester)
+            else:
+                written[key] = None
+
+    def check_chunk(self, chunk, pending):
+        """
+        Split a chunk into (accepted, rejected) classes: a class is rejected
+        when it clashes with slot_occupancy or, on the same 15-minute grid, with
+        the classes booked in `pending`. Accepted classes are booked in it;
+        rejected ones come as (conflicts, resources, lines), for report().
+        """
+        checks = [(meeting_slots(meetings), schedule_resources(entry), entry.course_code) for entry, meetings, _ in chunk]
+        saved_conflicts = {}
+        for conflict in find_batch_conflicts(checks):
+            saved_conflicts.setdefault(conflict.pop('class'), []).append(conflict)
+        accepted, rejected = [], []
+        for number, ((entry, meetings, lines), (slots, resources, course_code)) in enumerate(zip(chunk, checks)):
+            conflicts = saved_conflicts.get(number, []) + pending.find_conflicts(slots, resources, course_code)
+            if conflicts:
+                rejected.append((conflicts, resources, lines))
+                continue
+            pending.book(slots, resources, course_code)
+            accepted.append((entry, meetings, lines))
+        return accepted, rejected
+
+    def report(self, rejected):
+        for conflicts, resources, lines in rejected:
+            label_conflicts(conflicts, **resources)
+            self.conflicts += 1
+            for conflict in conflicts:
+                self.errors.append((lines[conflict['slot']], conflict['conflict_message']))
+
+    def save_chunk(self, chunk):
+        """
+        Write a chunk of classes and return the ones saved.
+        The check runs under the locks of their resources, so nothing saved
+        since (or by an earlier chunk) can be double-booked.
+        """
+        keys = [key for entry, _, _ in chunk for key in resource_keys(**schedule_resources(entry))]
+
+        def save():
+            accepted, rejected = self.check_chunk(chunk, PendingSlots())
+            new = [entry for entry, _, _ in accepted if entry._state.adding]
+            for entry in new:
+                # Ids handed out by an attempt that was rolled back are void
+                entry.pk = None
+            if connection.features.can_return_rows_from_bulk_insert:
+                ProgramSchedule.objects.bulk_create(new, batch_size=self.batch_size)
+            else:
+                self.insert_returning_ids(new)
+            for entry, meetings, _ in accepted:
+                for meeting in meetings:
+                    meeting.pk = None
+                    meeting.program_schedule = entry
+            Schedule.objects.bulk_create([meeting for _, meetings, _ in accepted for meeting in meetings],
+                                         batch_size=self.batch_size)
+            # No ignore_conflicts: whatever slipped past the checks is refused by the database
+            occupy([(entry, meetings, schedule_resources(entry)) for entry, meetings, _ in accepted])
+            return accepted, rejected
+
+        try:
+            # Rejections are reported once the save succeeds, not once per attempt
+            accepted, rejected = locked(keys, save)
+        except IntegrityError:
+            # Rolled back as a whole, e.g. a referenced record deleted meanwhile
+            for _, _, lines in chunk:
+                self.errors += [(line, "Not saved: the timetable changed while importing; import it again.")
+                                for line in lines]
+            return []
+        self.report(rejected)
+        return accepted
+
+    def insert_returning_ids(self, entries):
+        """
+        bulk_create for backends that cannot return the new ids (MySQL): the
+        ids are read back by class key from the rows above the previous
+        highest id. Only this save can have added rows with those keys, as it
+        holds the locks of their instructors, rooms and sections.
+        """
+        if not entries:
+            return
+        last_id = ProgramSchedule.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        ProgramSchedule.objects.bulk_create(entries, batch_size=self.batch_size)
+        ids = {
+            tuple(row[column] for column in CLASS_COLUMNS): row['id']
+            for row in ProgramSchedule.objects.filter(id__gt=last_id).values('id', *CLASS_COLUMNS).iterator()
+        }
+        for entry in entries:
+            entry.pk = ids[tuple(getattr(entry, column) for column in CLASS_COLUMNS)]
+            entry._state.adding = False
+
+
+def meeting_slots(meetings):
+    return [(meeting.day, meeting.start_time, meeting.end_time) for meeting in meetings]
+
+
+IMPORTERS = {
+    'instructors': InstructorImporter,
+    'courses': CourseImporter,
+    'rooms': RoomImporter,
+    'schedules': ScheduleImporter,
+}
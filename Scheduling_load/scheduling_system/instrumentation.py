@@ -0,0 +1,261 @@
+"""
+Request profiling: wall time, SQL queries, SQL time and response size per view.
+
+ProfilingMiddleware times every request. The queries are counted by a
+database execute wrapper that apps.py installs on each new connection; it
+charges them to the request found in a context variable, which asgiref
+copies into sync_to_async threads, so the queries of async views count too.
+
+The middleware only runs with PROFILING_ENABLED (default DEBUG). Totals are
+kept per process and exposed in Prometheus text format by the /metrics view,
+which outside DEBUG only answers staff users and PROFILING_METRICS_TOKEN
+bearers (see metrics_allowed). With PROFILING_SERVER_TIMING (default DEBUG)
+every response carries a Server-Timing header that shows up in the
+browser's network panel. With PROFILING_CPROFILE on, a request
+with ?profile=1 (or an X-Profile header) also runs under cProfile and its
+top functions are logged; cProfile only sees the thread it runs on, which
+for async views is the event loop side.
+"""
+import bisect
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.crypto import constant_time_compare
+
+from .refcache import cache_stats
+
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILE_LINES = 30
+
+_current = contextvars.ContextVar('scheduling_request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'queries', 'sql_seconds')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper: charge the query to the current request, if any."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_seconds += time.perf_counter() - started
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """connection_created receiver adding record_query to the connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ViewStats:
+    def __init__(self):
+        self.statuses = {}  # status code -> requests
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)  # the last one is +Inf
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.response_bytes = 0
+
+
+_stats = {}  # (view name, method) -> ViewStats
+_stats_lock = threading.Lock()
+
+
+def observe(view, method, status, seconds, queries, sql_seconds, size):
+    with _stats_lock:
+        stats = _stats.get((view, method))
+        if stats is None:
+            stats = _stats[view, method] = ViewStats()
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.buckets[bisect.bisect_left(DURATION_BUCKETS, seconds)] += 1
+        stats.seconds += seconds
+        stats.queries += queries
+        stats.sql_seconds += sql_seconds
+        stats.response_bytes += size or 0
+
+
+def reset_metrics():
+    with _stats_lock:
+        _stats.clear()
+
+
+def label_text(**labels):
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def prometheus_text():
+    """Every per-view total and the reference cache counters, in Prometheus text format."""
+    requests, durations, queries, sql_seconds, sizes = [], [], [], [], []
+    with _stats_lock:
+        for (view, method), stats in sorted(_stats.items()):
+            for status, count in sorted(stats.statuses.items()):
+                requests.append(f'scheduling_http_requests_total{label_text(view=view, method=method, status=status)} {count}')
+            cumulative = 0
+            for bound, count in zip((*DURATION_BUCKETS, '+Inf'), stats.buckets):
+                cumulative += count
+                durations.append(
+                    f'scheduling_http_request_duration_seconds_bucket{label_text(view=view, method=method, le=bound)} {cumulative}'
+                )
+            labels = label_text(view=view, method=method)
+            durations.append(f'scheduling_http_request_duration_seconds_sum{labels} {stats.seconds:.6f}')
+            durations.append(f'scheduling_http_request_duration_seconds_count{labels} {cumulative}')
+            queries.append(f'scheduling_http_request_queries_total{labels} {stats.queries}')
+            sql_seconds.append(f'scheduling_http_request_sql_seconds_total{labels} {stats.sql_seconds:.6f}')
+            sizes.append(f'scheduling_http_response_bytes_total{labels} {stats.response_bytes}')
+
+    cache = []
+    for name, counters in sorted(cache_stats().items()):
+        cache.append(f"scheduling_reference_cache_requests_total{label_text(cache=name, outcome='hit')} {counters['hits']}")
+        cache.append(f"scheduling_reference_cache_requests_total{label_text(cache=name, outcome='miss')} {counters['misses']}")
+
+    families = (
+        ('scheduling_http_requests_total', 'counter', 'Requests by view, method and status.', requests),
+        ('scheduling_http_request_duration_seconds', 'histogram', 'Wall time of requests by view.', durations),
+        ('scheduling_http_request_queries_total', 'counter', 'SQL queries run by requests by view.', queries),
+        ('scheduling_http_request_sql_seconds_total', 'counter', 'Time spent in SQL by requests by view.', sql_seconds),
+        ('scheduling_http_response_bytes_total', 'counter', 'Response bytes by view (streamed bodies excluded).', sizes),
+        ('scheduling_reference_cache_requests_total', 'counter', 'Reference cache lookups by outcome.', cache),
+    )
+    lines = []
+    for name, kind, description, samples in families:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', *samples]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_allowed(request):
+    """Whether the request may read /metrics: always under DEBUG, else staff or the scrape token."""
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    token = getattr(settings, 'PROFILING_METRICS_TOKEN', None)
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def server_timing(seconds, metrics):
+    return (
+        f'app;dur={seconds * 1000:.1f}, '
+        f'db;dur={metrics.sql_seconds * 1000:.1f};desc="{metrics.queries} queries"'
+    )
+
+
+_profiler_lock = threading.Lock()
+
+
+def log_profile(request, view, profiler):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    logger.info('profile view=%s path=%s\n%s', view, request.get_full_path(), output.getvalue())
+    directory = getattr(settings, 'PROFILING_DIR', None)
+    if directory:
+        # For snakeviz / pstats
+        profiler.dump_stats(os.path.join(directory, f'{view}-{time.time_ns()}.prof'))
+
+
+class ProfilingMiddleware:
+    """Times each request and reports it as Server-Timing, /metrics and (optionally) cProfile."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'PROFILING_SERVER_TIMING', settings.DEBUG)
+        self.cprofile = getattr(settings, 'PROFILING_CPROFILE', False)
+        self.slow_seconds = getattr(settings, 'PROFILING_SLOW_SECONDS', None)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def start_profiler(self, request):
+        if not self.cprofile or not (request.GET.get('profile') == '1' or 'X-Profile' in request.headers):
+            return None
+        # One profiler at a time; overlapping flagged requests run unprofiled
+        if not _profiler_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        profiler = self.start_profiler(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                _profiler_lock.release()
+        return self.finish(request, response, metrics, profiler)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        profiler = self.start_profiler(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                _profiler_lock.release()
+        return self.finish(request, response, metrics, profiler)
+
+    def finish(self, request, response, metrics, profiler):
+        # Streamed bodies are timed up to the start of the stream
+        seconds = time.perf_counter() - metrics.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        observe(view, request.method, response.status_code, seconds, metrics.queries, metrics.sql_seconds, size)
+
+        if self.server_timing:
+            response['Server-Timing'] = server_timing(seconds, metrics)
+        if profiler is not None:
+            log_profile(request, view, profiler)
+        if self.slow_seconds is not None and seconds >= self.slow_seconds:
+            logger.warning('slow request view=%s method=%s status=%s ms=%.1f queries=%d sql_ms=%.1f',
+                           view, request.method, response.status_code, seconds * 1000, metrics.queries,
+                           metrics.sql_seconds * 1000)
+        else:
+            logger.debug('request view=%s method=%s status=%s ms=%.1f queries=%d sql_ms=%.1f',
+                         view, request.method, response.status_code, seconds * 1000, metrics.queries,
+                         metrics.sql_seconds * 1000)
+        return response
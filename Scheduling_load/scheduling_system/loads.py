@@ -0,0 +1,158 @@
+"""
+Teaching-load totals: units, contact minutes and classes per instructor and
+semester.
+
+InstructorLoad rows are updated inside the transaction that saves a class.
+add_load locks the instructor's row, so the overload check and the new total
+are one read and one write no matter how many classes the instructor already
+has. Deletes recount the instructor from program_schedule (refresh_instructor).
+Classes whose instructor is not linked to InstructorData are not counted.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FilteredRelation, Q, Sum
+
+from .conflicts import to_minutes
+from .models import InstructorData, InstructorLoad, ProgramSchedule, Schedule
+
+
+# Weekly units an instructor is normally given, by employment type
+MAX_UNITS = {'regular': 24, 'cos': 18}
+
+
+class Overload(Exception):
+    def __init__(self, load, units):
+        self.load = load
+        self.units = units
+        super().__init__(
+            f"Instructor would carry {load.units + units} units this semester; "
+            f"the limit for {load.employment_type} instructors is {max_units(load.employment_type)}."
+        )
+
+
+def max_units(employment_type):
+    return MAX_UNITS.get((employment_type or '').lower())
+
+
+def contact_minutes(slots):
+    return sum(to_minutes(end_time) - to_minutes(start_time) for _, start_time, end_time in slots)
+
+
+def check_limit(load, units):
+    limit = max_units(load.employment_type)
+    if limit is not None and load.units + units > limit:
+        raise Overload(load, units)
+
+
+def add_load(instructor_id, semester, units, slots, classes=1, enforce=True):
+    """
+    Add classes to the instructor's totals for `semester`. Call inside the
+    saving transaction: the row stays locked until it commits. Raises Overload
+    (leaving the totals alone) when `enforce` and the new units would pass the
+    employment type's limit.
+    """
+    if instructor_id is None:
+        return None
+    minutes = contact_minutes(slots)
+    load = InstructorLoad.objects.select_for_update().filter(instructor_id=instructor_id, semester=semester).first()
+    if load is None:
+        employment_type = InstructorData.objects.filter(instructor_id=instructor_id).values_list(
+            'employment_type', flat=True,
+        ).first()
+        load = InstructorLoad(
+            instructor_id=instructor_id, semester=semester, employment_type=(employment_type or 'regular').lower(),
+        )
+        if enforce:
+            check_limit(load, units)
+        load.units, load.contact_minutes, load.class_count = units, minutes, classes
+        try:
+            with transaction.atomic():
+                load.save(force_insert=True)
+            return load
+        except IntegrityError:
+            # Another save created the row first, unless the instructor is gone
+            load = InstructorLoad.objects.select_for_update().filter(
+                instructor_id=instructor_id, semester=semester,
+            ).first()
+            if load is None:
+                raise
+
+    if enforce:
+        check_limit(load, units)
+    load.units += units
+    load.contact_minutes += minutes
+    load.class_count += classes
+    load.save(update_fields=['units', 'contact_minutes', 'class_count', 'updated_at'])
+    return load
+
+
+def refresh_instructor(instructor_id, semester):
+    """Recount one instructor's totals from program_schedule, e.g. after a delete."""
+    if instructor_id is None:
+        return
+    entries = ProgramSchedule.objects.filter(instructor_id=instructor_id, semester=semester)
+    totals = entries.aggregate(units=Sum('credit_hours'), classes=Count('id'))
+    slots = Schedule.objects.filter(program_schedule__in=entries).values_list('day', 'start_time', 'end_time')
+    InstructorLoad.objects.filter(instructor_id=instructor_id, semester=semester).update(
+        units=totals['units'] or 0, class_count=totals['classes'], contact_minutes=contact_minutes(slots),
+    )
+
+
+@transaction.atomic
+def rebuild_loads(semester=None):
+    """Recompute every instructor's totals (of one semester, if given) in two passes over program_schedule."""
+    loads = InstructorLoad.objects.all()
+    entries = ProgramSchedule.objects.filter(instructor__isnull=False)
+    if semester is not None:
+        loads = loads.filter(semester=semester)
+        entries = entries.filter(semester=semester)
+    loads.delete()
+
+    totals, keys = {}, {}
+    rows = entries.values_list('id', 'instructor_id', 'instructor__employment_type', 'semester', 'credit_hours')
+    for entry_id, instructor_id, employment_type, entry_semester, credit_hours in rows.iterator(chunk_size=2000):
+        key = keys[entry_id] = (instructor_id, entry_semester)
+        load = totals.setdefault(key, InstructorLoad(
+            instructor_id=instructor_id, semester=entry_semester, employment_type=(employment_type or 'regular').lower(),
+        ))
+        load.units += credit_hours or 0
+        load.class_count += 1
+    slots = Schedule.objects.filter(program_schedule__in=entries).values_list(
+        'program_schedule_id', 'day', 'start_time', 'end_time',
+    )
+    for entry_id, day, start_time, end_time in slots.iterator(chunk_size=2000):
+        totals[keys[entry_id]].contact_minutes += contact_minutes([(day, start_time, end_time)])
+    InstructorLoad.objects.bulk_create(totals.values(), batch_size=1000)
+    return len(totals)
+
+
+def faculty_loads(semester, employment_type=None):
+    """Every instructor with their totals for `semester` (zero when they teach nothing), in one query."""
+    instructors = InstructorData.objects.annotate(
+        semester_load=FilteredRelation('loads', condition=Q(loads__semester=semester)),
+    ).values(
+        'instructor_id', 'first_name', 'middle_initial', 'last_name', 'employment_type',
+        units=F('semester_load__units'), contact_minutes=F('semester_load__contact_minutes'),
+        class_count=F('semester_load__class_count'),
+    ).order_by('last_name', 'first_name', 'instructor_id')
+    if employment_type:
+        instructors = instructors.filter(employment_type__iexact=employment_type)
+
+    results, totals = [], {}
+    for row in instructors:
+        units = row['units'] or 0
+        limit = max_units(row['employment_type'])
+        results.append({
+            'instructor_id': row['instructor_id'],
+            'name': f"{row['first_name']} {row['middle_initial'] or ''} {row['last_name']}".strip(),
+            'employment_type': row['employment_type'],
+            'units': units,
+            'contact_hours': round((row['contact_minutes'] or 0) / 60, 2),
+            'class_count': row['class_count'] or 0,
+            'max_units': limit,
+            'overloaded': limit is not None and units > limit,
+        })
+        total = totals.setdefault(row['employment_type'], {'instructors': 0, 'units': 0, 'contact_hours': 0})
+        total['instructors'] += 1
+        total['units'] += units
+        total['contact_hours'] = round(total['contact_hours'] + results[-1]['contact_hours'], 2)
+    return {'semester': semester, 'instructors': results, 'by_employment_type': totals}
@@ -0,0 +1,87 @@
+"""
+Per-resource locks around saves, so two saves booking the same instructor,
+room or section at the same moment cannot both pass the conflict check.
+
+Every resource a save occupies (conflicts.resource_keys) has a row in
+resource_lock, added by the first save that books it. locked() takes the
+existing rows with SELECT ... FOR UPDATE inside the saving transaction,
+always in key order, so saves that share resources queue up behind each
+other without waiting on one another in a cycle, and saves of unrelated
+resources take other rows and run in parallel. Only then are missing rows
+inserted and locked; a save that races another to create the same row waits
+on it or is retried. The save checks conflicts once it holds the locks and
+commits, which releases them.
+
+Deadlocks and lock wait timeouts (and SQLite's "database is locked", since
+SQLite has no row locks and serializes writers instead) roll the transaction
+back and retry it with backoff. Retrying needs the transaction to be the
+outermost one, so inside an enclosing atomic block the error is raised.
+"""
+import random
+import time
+
+from django.db import IntegrityError, OperationalError, connection, transaction
+
+from .models import ResourceLock
+
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 0.05  # seconds, doubled after every attempt
+
+# MySQL: deadlock found, lock wait timeout exceeded
+RETRYABLE_MYSQL_ERRORS = {1213, 1205}
+
+KEY_LENGTH = ResourceLock._meta.get_field('key').max_length
+
+
+def lock_key(kind, value):
+    """
+    Row key of a resource_keys() entry. Keys are cut to the column length; two
+    resources sharing a cut key only share a lock, which is still safe.
+    """
+    if isinstance(value, tuple):
+        value = '|'.join(str(part) for part in value)
+    return f'{kind}:{value}'[:KEY_LENGTH]
+
+
+def acquire(keys):
+    """Lock the rows of `keys` (creating missing ones) until the transaction ends."""
+    names = sorted({lock_key(kind, value) for kind, value in keys})
+    if not names:
+        return
+    # Lock the existing rows first: inserting over an existing key would take
+    # a shared lock on it (InnoDB), and two saves upgrading theirs deadlock
+    locked_names = ResourceLock.objects.select_for_update().filter(key__in=names).order_by('key')
+    missing = sorted(set(names).difference(locked_names.values_list('key', flat=True)))
+    if missing:
+        # First booking of a resource: add its row, then lock it
+        try:
+            with transaction.atomic():
+                ResourceLock.objects.bulk_create([ResourceLock(key=name) for name in missing], ignore_conflicts=True)
+        except IntegrityError:
+            pass
+        list(ResourceLock.objects.select_for_update().filter(key__in=missing).order_by('key').values_list(
+            'key', flat=True,
+        ))
+
+
+def is_retryable(error):
+    code = error.args[0] if error.args else None
+    return code in RETRYABLE_MYSQL_ERRORS or 'database is locked' in str(error) or 'table is locked' in str(error)
+
+
+def locked(keys, work, attempts=MAX_ATTEMPTS):
+    """
+    Run `work()` in a transaction holding the locks of `keys` and return its
+    result, retrying on deadlocks and lock timeouts.
+    """
+    retry = not connection.in_atomic_block
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic():
+                acquire(keys)
+                return work()
+        except OperationalError as error:
+            if not retry or attempt == attempts or not is_retryable(error):
+                raise
+        time.sleep(RETRY_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
@@ -0,0 +1,74 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from scheduling_system.benchmarks import ENDPOINTS, SIZES, compare_results, generate_dataset, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the endpoints, conflict engines, search indexes and solver against a "
+        "synthetic university in a throwaway test database (the configured database's "
+        "test copy: SQLite in memory, or test_<NAME> on MySQL). Prints or writes JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=sorted(SIZES), default='small')
+        for name in ('instructors', 'courses', 'rooms', 'schedules'):
+            parser.add_argument(f'--{name}', type=int, help=f"Override the number of {name} of --size")
+        parser.add_argument('--iterations', type=int, default=100, help="Timed requests per endpoint")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help="Only benchmark this endpoint (repeatable)")
+        parser.add_argument('--solver-classes', type=int, default=120, help="0 skips the solver benchmark")
+        parser.add_argument('--output', help="Write the JSON here instead of stdout")
+        parser.add_argument('--baseline', help="A previous --output to compare p50 latencies against")
+        parser.add_argument('--threshold', type=float, default=0.10,
+                            help="Relative p50 slowdown reported as a regression (default 0.10)")
+
+    def handle(self, *args, **options):
+        sizes = dict(SIZES[options['size']])
+        for name in sizes:
+            if options[name] is not None:
+                sizes[name] = options[name]
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - set(ENDPOINTS)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # As in production: no DEBUG query log; the test client's host allowed
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self.stderr.write(f"Generating {sizes} ...")
+                dataset = generate_dataset(seed=options['seed'], **sizes)
+                self.stderr.write(f"Generated in {dataset.seconds:.1f}s; benchmarking ...")
+                results = run_benchmarks(
+                    dataset, iterations=options['iterations'], only=options['endpoints'],
+                    solver_classes=options['solver_classes'],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        results['meta']['size'] = options['size']
+        results['meta']['seed'] = options['seed']
+
+        text = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(text + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(text)
+
+        if baseline is not None:
+            for name, before, after, change in compare_results(baseline, results):
+                line = f"{name:50} {before:10.3f} -> {after:10.3f} ms  {change:+7.1%}"
+                self.stderr.write(self.style.ERROR(line + "  REGRESSION") if change > options['threshold'] else line)
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduling_system.exports import DEFAULT_TERM_WEEKS, csv_lines, export_rows, ics_lines, write_xlsx
+
+
+class Command(BaseCommand):
+    help = "Write the timetable (optionally of one semester, instructor, room or program) as CSV, XLSX or iCalendar."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'xlsx', 'ics'], default='csv')
+        parser.add_argument('--output', help="File to write; standard output when omitted (not for xlsx)")
+        parser.add_argument('--semester')
+        parser.add_argument('--instructor', type=int, help="instructor_id")
+        parser.add_argument('--room', type=int, help="room_id")
+        parser.add_argument('--program', type=int, help="program_id")
+        parser.add_argument('--term-start', help="First day of the term (YYYY-MM-DD), for ics")
+        parser.add_argument('--weeks', type=int, default=DEFAULT_TERM_WEEKS, help="Length of the term, for ics")
+
+    def handle(self, *args, **options):
+        rows = export_rows(
+            semester=options['semester'], instructor_id=options['instructor'],
+            room_id=options['room'], program_id=options['program'],
+        )
+
+        if options['format'] == 'xlsx':
+            if not options['output']:
+                raise CommandError("--output is required for xlsx.")
+            try:
+                write_xlsx(rows, options['output'])
+            except ValueError as error:
+                raise CommandError(str(error))
+            return
+
+        if options['format'] == 'ics':
+            if not options['term_start']:
+                raise CommandError("--term-start is required for ics.")
+            try:
+                term_start = datetime.strptime(options['term_start'], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--term-start must be YYYY-MM-DD.")
+            lines = ics_lines(rows, term_start, weeks=options['weeks'])
+        else:
+            lines = csv_lines(rows)
+
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        # newline='' keeps the CRLF line endings both formats use
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            output.writelines(lines)
@@ -0,0 +1,142 @@
+from datetime import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from scheduling_system.conflicts import resource_keys
+from scheduling_system.models import ProgramSchedule, Schedule
+from scheduling_system.solver import build_solver, SHIFT_WINDOWS
+from scheduling_system.loads import add_load
+from scheduling_system.locks import locked
+from scheduling_system.slot_occupancy import find_batch_conflicts, occupy, schedule_resources
+from scheduling_system.utilization import record_schedules
+
+
+def minutes_to_time(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+class Command(BaseCommand):
+    help = (
+        "Place every course section of a college for one semester. Sections "
+        "already saved in program_schedule are kept, so re-running after manual "
+        "edits only fills in what is missing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', type=int, required=True)
+        parser.add_argument('--college', type=int, required=True, help="college_id of the programs and instructors")
+        parser.add_argument('--sections', default='A', help="Comma-separated section names, e.g. A,B,C")
+        parser.add_argument('--shift', default='Day', choices=sorted(SHIFT_WINDOWS))
+        parser.add_argument('--campus', help="Only use rooms of this campus")
+        parser.add_argument('--time-limit', type=float, default=30.0, help="Seconds the search may run")
+        parser.add_argument('--max-backtracks', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help="Report the result without saving it")
+
+    def handle(self, *args, **options):
+        sections = [section.strip() for section in options['sections'].split(',') if section.strip()]
+        if not sections:
+            raise CommandError("At least one section is required.")
+
+        solver = build_solver(
+            options['college'],
+            options['semester'],
+            sections=sections,
+            shift=options['shift'],
+            campus=options['campus'],
+            max_backtracks=options['max_backtracks'],
+        )
+        if not solver.requests:
+            raise CommandError(
+                f"No courses found for college {options['college']}, semester {options['semester']}."
+            )
+
+        result = solver.solve(time_limit=options['time_limit'])
+
+        self.stdout.write(
+            f"Solved in {result.elapsed:.2f}s{' (time limit reached)' if result.timed_out else ''}: "
+            f"{len(result.placements)} placed, {len(solver.done)} already scheduled, "
+            f"{len(result.unplaced)} unplaced, objective {result.objective} "
+            f"({result.nodes} nodes, {result.backtracks} backtracks)"
+        )
+        by_key = {request.key: request for request in solver.requests}
+        for key in result.unplaced:
+            request = by_key[key]
+            self.stdout.write(f"  unplaced: {request.course_code} {request.program.program_code} "
+                              f"{request.section_key[1]} {request.section_key[2]}")
+
+        if options['dry_run'] or not result.placements:
+            return
+
+        taken = self.save(result.placements.values(), options['semester'])
+        for placement in taken:
+            request = placement.request
+            self.stdout.write(f"  taken since solving: {request.course_code} {request.program.program_code} "
+                              f"{request.section_key[1]} {request.section_key[2]}")
+        self.stdout.write(self.style.SUCCESS(f"Saved {len(result.placements) - len(taken)} program schedules."))
+
+    def save(self, placements, semester):
+        """
+        Save the placements under the locks of their resources and return the
+        ones left out because a class saved since the solver's snapshot took
+        their slots. The rest are booked in slot_occupancy without
+        ignore_conflicts, so the database refuses any double-booking left.
+        """
+        entries = []
+        for placement in placements:
+            request = placement.request
+            program_id, year_level, section, shift = request.section_key
+            entries.append((placement, ProgramSchedule(
+                instructor_id=placement.instructor.key,
+                course=request.course,
+                program=request.program,
+                room_id=placement.room.key,
+                instructor_name=placement.instructor.name,
+                course_code=request.course_code or '',
+                course_name=request.course_name or '',
+                credit_hours=request.credit_hours,
+                semester=str(semester),
+                program_name=request.program.program_name or '',
+                program_code=request.program.program_code or '',
+                room_number=placement.room.number,
+                room_type=placement.room.room_type,
+                building_name=placement.room.building or '',
+                campus_name=placement.room.campus or '',
+                year_level=year_level,
+                section=section,
+                shift=shift,
+            ), [
+                (day, minutes_to_time(placement.start), minutes_to_time(placement.end)) for day in placement.days
+            ]))
+        checks = [(slots, schedule_resources(entry), entry.course_code) for _, entry, slots in entries]
+        keys = [key for _, resources, _ in checks for key in resource_keys(**resources)]
+
+        def save():
+            taken = {conflict['class'] for conflict in find_batch_conflicts(checks)}
+            kept = [number for number in range(len(entries)) if number not in taken]
+            meetings = {}
+            room_slots = {}
+            for number in kept:
+                placement, entry, slots = entries[number]
+                # Ids handed out by an attempt that was rolled back are void
+                entry.pk = None
+                entry.save(force_insert=True)
+                meetings[number] = [
+                    Schedule(program_schedule=entry, day=day, start_time=start_time, end_time=end_time)
+                    for day, start_time, end_time in slots
+                ]
+                room = room_slots.setdefault(placement.room.key, [0, []])
+                room[0] += 1
+                room[1] += slots
+                # The solver already weighs overloads, so record without rejecting
+                add_load(placement.instructor.key, str(semester), entry.credit_hours or 0, slots, enforce=False)
+            Schedule.objects.bulk_create([schedule for schedules in meetings.values() for schedule in schedules])
+            occupy([(entries[number][1], meetings[number], checks[number][1]) for number in kept])
+            for room_id, (classes, slots) in room_slots.items():
+                record_schedules(room_id, str(semester), slots, classes=classes)
+            return [entries[number][0] for number in sorted(taken)]
+
+        try:
+            return locked(keys, save)
+        except IntegrityError:
+            raise CommandError("The timetable changed while saving and nothing was saved; run the command again.")
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduling_system.importers import DEFAULT_BATCH_SIZE, IMPORTERS, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import instructors, courses, rooms or schedules from a CSV or XLSX file with a "
+        "header row named after the model fields. Schedules take one row per meeting "
+        "(day, start_time, end_time) and are checked for conflicts as a whole before saving."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], help="Default: from the file extension")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate and report without saving")
+        parser.add_argument('--max-errors', type=int, default=100, help="Row errors to print (all are counted)")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        started = time.perf_counter()
+        importer = IMPORTERS[options['kind']](batch_size=options['batch_size'], dry_run=options['dry_run'])
+        try:
+            importer.run(read_rows(options['path'], options['format']))
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+
+        for line, message in importer.errors[:options['max_errors']]:
+            self.stderr.write(f"  line {line}: {message}")
+        if len(importer.errors) > options['max_errors']:
+            self.stderr.write(f"  ... and {len(importer.errors) - options['max_errors']} more")
+
+        verb = "Validated" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {options['kind']} in {time.perf_counter() - started:.2f}s: {importer.created} created, "
+            f"{importer.updated} updated, {len(importer.errors)} row errors."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from scheduling_system.utilization import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the room_utilization summaries from program_schedule. Saves keep "
+        "them current; run this after bulk edits made outside the app."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', help="Only rebuild this semester")
+
+    def handle(self, *args, **options):
+        count = rebuild_summaries(options['semester'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} room summaries."))
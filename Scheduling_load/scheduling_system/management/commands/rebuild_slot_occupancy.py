@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from scheduling_system.slot_occupancy import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the slot_occupancy bookings from program_schedule. Saves and imports "
+        "keep them current; run this after bulk edits made outside the app."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        booked, clashes = rebuild_occupancy(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Booked {booked} resource slots."))
+        if clashes:
+            self.stdout.write(self.style.WARNING(
+                f"{clashes} slots were already double-booked; only their first booking was kept."
+            ))
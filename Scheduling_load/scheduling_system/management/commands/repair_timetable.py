@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduling_system.repair import load_repair, propose
+from scheduling_system.sandbox import Rejected, Stale
+
+
+def id_list(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Repair the saved timetable by local search: clear clashes and classes "
+        "in closed rooms or of departed instructors, then trim gaps, building "
+        "changes and lab waste, moving as few classes as possible. The moves go "
+        "into a what-if sandbox to review, or are committed with --apply."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', help="Only move classes of this semester")
+        parser.add_argument('--close-room', type=id_list, default=[], help="Comma-separated room ids to vacate")
+        parser.add_argument('--instructor-left', type=id_list, default=[],
+                            help="Comma-separated ids of instructors to reassign away from")
+        parser.add_argument('--time-limit', type=float, default=30.0, help="Seconds the search may run")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--apply', action='store_true', help="Commit the moves instead of leaving a sandbox")
+
+    def handle(self, *args, **options):
+        repair = load_repair(
+            options['semester'],
+            closed_rooms=options['close_room'],
+            departed=options['instructor_left'],
+            seed=options['seed'],
+        )
+        if not repair.assignments:
+            raise CommandError("No saved classes to repair.")
+
+        self.stdout.write(f"{len(repair.assignments)} classes, cost {repair.initial_cost}, "
+                          f"{repair.initial_violations} violations")
+        for event in repair.run(time_limit=options['time_limit']):
+            self.stdout.write(f"  {event['elapsed']:6.2f}s iteration {event['iteration']}: cost {event['cost']}, "
+                              f"best {event['best']}, {event['violations']} violations")
+
+        moves = repair.changes()
+        self.stdout.write(f"Cost {repair.initial_cost} -> {repair.cost}, {repair.violations} violations left, "
+                          f"{len(moves)} classes moved")
+        for move in moves:
+            self.stdout.write(f"  {move}")
+        if not moves:
+            return
+
+        sandbox = propose(moves)
+        if not options['apply']:
+            self.stdout.write(f"Review the moves in sandbox {sandbox.id}.")
+            return
+        try:
+            sandbox.commit()
+        except Stale as stale:
+            raise CommandError(f"{stale}; sandbox {sandbox.id} kept for review.")
+        except Rejected as rejected:
+            raise CommandError(f"Rejected with {len(rejected.conflicts)} conflicts; sandbox {sandbox.id} kept for review.")
+        sandbox.discard()
+        self.stdout.write(self.style.SUCCESS(f"Applied {len(moves)} moves."))
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_meeting_times(apps, schema_editor):
+    """Move each entry's single meeting into the new program_schedule table."""
+    ProgramSchedule = apps.get_model("scheduling_system", "ProgramSchedule")
+    Schedule = apps.get_model("scheduling_system", "Schedule")
+
+    batch = []
+    for entry in ProgramSchedule.objects.values("id", "day", "start_time", "end_time").iterator(chunk_size=2000):
+        batch.append(Schedule(
+            program_schedule_id=entry["id"],
+            day=entry["day"],
+            start_time=entry["start_time"],
+            end_time=entry["end_time"],
+        ))
+        if len(batch) >= 2000:
+            Schedule.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Schedule.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scheduling_system", "0002_programschedule_bachelor_degree_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Schedule",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.CharField(max_length=20)),
+                ("start_time", models.TimeField()),
+                ("end_time", models.TimeField()),
+                ("program_schedule", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="schedules", to="scheduling_system.programschedule")),
+            ],
+            options={
+                "db_table": "program_schedule",
+            },
+        ),
+        # Before the old columns go
+        migrations.RunPython(copy_meeting_times, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="programschedule",
+            name="day",
+        ),
+        migrations.RemoveField(
+            model_name="programschedule",
+            name="end_time",
+        ),
+        migrations.RemoveField(
+            model_name="programschedule",
+            name="start_time",
+        ),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize(value):
+    return " ".join((value or "").split()).lower()
+
+
+def instructor_names(instructor):
+    middle = instructor.middle_initial or ""
+    # "First M Last" as sent by teaching_load.html, and "Last, First M" from __str__
+    yield normalize(f"{instructor.first_name} {middle} {instructor.last_name}")
+    yield normalize(f"{instructor.last_name}, {instructor.first_name} {middle}")
+
+
+def backfill_references(apps, schema_editor):
+    ProgramSchedule = apps.get_model("scheduling_system", "ProgramSchedule")
+    InstructorData = apps.get_model("scheduling_system", "InstructorData")
+    InstructorCourse = apps.get_model("scheduling_system", "InstructorCourse")
+    Program = apps.get_model("scheduling_system", "Program")
+    Room = apps.get_model("scheduling_system", "Room")
+
+    instructors = {}
+    for instructor in InstructorData.objects.all():
+        for name in instructor_names(instructor):
+            instructors.setdefault(name, instructor.pk)
+    courses = {}
+    for course in InstructorCourse.objects.all():
+        courses.setdefault(normalize(course.course_code), course.pk)
+    programs = {}
+    for program in Program.objects.all():
+        programs.setdefault((normalize(program.program_name), normalize(program.program_code)), program.pk)
+        programs.setdefault((normalize(program.program_name), ""), program.pk)
+    rooms = {}
+    for room in Room.objects.select_related("building"):
+        rooms.setdefault((normalize(room.room_number), normalize(room.building.building_name)), room.pk)
+        rooms.setdefault((normalize(room.room_number), ""), room.pk)
+
+    batch = []
+    for entry in ProgramSchedule.objects.all().iterator(chunk_size=2000):
+        entry.instructor_id = instructors.get(normalize(entry.instructor_name))
+        entry.course_id = courses.get(normalize(entry.course_code))
+        entry.program_id = programs.get(
+            (normalize(entry.program_name), normalize(entry.program_code)),
+            programs.get((normalize(entry.program_name), "")),
+        )
+        entry.room_id = rooms.get(
+            (normalize(entry.room_number), normalize(entry.building_name)),
+            rooms.get((normalize(entry.room_number), "")),
+        )
+        batch.append(entry)
+        if len(batch) >= 2000:
+            ProgramSchedule.objects.bulk_update(batch, ["instructor", "course", "program", "room"])
+            batch = []
+    if batch:
+        ProgramSchedule.objects.bulk_update(batch, ["instructor", "course", "program", "room"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scheduling_system", "0003_remove_programschedule_day_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="programschedule",
+            name="course",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="program_schedules", to="scheduling_system.instructorcourse"),
+        ),
+        migrations.AddField(
+            model_name="programschedule",
+            name="instructor",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="program_schedules", to="scheduling_system.instructordata"),
+        ),
+        migrations.AddField(
+            model_name="programschedule",
+            name="program",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="program_schedules", to="scheduling_system.program"),
+        ),
+        migrations.AddField(
+            model_name="programschedule",
+            name="room",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="program_schedules", to="scheduling_system.room"),
+        ),
+        migrations.RunPython(backfill_references, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="programschedule",
+            index=models.Index(fields=["instructor", "semester"], name="progsched_instructor_sem_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="programschedule",
+            index=models.Index(fields=["room", "semester"], name="progsched_room_sem_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="programschedule",
+            index=models.Index(fields=["program", "section", "year_level", "shift"], name="progsched_program_section_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="programschedule",
+            index=models.Index(fields=["instructor_name"], name="progsched_instructor_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="programschedule",
+            index=models.Index(fields=["room_number"], name="progsched_room_number_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="programschedule",
+            index=models.Index(fields=["program_name", "section", "year_level", "shift"], name="progsched_section_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="schedule",
+            index=models.Index(fields=["day", "start_time", "end_time"], name="schedule_day_time_idx"),
+        ),
+        migrations.AlterModelTable(
+            name="programschedule",
+            table="scheduling_system_programschedule",
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+from scheduling_system.availability import encode_availability
+
+
+def fill_availability_masks(apps, schema_editor):
+    for model_name in ("InstructorData", "Room"):
+        model = apps.get_model("scheduling_system", model_name)
+        batch = []
+        for entity in model.objects.all().iterator(chunk_size=1000):
+            entity.availability_mask = encode_availability(entity.availability_days, entity.availability_times)
+            batch.append(entity)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, ["availability_mask"])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ["availability_mask"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scheduling_system", "0004_programschedule_references"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="instructordata",
+            name="availability_mask",
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="availability_mask",
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(fill_availability_masks, migrations.RunPython.noop),
+    ]
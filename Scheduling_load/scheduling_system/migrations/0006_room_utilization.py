@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from scheduling_system.utilization import booked_minutes, booked_week
+
+
+def fill_room_utilization(apps, schema_editor):
+    Schedule = apps.get_model("scheduling_system", "Schedule")
+    RoomUtilization = apps.get_model("scheduling_system", "RoomUtilization")
+    groups = {}
+    rows = Schedule.objects.filter(program_schedule__room__isnull=False).values_list(
+        "program_schedule__room_id", "program_schedule__semester", "program_schedule_id", "day", "start_time", "end_time",
+    )
+    for room_id, semester, program_schedule_id, day, start_time, end_time in rows.iterator(chunk_size=2000):
+        classes, slots = groups.setdefault((room_id, semester), (set(), []))
+        classes.add(program_schedule_id)
+        slots.append((day, start_time, end_time))
+    RoomUtilization.objects.bulk_create([
+        RoomUtilization(
+            room_id=room_id, semester=semester, class_count=len(classes),
+            booked_minutes=booked_minutes(slots), booked_mask=booked_week(slots),
+        )
+        for (room_id, semester), (classes, slots) in groups.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scheduling_system", "0005_availability_mask"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RoomUtilization",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("semester", models.CharField(max_length=50)),
+                ("class_count", models.IntegerField(default=0)),
+                ("booked_minutes", models.IntegerField(default=0)),
+                ("booked_mask", models.BinaryField(default=bytes)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("room", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="utilization", to="scheduling_system.room")),
+            ],
+            options={
+                "db_table": "room_utilization",
+                "constraints": [models.UniqueConstraint(fields=("room", "semester"), name="room_utilization_room_semester_uniq")],
+            },
+        ),
+        migrations.RunPython(fill_room_utilization, migrations.RunPython.noop),
+    ]
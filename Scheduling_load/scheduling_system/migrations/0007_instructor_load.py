@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from scheduling_system.loads import contact_minutes
+
+
+def fill_instructor_loads(apps, schema_editor):
+    ProgramSchedule = apps.get_model("scheduling_system", "ProgramSchedule")
+    Schedule = apps.get_model("scheduling_system", "Schedule")
+    InstructorLoad = apps.get_model("scheduling_system", "InstructorLoad")
+    loads = {}
+    entries = ProgramSchedule.objects.filter(instructor__isnull=False).values_list(
+        "id", "instructor_id", "instructor__employment_type", "semester", "credit_hours",
+    )
+    keys = {}
+    for entry_id, instructor_id, employment_type, semester, credit_hours in entries.iterator(chunk_size=2000):
+        key = keys[entry_id] = (instructor_id, semester)
+        load = loads.setdefault(key, InstructorLoad(
+            instructor_id=instructor_id, semester=semester, employment_type=(employment_type or "regular").lower(),
+        ))
+        load.units += credit_hours or 0
+        load.class_count += 1
+    slots = Schedule.objects.filter(program_schedule__instructor__isnull=False).values_list(
+        "program_schedule_id", "day", "start_time", "end_time",
+    )
+    for entry_id, day, start_time, end_time in slots.iterator(chunk_size=2000):
+        loads[keys[entry_id]].contact_minutes += contact_minutes([(day, start_time, end_time)])
+    InstructorLoad.objects.bulk_create(loads.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scheduling_system", "0006_room_utilization"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InstructorLoad",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("semester", models.CharField(max_length=50)),
+                ("employment_type", models.CharField(default="regular", max_length=10)),
+                ("units", models.IntegerField(default=0)),
+                ("contact_minutes", models.IntegerField(default=0)),
+                ("class_count", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("instructor", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="loads", to="scheduling_system.instructordata")),
+            ],
+            options={
+                "db_table": "instructor_load",
+                "constraints": [models.UniqueConstraint(fields=("instructor", "semester"), name="instructor_load_instructor_semester_uniq")],
+            },
+        ),
+        migrations.RunPython(fill_instructor_loads, migrations.RunPython.noop),
+    ]
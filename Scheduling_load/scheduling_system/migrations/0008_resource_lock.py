@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scheduling_system", "0007_instructor_load"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceLock",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("key", models.CharField(max_length=191, unique=True)),
+            ],
+            options={
+                "db_table": "resource_lock",
+            },
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Frozen copies of the booking rules of slot_occupancy.py (and the conflicts.py,
+# locks.py and availability.py helpers they use) as of this migration
+VALID_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+SLOT_MINUTES = 15
+KEY_LENGTH = 191
+
+BOOKING_FIELDS = (
+    "id", "day", "start_time", "end_time",
+    "program_schedule__instructor_name",
+    "program_schedule__room_number",
+    "program_schedule__program_name",
+    "program_schedule__section",
+    "program_schedule__year_level",
+    "program_schedule__shift",
+    "program_schedule__instructor_id",
+    "program_schedule__room_id",
+    "program_schedule__program_id",
+)
+
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def lock_key(kind, value):
+    if isinstance(value, tuple):
+        value = "|".join(str(part) for part in value)
+    return f"{kind}:{value}"[:KEY_LENGTH]
+
+
+def owned_keys(row):
+    """One key per resource: the foreign key when linked, else the text snapshot."""
+    keys = []
+    if row["program_schedule__instructor_id"]:
+        keys.append(("instructor_id", row["program_schedule__instructor_id"]))
+    elif row["program_schedule__instructor_name"]:
+        keys.append(("instructor", row["program_schedule__instructor_name"]))
+    if row["program_schedule__room_id"]:
+        keys.append(("room_id", row["program_schedule__room_id"]))
+    elif row["program_schedule__room_number"]:
+        keys.append(("room", row["program_schedule__room_number"]))
+    section = (row["program_schedule__section"], row["program_schedule__year_level"], row["program_schedule__shift"])
+    if None not in section:
+        if row["program_schedule__program_id"]:
+            keys.append(("section_id", (row["program_schedule__program_id"], *section)))
+        elif row["program_schedule__program_name"] is not None:
+            keys.append(("section", (row["program_schedule__program_name"], *section)))
+    return [lock_key(kind, value) for kind, value in keys]
+
+
+def occupancy_rows(model, row):
+    if row["day"] not in VALID_DAYS:
+        return []
+    day_index = VALID_DAYS.index(row["day"])
+    slots = range(to_minutes(row["start_time"]) // SLOT_MINUTES, -(-to_minutes(row["end_time"]) // SLOT_MINUTES))
+    return [
+        model(schedule_id=row["id"], resource=key, day=day_index, slot=slot)
+        for key in owned_keys(row)
+        for slot in slots
+    ]
+
+
+def fill_slot_occupancy(apps, schema_editor):
+    Schedule = apps.get_model("scheduling_system", "Schedule")
+    SlotOccupancy = apps.get_model("scheduling_system", "SlotOccupancy")
+    batch = []
+    for row in Schedule.objects.order_by("id").values(*BOOKING_FIELDS).iterator(chunk_size=2000):
+        batch += occupancy_rows(SlotOccupancy, row)
+        if len(batch) >= 5000:
+            # Slots already double-booked keep their first booking
+            SlotOccupancy.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    SlotOccupancy.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scheduling_system", "0008_resource_lock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlotOccupancy",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("resource", models.CharField(max_length=191)),
+                ("day", models.SmallIntegerField()),
+                ("slot", models.SmallIntegerField()),
+                ("schedule", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="occupancy", to="scheduling_system.schedule")),
+            ],
+            options={
+                "db_table": "slot_occupancy",
+                "constraints": [models.UniqueConstraint(fields=("resource", "day", "slot"), name="slot_occupancy_resource_slot_uniq")],
+            },
+        ),
+        migrations.RunPython(fill_slot_occupancy, migrations.RunPython.noop),
+    ]
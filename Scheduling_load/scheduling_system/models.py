@@ -1,5 +1,7 @@
 from django.db import models
 
+from .availability import encode_availability
+
 
 #DB fetching for instructors data
 class InstructorData(models.Model):
@@ -16,6 +18,8 @@ class InstructorData(models.Model):
     qualified_course = models.JSONField(default=dict)  
     availability_days = models.JSONField(default=list)  
     availability_times = models.JSONField(default=list)  
+    # Packed 7 x 96 15-minute slots, derived from the two JSON fields above
+    availability_mask = models.BinaryField(default=bytes, editable=False)
 
     class Meta:
       db_table = 'instructor'
@@ -23,6 +27,13 @@ class InstructorData(models.Model):
     def __str__(self):
         return f"{self.last_name}, {self.first_name} {self.middle_initial or ''}"
 
+    def save(self, *args, **kwargs):
+        self.availability_mask = encode_availability(self.availability_days, self.availability_times)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'availability_days', 'availability_times'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'availability_mask'}
+        super().save(*args, **kwargs)
+
 #DB fetching for program ids
 class Program(models.Model):
     program_id = models.AutoField(primary_key=True)
@@ -85,15 +96,31 @@ class Room(models.Model):
     room_type = models.CharField(max_length=255)
     availability_days = models.JSONField()
     availability_times = models.JSONField()
+    # Packed 7 x 96 15-minute slots, derived from the two JSON fields above
+    availability_mask = models.BinaryField(default=bytes, editable=False)
 
     class Meta:
         db_table = 'room'
 
     def __str__(self):
         return f"{self.room_number} - {self.room_type} in {self.building.building_name}, {self.campus.campus_name}"
+
+    def save(self, *args, **kwargs):
+        self.availability_mask = encode_availability(self.availability_days, self.availability_times)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'availability_days', 'availability_times'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'availability_mask'}
+        super().save(*args, **kwargs)
     
 # models.py
 class ProgramSchedule(models.Model):
+    # References to the master records; the text columns below are kept as the
+    # snapshot shown in the UI and as a fallback for rows that never matched.
+    instructor = models.ForeignKey(InstructorData, on_delete=models.SET_NULL, null=True, blank=True, related_name="program_schedules")
+    course = models.ForeignKey(InstructorCourse, on_delete=models.SET_NULL, null=True, blank=True, related_name="program_schedules")
+    program = models.ForeignKey(Program, on_delete=models.SET_NULL, null=True, blank=True, related_name="program_schedules")
+    room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True, related_name="program_schedules")
+
     # Instructor Information
     instructor_name = models.CharField(max_length=200)
     bachelor_degree = models.CharField(max_length=255, null=True, blank=True)
@@ -121,7 +148,17 @@ class ProgramSchedule(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
-    db_table = 'scheduling_system_programschedule'
+    class Meta:
+        db_table = 'scheduling_system_programschedule'
+        indexes = [
+            models.Index(fields=['instructor', 'semester'], name='progsched_instructor_sem_idx'),
+            models.Index(fields=['room', 'semester'], name='progsched_room_sem_idx'),
+            models.Index(fields=['program', 'section', 'year_level', 'shift'], name='progsched_program_section_idx'),
+            # Conflict lookups still match on the text columns for unlinked rows
+            models.Index(fields=['instructor_name'], name='progsched_instructor_name_idx'),
+            models.Index(fields=['room_number'], name='progsched_room_number_idx'),
+            models.Index(fields=['program_name', 'section', 'year_level', 'shift'], name='progsched_section_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.instructor_name} - {self.course_name} - {self.program_name} - {self.room_number}"
@@ -138,6 +175,86 @@ class Schedule(models.Model):
 
     class Meta:
         db_table = 'program_schedule'
+        indexes = [
+            models.Index(fields=['day', 'start_time', 'end_time'], name='schedule_day_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.day} - {self.start_time} to {self.end_time}"
+
+
+# Precomputed room usage per semester, kept current by utilization.py
+class RoomUtilization(models.Model):
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='utilization')
+    semester = models.CharField(max_length=50)
+
+    class_count = models.IntegerField(default=0)
+    booked_minutes = models.IntegerField(default=0)
+    # Packed week of the 15-minute slots booked in the room (same format as availability_mask)
+    booked_mask = models.BinaryField(default=bytes)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'room_utilization'
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'semester'], name='room_utilization_room_semester_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.room_id} - Semester {self.semester}: {self.booked_minutes} minutes"
+
+
+# Running teaching-load totals per instructor and semester, kept current by loads.py
+class InstructorLoad(models.Model):
+    instructor = models.ForeignKey(InstructorData, on_delete=models.CASCADE, related_name='loads')
+    semester = models.CharField(max_length=50)
+    # Copied from the instructor so the overload check needs no extra query
+    employment_type = models.CharField(max_length=10, default='regular')
+
+    units = models.IntegerField(default=0)
+    contact_minutes = models.IntegerField(default=0)
+    class_count = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'instructor_load'
+        constraints = [
+            models.UniqueConstraint(fields=['instructor', 'semester'], name='instructor_load_instructor_semester_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.instructor_id} - Semester {self.semester}: {self.units} units"
+
+
+# One row per bookable resource (instructor, room, program section), locked by
+# the saves that book it so their conflict checks cannot interleave (see locks.py)
+class ResourceLock(models.Model):
+    key = models.CharField(max_length=191, unique=True)
+
+    class Meta:
+        db_table = 'resource_lock'
+
+    def __str__(self):
+        return self.key
+
+
+# One row per resource and 15-minute slot a Schedule row books, so finding a
+# clash is an index lookup and the unique constraint makes the database itself
+# refuse a double-booking (see slot_occupancy.py)
+class SlotOccupancy(models.Model):
+    schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE, related_name='occupancy')
+    # locks.lock_key() of the resource, e.g. 'room_id:12'
+    resource = models.CharField(max_length=191)
+    day = models.SmallIntegerField()  # index into availability.VALID_DAYS
+    slot = models.SmallIntegerField()  # 15-minute slot of the day, 0-95
+
+    class Meta:
+        db_table = 'slot_occupancy'
+        constraints = [
+            models.UniqueConstraint(fields=['resource', 'day', 'slot'], name='slot_occupancy_resource_slot_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.resource} day {self.day} slot {self.slot}"
@@ -0,0 +1,176 @@
+"""
+Rooms x time-slots occupancy matrix for "find me a free room" lookups.
+
+Each room is one row of 84 bytes (7 days x 96 15-minute slots, the packed
+format of availability.py). A room's free slots are its availability mask
+with every booked Schedule slot cleared, so answering a request for a
+(day, start, end) window is a single vectorized AND over all rooms.
+
+The matrix is built once per process. When the 'schedule' version moves, the
+rooms named in the notes of the bumps since (see signals.py and
+versioning.changes_since) get their rows recomputed from their own
+schedules, into a copy of the matrix; a bump without notes, e.g. an import,
+or a 'room' version change rebuilds it.
+"""
+import copy
+import threading
+
+from django.db.models import Q
+
+from .availability import VALID_DAYS, WEEK_BYTES, day_masks, decode_week, encode_week, np, screen_masks, span_mask
+from .models import Room, Schedule
+from .versioning import changes_since, get_version
+
+
+BOOKED_FIELDS = (
+    'program_schedule_id', 'program_schedule__room_id', 'program_schedule__room_number', 'day', 'start_time',
+    'end_time',
+)
+
+
+class OccupancyMatrix:
+    def __init__(self, rooms, available, versions):
+        """`available` is each room's availability as {day: mask}; nothing is booked yet."""
+        self.rooms = rooms
+        self.available = available
+        self.versions = versions
+        self.position_by_id = {room['room_id']: position for position, room in enumerate(rooms)}
+        self.position_by_number = {}
+        for position, room in enumerate(rooms):
+            self.position_by_number.setdefault(room['room_number'], position)
+        # Room position (None: no room) of every entry whose meetings are booked in the matrix
+        self.entry_rooms = {}
+        self.room_types = [(room['room_type'] or '').lower() for room in rooms]
+        self.campuses = [(room['campus_name'] or '').lower() for room in rooms]
+        if np is not None:
+            self.room_types = np.array(self.room_types, dtype=str)
+            self.campuses = np.array(self.campuses, dtype=str)
+        self.free = None
+
+    @classmethod
+    def build(cls, versions):
+        rooms = list(
+            Room.objects.order_by('room_id').values(
+                'room_id', 'room_number', 'room_type', 'availability_mask', 'availability_days',
+                'availability_times', 'building__building_name', 'campus__campus_name',
+            )
+        )
+        available = [
+            decode_week(room['availability_mask']) if room['availability_mask']
+            else day_masks(room['availability_days'], room['availability_times'])
+            for room in rooms
+        ]
+        summaries = [
+            {
+                'room_id': room['room_id'],
+                'room_number': room['room_number'],
+                'room_type': room['room_type'],
+                'building_name': room['building__building_name'],
+                'campus_name': room['campus__campus_name'],
+            }
+            for room in rooms
+        ]
+        matrix = cls(summaries, available, versions)
+        booked = Schedule.objects.values_list(*BOOKED_FIELDS).iterator(chunk_size=5000)
+        matrix.set_free(matrix.free_weeks(range(len(rooms)), booked))
+        return matrix
+
+    def position(self, room_id, room_number):
+        return self.position_by_id.get(room_id) if room_id else self.position_by_number.get(room_number)
+
+    def free_weeks(self, positions, booked):
+        """
+        {position: packed free week} for the rooms at `positions`: their
+        availability minus the `booked` rows (BOOKED_FIELDS tuples) in them.
+        """
+        free = {position: dict(self.available[position]) for position in positions}
+        for entry_id, room_id, room_number, day, start_time, end_time in booked:
+            position = self.position(room_id, room_number)
+            self.entry_rooms[entry_id] = position
+            if position not in free or day not in VALID_DAYS:
+                continue
+            taken = span_mask(start_time.hour * 60 + start_time.minute, end_time.hour * 60 + end_time.minute)
+            free[position][day] = free[position].get(day, 0) & ~taken
+        return {position: encode_week(masks) for position, masks in free.items()}
+
+    def set_free(self, weeks):
+        """Install the packed weeks of every room, in position order."""
+        weeks = [weeks[position] for position in range(len(self.rooms))]
+        if np is not None:
+            self.free = np.frombuffer(b''.join(weeks), dtype=np.uint8).reshape(len(self.rooms), WEEK_BYTES)
+        else:
+            self.free = weeks
+
+    def updated(self, changes, versions):
+        """
+        A copy with the rows of the rooms `changes` name recomputed, or None if
+        one names an entry the matrix does not know.
+        """
+        positions = set()
+        entry_ids = set()
+        for change in changes:
+            if change[0] == 'entry':
+                entry_ids.add(change[1])
+                if change[1] not in self.entry_rooms:
+                    return None
+                positions.add(self.entry_rooms[change[1]])
+            else:
+                positions.add(self.position(change[1], change[2]))
+        positions.discard(None)
+
+        matrix = copy.copy(self)
+        matrix.versions = versions
+        matrix.entry_rooms = {
+            entry_id: position for entry_id, position in self.entry_rooms.items()
+            if entry_id not in entry_ids and position not in positions
+        }
+        in_rooms = Q(program_schedule_id__in=entry_ids)
+        for position in positions:
+            room = self.rooms[position]
+            in_rooms |= Q(program_schedule__room_id=room['room_id'])
+            if self.position_by_number.get(room['room_number']) == position:
+                in_rooms |= Q(program_schedule__room_id__isnull=True, program_schedule__room_number=room['room_number'])
+        weeks = matrix.free_weeks(positions, Schedule.objects.filter(in_rooms).values_list(*BOOKED_FIELDS))
+
+        if np is not None:
+            matrix.free = self.free.copy()
+            for position, week in weeks.items():
+                matrix.free[position] = np.frombuffer(week, dtype=np.uint8)
+        else:
+            matrix.free = list(self.free)
+            for position, week in weeks.items():
+                matrix.free[position] = week
+        return matrix
+
+    def free_rooms(self, day, start_minute, end_minute, room_type=None, campus=None):
+        """Rooms free for the whole of [start_minute, end_minute) on `day`."""
+        fits = screen_masks(self.free, day, start_minute, end_minute)
+        if np is not None:
+            if room_type:
+                fits &= np.char.find(self.room_types, room_type.lower()) >= 0
+            if campus:
+                fits &= np.char.find(self.campuses, campus.lower()) >= 0
+            return [self.rooms[position] for position in np.flatnonzero(fits)]
+        return [
+            room for position, room in enumerate(self.rooms)
+            if fits[position]
+            and (not room_type or room_type.lower() in self.room_types[position])
+            and (not campus or campus.lower() in self.campuses[position])
+        ]
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def get_occupancy_matrix():
+    """The process-wide matrix, brought up to date if schedules or rooms changed since it was built."""
+    global _matrix
+    versions = (get_version('schedule'), get_version('room'))
+    with _matrix_lock:
+        if _matrix is not None and _matrix.versions != versions and _matrix.versions[1] == versions[1]:
+            changes = changes_since('schedule', _matrix.versions[0], versions[0])
+            _matrix = _matrix.updated(changes, versions) if changes is not None else None
+        if _matrix is None or _matrix.versions != versions:
+            _matrix = OccupancyMatrix.build(versions)
+        return _matrix
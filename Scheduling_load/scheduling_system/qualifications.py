@@ -0,0 +1,65 @@
+"""
+Inverted index from course code to the instructors qualified to teach it.
+
+Built from InstructorData.qualified_course once per process and rebuilt
+lazily after the 'instructor' version is bumped (see signals.py). Each entry
+keeps what the recommendation endpoint needs without touching the instructor
+table again: display name, employment type and the packed availability mask.
+"""
+import threading
+
+from .availability import qualified_course_codes
+from .models import InstructorData
+from .versioning import get_version
+
+
+def normalize_code(course_code):
+    return ' '.join((course_code or '').split()).upper()
+
+
+class QualificationIndex:
+    def __init__(self, version):
+        self.version = version
+        self.instructors = {}
+        self.by_course = {}
+
+    @classmethod
+    def build(cls, version):
+        index = cls(version)
+        rows = InstructorData.objects.values(
+            'instructor_id', 'first_name', 'middle_initial', 'last_name', 'employment_type',
+            'qualified_course', 'availability_mask', 'availability_days', 'availability_times',
+        )
+        for row in rows.iterator(chunk_size=2000):
+            index.add(row)
+        return index
+
+    def add(self, row):
+        instructor_id = row['instructor_id']
+        self.instructors[instructor_id] = {
+            'instructor_id': instructor_id,
+            'name': f"{row['first_name']} {row['middle_initial'] or ''} {row['last_name']}".strip(),
+            'employment_type': row['employment_type'],
+            'availability_mask': bytes(row['availability_mask'] or b''),
+            'availability_days': row['availability_days'],
+            'availability_times': row['availability_times'],
+        }
+        for code in qualified_course_codes(row['qualified_course']):
+            self.by_course.setdefault(code, []).append(instructor_id)
+
+    def qualified(self, course_code):
+        """Instructor entries qualified for `course_code`, in id order."""
+        return [self.instructors[instructor_id] for instructor_id in self.by_course.get(normalize_code(course_code), [])]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_qualification_index():
+    global _index
+    version = get_version('instructor')
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = QualificationIndex.build(version)
+        return _index
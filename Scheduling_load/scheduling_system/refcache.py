@@ -0,0 +1,80 @@
+"""
+Read-through cache for reference data: programs, courses, rooms and their
+buildings and campuses.
+
+Values live in Django's cache (LocMem locally, Redis in production; see
+CACHES in settings) under keys that embed the data's version from
+versioning.py. A save or delete bumps the version through signals.py, so
+stale entries are never read again and simply age out through the TTL or
+the backend's LRU eviction. Hits and misses are counted per process for
+monitoring (cache_stats).
+"""
+import threading
+
+from django.core.cache import cache
+
+from .versioning import aget_version, get_version
+
+
+REFERENCE_TIMEOUT = 60 * 60
+
+MISSING = object()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def count(name, outcome):
+    with _stats_lock:
+        counters = _stats.setdefault(name, {'hits': 0, 'misses': 0})
+        counters[outcome] += 1
+
+
+def reference_key(name, key, version=None):
+    if version is None:
+        version = get_version(name)
+    return f'scheduling_system:{name}:{version}:{key}'
+
+
+def cached(name, key, loader, timeout=REFERENCE_TIMEOUT):
+    """
+    The cached value of `key` for the `name` data ('program', 'course',
+    'room'), calling `loader()` on a miss. None results are cached too, so
+    repeated lookups of a missing record stay cheap.
+    """
+    cache_key = reference_key(name, key)
+    value = cache.get(cache_key, MISSING)
+    if value is not MISSING:
+        count(name, 'hits')
+        return value
+    count(name, 'misses')
+    value = loader()
+    cache.set(cache_key, value, timeout)
+    return value
+
+
+async def acached(name, key, loader, timeout=REFERENCE_TIMEOUT):
+    """cached() for async views: `loader` is a coroutine function."""
+    cache_key = reference_key(name, key, await aget_version(name))
+    value = await cache.aget(cache_key, MISSING)
+    if value is not MISSING:
+        count(name, 'hits')
+        return value
+    count(name, 'misses')
+    value = await loader()
+    await cache.aset(cache_key, value, timeout)
+    return value
+
+
+def cache_stats():
+    """{name: {'hits', 'misses', 'hit_rate'}} since this process started."""
+    with _stats_lock:
+        return {
+            name: {**counters, 'hit_rate': round(counters['hits'] / (counters['hits'] + counters['misses']), 4)}
+            for name, counters in _stats.items()
+        }
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,177 @@
+"""
+Resolve the free-text fields posted by teaching_load.html to master records.
+
+The page sends the ids of the instructor, course, program and room the user
+picked; requests from older pages only carry the text, so that is looked up
+the same way migration 0004 backfilled existing rows.
+"""
+from functools import reduce
+from operator import or_
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+
+from .models import InstructorData, InstructorCourse, Program, Room
+
+
+def normalize(value):
+    return " ".join((value or "").split()).lower()
+
+
+def parse_id(value):
+    """Integer id from a POST value, None when missing; ValueError when malformed."""
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def possible_last_names(name):
+    """
+    Every last name a normalized full name can end with ("First M Last"), or
+    start with ("Last, First M"), so a lookup can narrow by last name before
+    comparing the full names in Python.
+    """
+    if not name:
+        return set()
+    words = name.split()
+    last_names = {' '.join(words[position:]) for position in range(1, len(words))} or {name}
+    if ',' in name:
+        last_names.add(name.split(',')[0].strip())
+    return last_names
+
+
+def find_instructor_id(instructor_name):
+    return ReferenceMaps([{'instructor_name': instructor_name}]).instructor_id(instructor_name)
+
+
+def find_course_id(course_code):
+    return ReferenceMaps([{'course_code': course_code}]).course_id(course_code)
+
+
+def find_program_id(program_name, program_code):
+    data = {'program_name': program_name, 'program_code': program_code}
+    return ReferenceMaps([data]).program_id(program_name, program_code)
+
+
+def find_room_id(room_number, building_name):
+    data = {'room_number': room_number, 'building_name': building_name}
+    return ReferenceMaps([data]).room_id(room_number, building_name)
+
+
+def posted_references(data):
+    """The posted ids, None where missing; ValueError when malformed."""
+    return {
+        'instructor_id': parse_id(data.get('instructor_id')),
+        'course_id': parse_id(data.get('course_id')),
+        'program_id': parse_id(data.get('program_id')),
+        'room_id': parse_id(data.get('room_id')),
+    }
+
+
+def resolve_references(data):
+    """
+    Return instructor_id, course_id, program_id and room_id for a save request.
+
+    Posted ids win; only the missing ones cost a lookup. Raises ValueError when
+    a posted id is not an integer.
+    """
+    return resolve_many([data])[0]
+
+
+def resolve_many(items):
+    """
+    resolve_references for several requests at once, e.g. the classes of a
+    batch save: at most one query per kind of reference for the whole batch,
+    whatever the number of classes.
+    """
+    references = [posted_references(data) for data in items]
+    maps = ReferenceMaps([data for data, posted in zip(items, references) if None in posted.values()])
+    return [maps.resolve(data, posted) for data, posted in zip(items, references)]
+
+
+async def aresolve_references(data):
+    """resolve_references for async views: every lookup in one trip to the sync ORM thread."""
+    return await sync_to_async(resolve_references)(data)
+
+
+async def aresolve_many(items):
+    """resolve_many for async views, in one trip to the sync ORM thread."""
+    return await sync_to_async(resolve_many)(items)
+
+
+class ReferenceMaps:
+    """
+    The master records text references can name, in memory: every record by
+    default, for imports that resolve thousands of rows (four queries up front
+    instead of up to four per row), or only those the requests in `items` may
+    name, for saves. A kind no request needs costs no query.
+    """
+
+    def __init__(self, items=None):
+        instructors = InstructorData.objects.all()
+        courses = InstructorCourse.objects.all()
+        programs = Program.objects.all()
+        rooms = Room.objects.all()
+        if items is not None:
+            last_names = set()
+            for data in items:
+                last_names |= possible_last_names(normalize(data.get('instructor_name')))
+            instructors = instructors.filter(
+                reduce(or_, (Q(last_name__iexact=last_name) for last_name in last_names))
+            ) if last_names else instructors.none()
+            courses = courses.filter(course_code__in={data.get('course_code') for data in items} - {None, ''})
+            programs = programs.filter(program_name__in={data.get('program_name') for data in items} - {None, ''})
+            rooms = rooms.filter(room_number__in={data.get('room_number') for data in items} - {None, ''})
+
+        self.instructors = {}
+        for instructor in instructors.values('instructor_id', 'first_name', 'middle_initial', 'last_name'):
+            middle = instructor['middle_initial'] or ''
+            for name in (
+                f"{instructor['first_name']} {middle} {instructor['last_name']}",
+                f"{instructor['last_name']}, {instructor['first_name']} {middle}",
+            ):
+                self.instructors.setdefault(normalize(name), instructor['instructor_id'])
+
+        self.courses = {}
+        for course_id, course_code in courses.order_by('course_id').values_list('course_id', 'course_code'):
+            self.courses.setdefault(course_code, course_id)
+
+        self.programs = {}
+        for program_id, name, code in programs.order_by('program_id').values_list(
+            'program_id', 'program_name', 'program_code',
+        ):
+            self.programs.setdefault((name, code), program_id)
+            self.programs.setdefault((name, None), program_id)
+
+        self.rooms = {}
+        for room_id, number, building_name in rooms.order_by('room_id').values_list(
+            'room_id', 'room_number', 'building__building_name',
+        ):
+            self.rooms.setdefault((number, building_name), room_id)
+            self.rooms.setdefault((number, None), room_id)
+
+    def instructor_id(self, instructor_name):
+        return self.instructors.get(normalize(instructor_name))
+
+    def course_id(self, course_code):
+        return self.courses.get(course_code)
+
+    def program_id(self, program_name, program_code):
+        return self.programs.get((program_name, program_code or None))
+
+    def room_id(self, room_number, building_name):
+        return self.rooms.get((room_number, building_name or None))
+
+    def resolve(self, data, references=None):
+        """Same result as resolve_references(data), without queries; `references` are its posted ids if parsed."""
+        if references is None:
+            references = posted_references(data)
+        if references['instructor_id'] is None:
+            references['instructor_id'] = self.instructor_id(data.get('instructor_name'))
+        if references['course_id'] is None:
+            references['course_id'] = self.course_id(data.get('course_code'))
+        if references['program_id'] is None:
+            references['program_id'] = self.program_id(data.get('program_name'), data.get('program_code'))
+        if references['room_id'] is None:
+            references['room_id'] = self.room_id(data.get('room_number'), data.get('building_name'))
+        return references
@@ -0,0 +1,457 @@
+"""
+Repair of an existing timetable by local search.
+
+Where solver.py builds a timetable from nothing, TimetableRepair starts from
+what is saved in program_schedule, typically entered by hand, and after late
+changes (an instructor leaving, a room closing) looks for the fewest edits
+that make it valid again and, time permitting, better.
+
+The cost of a timetable is the sum of:
+
+* hard violations: two classes sharing an instructor, room or section at
+  once, a class outside its instructor's or room's availability, a class in
+  a closed room or taught by an instructor who left;
+* soft costs: idle gaps in an instructor's day, building changes between
+  back-to-back classes of an instructor or section, lab rooms spent on
+  lectures (Room has no seat count, so lab use stands in for capacity
+  waste), labs held in lecture rooms and overloaded instructors;
+* a change cost for every class moved away from its saved assignment, so a
+  soft improvement is only made when it pays for the disruption.
+
+The search is tabu search. Each iteration picks a class, preferring one
+involved in a hard violation, tries a sample of moves (another room, another
+qualified instructor, a shifted start, one meeting on another day, or back
+to the saved assignment) and takes the cheapest move that is not tabu. Moves
+are scored incrementally: only the (resource, day) lists the class leaves
+and joins are re-costed. A class in a hard violation takes its best move
+even if that costs more, with the reverse move tabu for a while, so the
+search can leave a plateau; other classes only take improving moves. The
+search ends at the time limit or after PATIENCE iterations without a better
+timetable, and the best timetable seen is the result.
+"""
+import random
+import time
+
+from .availability import VALID_DAYS, qualified_course_codes, span_mask, week_masks
+from .conflicts import to_minutes
+from .models import InstructorData, ProgramSchedule
+from .references import normalize
+from .sandbox import Sandbox
+from .search import instructor_name
+from .solver import SHIFT_WINDOWS, Instructor, RoomSlot, is_lab, load_rooms
+
+
+# Weights of the cost (lower is better)
+CONFLICT_COST = 1000
+CLOSED_COST = 1000
+UNAVAILABLE_COST = 500
+OVERLOAD_COST = 50
+ROOM_TYPE_COST = 10
+LAB_WASTE_COST = 3
+BUILDING_CHANGE_COST = 5
+GAP_COST = 1  # per half hour of idle time beyond FREE_BREAK_MINUTES
+CHANGE_COST = 20  # per class moved away from its saved assignment
+
+FREE_BREAK_MINUTES = 60
+BACK_TO_BACK_MINUTES = 15
+
+# Start shifts tried, in minutes
+SHIFTS = (-240, -180, -120, -90, -60, -30, 30, 60, 90, 120, 180, 240)
+# Teaching day for classes whose shift has no window of its own
+DEFAULT_WINDOW = (7 * 60, 21 * 60)
+TEACHING_DAYS = VALID_DAYS[:6]
+
+# Share of picks spent on classes in a hard violation while there are any
+TROUBLED_SHARE = 0.8
+ROOM_SAMPLE = 8
+INSTRUCTOR_SAMPLE = 4
+TABU_TENURE = 15
+# Iterations without a better timetable before giving up early
+PATIENCE = 500
+PROGRESS_SECONDS = 0.5
+
+
+class Assignment:
+    """One saved class: its instructor, room and meetings, and what was saved."""
+
+    __slots__ = ('entry_id', 'course_code', 'credit_hours', 'semester', 'lab', 'window', 'section_key', 'movable',
+                 'instructor', 'room', 'meetings', 'original')
+
+    def __init__(self, entry_id, course_code, credit_hours, semester, lab, shift, section_key, instructor, room,
+                 meetings, movable=True):
+        self.entry_id = entry_id
+        self.course_code = ' '.join((course_code or '').split()).upper()
+        self.credit_hours = credit_hours or 0
+        self.semester = str(semester)
+        self.lab = lab
+        self.window = SHIFT_WINDOWS.get(shift, DEFAULT_WINDOW)
+        self.section_key = section_key
+        self.movable = movable
+        self.instructor = instructor
+        self.room = room
+        self.meetings = tuple(meetings)  # (day, start minute, end minute)
+        self.original = (instructor, room, self.meetings)
+
+    def resources(self):
+        return (('instructor', self.instructor.key), ('room', self.room.key), ('section', self.section_key))
+
+    def day_keys(self):
+        return {(resource, day) for resource in self.resources() for day, _, _ in self.meetings}
+
+    @property
+    def state(self):
+        return self.instructor, self.room, self.meetings
+
+    @property
+    def changed(self):
+        return self.state != self.original
+
+
+def clock(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+class TimetableRepair:
+    def __init__(self, assignments, instructors, rooms, closed_rooms=(), departed=(), seed=0):
+        self.assignments = list(assignments)
+        self.rooms = [room for room in rooms if room.key not in set(closed_rooms)]
+        self.closed_rooms = set(closed_rooms)
+        self.departed = set(departed)
+        self.instructors = {instructor.key: instructor for instructor in instructors}
+        self.qualified = {}
+        for instructor in instructors:
+            if instructor.key in self.departed:
+                continue
+            for code in instructor.qualified:
+                self.qualified.setdefault(code, []).append(instructor)
+        self.movable = [assignment for assignment in self.assignments if assignment.movable]
+        self.random = random.Random(seed)
+
+        self.index = {}       # (resource, day) -> [(start, end, assignment)]
+        self.day_costs = {}   # (resource, day) -> (cost, overlapping pairs)
+        self.own_costs = {}   # entry id -> (cost, hard)
+        self.units = {}       # (instructor key, semester) -> units
+        self.overloads = {}   # (instructor key, semester) -> cost
+        self.conflicted = set()
+        self.hard = set()
+        self.changed = set()
+        self.cost = 0
+        self.overlaps = 0
+        for assignment in self.assignments:
+            self._attach(assignment)
+        self._rescore(set(self.index), self.assignments, set(self.units))
+        self.initial_cost = self.cost
+        self.initial_violations = self.violations
+
+    # Incremental scoring
+
+    def _attach(self, assignment):
+        for resource in assignment.resources():
+            for day, start, end in assignment.meetings:
+                self.index.setdefault((resource, day), []).append((start, end, assignment))
+        key = (assignment.instructor.key, assignment.semester)
+        self.units[key] = self.units.get(key, 0) + assignment.credit_hours
+
+    def _detach(self, assignment):
+        for key in assignment.day_keys():
+            self.index[key] = [meeting for meeting in self.index[key] if meeting[2] is not assignment]
+        self.units[(assignment.instructor.key, assignment.semester)] -= assignment.credit_hours
+
+    def day_cost(self, kind, meetings):
+        """(cost, overlapping pairs) of one resource's day."""
+        ordered = sorted(meetings, key=lambda meeting: meeting[0])
+        cost = overlaps = 0
+        for position, (start, end, _) in enumerate(ordered):
+            for other_start, _, _ in ordered[position + 1:]:
+                if other_start >= end:
+                    break
+                overlaps += 1
+        cost += CONFLICT_COST * overlaps
+        if kind != 'room':
+            latest, previous = None, None
+            for start, end, assignment in ordered:
+                if previous is not None:
+                    idle = start - latest
+                    if kind == 'instructor' and idle > FREE_BREAK_MINUTES:
+                        cost += GAP_COST * -(-(idle - FREE_BREAK_MINUTES) // 30)
+                    if (0 <= idle <= BACK_TO_BACK_MINUTES and previous.room.building and assignment.room.building
+                            and previous.room.building != assignment.room.building):
+                        cost += BUILDING_CHANGE_COST
+                if latest is None or end > latest:
+                    latest, previous = end, assignment
+        return cost, overlaps
+
+    def own_cost(self, assignment):
+        """(cost, hard) of what depends on the class alone."""
+        cost, hard = 0, False
+        instructor, room = assignment.instructor, assignment.room
+        if room.key in self.closed_rooms or instructor.key in self.departed:
+            cost += CLOSED_COST
+            hard = True
+        for day, start, end in assignment.meetings:
+            mask = span_mask(start, end)
+            for availability in (instructor.availability, room.availability):
+                if availability is not None and availability.get(day, 0) & mask != mask:
+                    cost += UNAVAILABLE_COST
+                    hard = True
+            if room.is_lab and not assignment.lab:
+                cost += LAB_WASTE_COST
+            elif assignment.lab and not room.is_lab:
+                cost += ROOM_TYPE_COST
+        if assignment.changed:
+            cost += CHANGE_COST
+        return cost, hard
+
+    def overload_cost(self, key):
+        instructor = self.instructors.get(key[0])
+        if instructor is None:
+            return 0
+        return OVERLOAD_COST * max(self.units.get(key, 0) - instructor.max_units, 0)
+
+    def _rescore(self, keys, assignments, load_keys):
+        for key in keys:
+            old_cost, old_overlaps = self.day_costs.get(key, (0, 0))
+            new_cost, new_overlaps = self.day_cost(key[0][0], self.index.get(key, ()))
+            self.day_costs[key] = (new_cost, new_overlaps)
+            self.cost += new_cost - old_cost
+            self.overlaps += new_overlaps - old_overlaps
+            if new_overlaps:
+                self.conflicted.add(key)
+            else:
+                self.conflicted.discard(key)
+        for assignment in assignments:
+            old_cost, _ = self.own_costs.get(assignment.entry_id, (0, False))
+            new_cost, hard = self.own_costs[assignment.entry_id] = self.own_cost(assignment)
+            self.cost += new_cost - old_cost
+            (self.hard.add if hard else self.hard.discard)(assignment)
+            (self.changed.add if assignment.changed else self.changed.discard)(assignment)
+        for key in load_keys:
+            new_cost = self.overload_cost(key)
+            self.cost += new_cost - self.overloads.get(key, 0)
+            self.overloads[key] = new_cost
+
+    def assign(self, assignment, state):
+        """Give a class a new (instructor, room, meetings) and return the change in cost."""
+        before_cost, before_keys = self.cost, assignment.day_keys()
+        before_instructor = assignment.instructor.key
+        self._detach(assignment)
+        assignment.instructor, assignment.room, assignment.meetings = state
+        self._attach(assignment)
+        self._rescore(before_keys | assignment.day_keys(), [assignment], {
+            (before_instructor, assignment.semester), (assignment.instructor.key, assignment.semester),
+        })
+        return self.cost - before_cost
+
+    @property
+    def violations(self):
+        return self.overlaps + len(self.hard)
+
+    # Neighbourhood
+
+    def pick(self):
+        """
+        The class to move next: mostly one in a hard violation while there are
+        any, otherwise any movable class, so soft costs are worked on even
+        when a violation cannot be cleared.
+        """
+        if self.random.random() < TROUBLED_SHARE:
+            if self.conflicted:
+                meetings = self.index[self.random.choice(tuple(self.conflicted))]
+                movable = [assignment for _, _, assignment in meetings if assignment.movable]
+                if movable:
+                    return self.random.choice(movable)
+            hard = [assignment for assignment in self.hard if assignment.movable]
+            if hard:
+                return self.random.choice(hard)
+        return self.random.choice(self.movable) if self.movable else None
+
+    def troubled(self, assignment):
+        return assignment in self.hard or any(key in self.conflicted for key in assignment.day_keys())
+
+    def moves(self, assignment):
+        """(attribute, state) candidates for one class."""
+        instructor, room, meetings = assignment.state
+        candidates = []
+        if assignment.changed:
+            candidates.append(('restore', assignment.original))
+
+        # Another room of the same campus, and a lab for a lab class
+        rooms = [
+            other for other in self.rooms
+            if other is not room and (other.is_lab or not assignment.lab)
+            and (room.campus is None or other.campus == room.campus)
+        ]
+        for other in self.random.sample(rooms, min(ROOM_SAMPLE, len(rooms))):
+            candidates.append(('room', (instructor, other, meetings)))
+
+        # Saving refuses an overload, so only instructors with units to spare take a class over
+        instructors = [
+            other for other in self.qualified.get(assignment.course_code, ())
+            if other is not instructor
+            and self.units.get((other.key, assignment.semester), 0) + assignment.credit_hours <= other.max_units
+        ]
+        for other in self.random.sample(instructors, min(INSTRUCTOR_SAMPLE, len(instructors))):
+            candidates.append(('instructor', (other, room, meetings)))
+
+        first, last = assignment.window
+        for shift in SHIFTS:
+            shifted = tuple((day, start + shift, end + shift) for day, start, end in meetings)
+            if all(first <= start and end <= last for _, start, end in shifted):
+                candidates.append(('time', (instructor, room, shifted)))
+
+        days = {day for day, _, _ in meetings}
+        for position, (day, start, end) in enumerate(meetings):
+            for other_day in TEACHING_DAYS:
+                if other_day not in days:
+                    moved = meetings[:position] + ((other_day, start, end),) + meetings[position + 1:]
+                    candidates.append(('time', (instructor, room, moved)))
+        return candidates
+
+    # Search
+
+    def run(self, time_limit=10.0, max_iterations=None):
+        """
+        Search for at most `time_limit` seconds, yielding progress dicts along
+        the way; the timetable is left at the best one found.
+        """
+        started = time.monotonic()
+        deadline = started + time_limit
+        best_cost, best = self.cost, {}
+        tabu = {}
+        iteration = idle = 0
+        reported = started
+        yield self.progress(iteration, started, best_cost)
+
+        while time.monotonic() < deadline and (max_iterations is None or iteration < max_iterations):
+            if idle >= PATIENCE:
+                break
+            assignment = self.pick()
+            if assignment is None:
+                break
+            iteration += 1
+            current = assignment.state
+            chosen, chosen_delta = None, None
+            for attribute, state in self.moves(assignment):
+                delta = self.assign(assignment, state)
+                self.assign(assignment, current)
+                # Tabu moves are still taken when they beat the best timetable so far
+                if tabu.get((assignment.entry_id, attribute, state), 0) > iteration and self.cost + delta >= best_cost:
+                    continue
+                if chosen_delta is None or delta < chosen_delta:
+                    chosen, chosen_delta = (attribute, state), delta
+
+            # Only a class in a hard violation may get worse, to get out of it
+            if chosen is None or (chosen_delta >= 0 and not self.troubled(assignment)):
+                idle += 1
+            else:
+                attribute, state = chosen
+                self.assign(assignment, state)
+                tabu[(assignment.entry_id, attribute, current)] = iteration + TABU_TENURE
+                if self.cost < best_cost:
+                    best_cost, idle = self.cost, 0
+                    best = {changed.entry_id: changed.state for changed in self.changed}
+                else:
+                    idle += 1
+
+            now = time.monotonic()
+            if now - reported >= PROGRESS_SECONDS:
+                reported = now
+                yield self.progress(iteration, started, best_cost)
+
+        # Settle on the best timetable seen
+        for assignment in self.assignments:
+            wanted = best.get(assignment.entry_id, assignment.original)
+            if assignment.state != wanted:
+                self.assign(assignment, wanted)
+        yield {**self.progress(iteration, started, best_cost), 'event': 'done'}
+
+    def progress(self, iteration, started, best_cost):
+        return {
+            'event': 'progress',
+            'iteration': iteration,
+            'elapsed': round(time.monotonic() - started, 3),
+            'cost': self.cost,
+            'best': best_cost,
+            'violations': self.violations,
+        }
+
+    def changes(self):
+        """
+        The moved classes, as sandbox moves: program_schedule_id plus the
+        room_id, instructor_id and schedules that changed.
+        """
+        moves = []
+        for assignment in sorted(self.changed, key=lambda assignment: assignment.entry_id):
+            instructor, room, meetings = assignment.original
+            move = {'program_schedule_id': assignment.entry_id}
+            if assignment.instructor is not instructor:
+                move['instructor_id'] = assignment.instructor.key
+            if assignment.room is not room:
+                move['room_id'] = assignment.room.key
+            if assignment.meetings != meetings:
+                move['schedules'] = [[day, clock(start), clock(end)] for day, start, end in assignment.meetings]
+            moves.append(move)
+        return moves
+
+
+def load_repair(semester=None, closed_rooms=(), departed=(), seed=0):
+    """
+    A TimetableRepair over everything saved in program_schedule. Only the
+    classes of `semester` (all, when None) may be moved; the others stay put
+    but still block their instructors, rooms and sections, as in
+    save_program_schedule. Runs three queries.
+    """
+    instructors = [
+        Instructor(
+            key=instructor.instructor_id,
+            name=instructor_name(instructor.first_name, instructor.middle_initial, instructor.last_name),
+            qualified=qualified_course_codes(instructor.qualified_course),
+            availability=week_masks(instructor),
+            employment_type=(instructor.employment_type or 'regular').lower(),
+        )
+        for instructor in InstructorData.objects.all()
+    ]
+    rooms = load_rooms()
+    instructors_by_id = {instructor.key: instructor for instructor in instructors}
+    rooms_by_id = {room.key: room for room in rooms}
+    # Unlinked names and numbers stand for resources of their own, without availability
+    unlinked = {}
+
+    assignments = []
+    for entry in ProgramSchedule.objects.prefetch_related('schedules').order_by('id'):
+        meetings = [
+            (schedule.day, to_minutes(schedule.start_time), to_minutes(schedule.end_time))
+            for schedule in entry.schedules.all()
+        ]
+        if not meetings:
+            continue
+        instructor = instructors_by_id.get(entry.instructor_id)
+        if instructor is None:
+            key = ('name', normalize(entry.instructor_name))
+            instructor = unlinked.setdefault(key, Instructor(key, entry.instructor_name, set(), None,
+                                                             max_units=float('inf')))
+        room = rooms_by_id.get(entry.room_id)
+        if room is None:
+            key = ('number', normalize(entry.room_number))
+            room = unlinked.setdefault(key, RoomSlot(key, entry.room_number, entry.room_type, None,
+                                                     building=entry.building_name or None,
+                                                     campus=entry.campus_name or None))
+        assignments.append(Assignment(
+            entry.id, entry.course_code, entry.credit_hours, entry.semester, is_lab(entry.course_code) or is_lab(entry.course_name),
+            entry.shift, (entry.program_id or normalize(entry.program_name), entry.year_level, entry.section,
+                          entry.shift),
+            instructor, room, meetings,
+            movable=semester is None or str(entry.semester) == str(semester),
+        ))
+    return TimetableRepair(assignments, instructors, rooms, closed_rooms=closed_rooms, departed=departed, seed=seed)
+
+
+def propose(moves):
+    """A saved sandbox holding `moves` (TimetableRepair.changes()), to review and commit like any other."""
+    sandbox = Sandbox()
+    for move in moves:
+        sandbox.move(move['program_schedule_id'], {
+            name: value for name, value in move.items() if name != 'program_schedule_id'
+        })
+    sandbox.save()
+    return sandbox
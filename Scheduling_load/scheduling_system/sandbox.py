@@ -0,0 +1,307 @@
+"""
+What-if sandboxes: proposed moves of saved classes, checked and reviewed
+before anything is written.
+
+A sandbox holds, per moved ProgramSchedule, its committed state ('before')
+and the proposed one ('after'). A proposal is checked against slot_occupancy,
+leaving out the rows of moved entries, with one indexed query for a move and
+one for a whole diff; the database is the same in every worker process, so a
+class deleted or moved by another one stops conflicting at once. The other
+proposals live in a small in-memory ConflictIndex overlay.
+
+Sandboxes are kept in the Django cache as plain JSON-friendly dicts, which
+lets every worker process serve them; the overlay is rebuilt from the
+proposals on load, without queries. commit() writes every change in one
+transaction under the resource locks, re-checking against the database
+(slot_occupancy), and refuses entries changed by someone else since they
+were moved into the sandbox.
+"""
+import uuid
+from datetime import datetime
+
+from django.core.cache import cache
+
+from .availability import VALID_DAYS
+from .conflicts import ConflictIndex, label_conflicts, resource_keys
+from .loads import add_load, refresh_instructor
+from .locks import locked
+from .models import InstructorData, ProgramSchedule, Room, Schedule
+from .search import instructor_name
+from .slot_occupancy import find_batch_clashes, find_batch_conflicts, occupy
+from .utilization import refresh_room
+from .versioning import bump_version_on_commit
+
+
+# Idle sandboxes are dropped after a working day
+SANDBOX_TIMEOUT = 8 * 60 * 60
+
+# The ProgramSchedule columns a sandbox tracks; schedules are [day, 'HH:MM', 'HH:MM'] lists
+STATE_FIELDS = (
+    'instructor_id', 'instructor_name', 'course_code', 'credit_hours', 'semester',
+    'program_id', 'program_name', 'section', 'year_level', 'shift',
+    'room_id', 'room_number', 'room_type', 'building_name', 'campus_name',
+)
+
+# What a move may change, besides 'schedules'
+MOVE_FIELDS = ('room_id', 'instructor_id', 'section', 'year_level', 'shift')
+
+VALID_DAY_ORDER = {day: position for position, day in enumerate(VALID_DAYS)}
+
+
+class Stale(Exception):
+    """Entries changed in the database since they were moved into the sandbox."""
+
+    def __init__(self, entry_ids):
+        self.entry_ids = entry_ids
+        super().__init__(f"Changed since they were moved: {', '.join(map(str, entry_ids))}")
+
+
+class Rejected(Exception):
+    """Rolls a commit back, carrying the conflicts found under the locks."""
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f"{len(conflicts)} conflicts")
+
+
+def sandbox_key(sandbox_id):
+    return f'scheduling_system:sandbox:{sandbox_id}'
+
+
+def parse_time(value):
+    return datetime.strptime(value, "%H:%M").time()
+
+
+def entry_states(entry_ids):
+    """{id: state} of saved entries, in two queries."""
+    states = {
+        row['id']: {**row, 'schedules': []}
+        for row in ProgramSchedule.objects.filter(id__in=entry_ids).values('id', *STATE_FIELDS)
+    }
+    meetings = Schedule.objects.filter(program_schedule_id__in=entry_ids).order_by('day', 'start_time')
+    for entry_id, day, start_time, end_time in meetings.values_list(
+        'program_schedule_id', 'day', 'start_time', 'end_time',
+    ):
+        states[entry_id]['schedules'].append([day, start_time.strftime("%H:%M"), end_time.strftime("%H:%M")])
+    for state in states.values():
+        del state['id']
+        state['schedules'].sort(key=lambda meeting: (VALID_DAY_ORDER.get(meeting[0], 7), meeting[1]))
+    return states
+
+
+def state_slots(state):
+    return [(day, parse_time(start), parse_time(end)) for day, start, end in state['schedules']]
+
+
+def state_resources(state):
+    return {name: state[name] for name in (
+        'instructor_name', 'room_number', 'program_name', 'section', 'year_level', 'shift',
+        'instructor_id', 'room_id', 'program_id',
+    )}
+
+
+class Sandbox:
+    def __init__(self, sandbox_id=None, changes=None):
+        self.id = sandbox_id or uuid.uuid4().hex
+        self.changes = changes or {}  # ProgramSchedule id -> {'before': state, 'after': state}
+        self.overlay = ConflictIndex()
+        self._next_row = 0
+        for entry_id in self.changes:
+            self._propose(entry_id)
+
+    @classmethod
+    def load(cls, sandbox_id):
+        """The saved sandbox, or None when unknown or expired."""
+        data = cache.get(sandbox_key(sandbox_id))
+        if data is None:
+            return None
+        return cls(sandbox_id, {int(entry_id): change for entry_id, change in data.items()})
+
+    def save(self):
+        cache.set(sandbox_key(self.id), self.changes, SANDBOX_TIMEOUT)
+
+    def discard(self):
+        cache.delete(sandbox_key(self.id))
+
+    def _propose(self, entry_id):
+        """(Re)index the proposed meetings of one entry in the overlay."""
+        self.overlay.discard_entry(entry_id)
+        state = self.changes[entry_id]['after']
+        for day, start_time, end_time in state_slots(state):
+            # Overlay rows get ids of their own, below any saved Schedule id
+            self._next_row -= 1
+            self.overlay.add_row({
+                'id': self._next_row,
+                'program_schedule_id': entry_id,
+                **{f'program_schedule__{name}': state[name] for name in (
+                    'instructor_name', 'course_code', 'room_number', 'program_name', 'section', 'year_level',
+                    'shift', 'instructor_id', 'room_id', 'program_id',
+                )},
+                'day': day,
+                'start_time': start_time,
+                'end_time': end_time,
+            })
+
+    def move(self, entry_id, changes):
+        """
+        Propose new values for a saved entry: any of MOVE_FIELDS and
+        'schedules' (a list of (day, 'HH:MM', 'HH:MM')). Moving an entry again
+        starts from its proposed state. Raises LookupError for an unknown
+        entry, room or instructor and ValueError for malformed values.
+        """
+        if entry_id in self.changes:
+            before, state = self.changes[entry_id]['before'], dict(self.changes[entry_id]['after'])
+        else:
+            before = entry_states([entry_id]).get(entry_id)
+            if before is None:
+                raise LookupError(f"Program schedule {entry_id} does not exist.")
+            state = dict(before)
+
+        unknown = set(changes) - {*MOVE_FIELDS, 'schedules'}
+        if unknown:
+            raise ValueError(f"Cannot move {', '.join(sorted(unknown))}.")
+        if changes.get('room_id') is not None:
+            room = Room.objects.filter(room_id=int(changes['room_id'])).values(
+                'room_id', 'room_number', 'room_type', 'building__building_name', 'campus__campus_name',
+            ).first()
+            if room is None:
+                raise LookupError(f"Room {changes['room_id']} does not exist.")
+            state.update(room_id=room['room_id'], room_number=room['room_number'], room_type=room['room_type'],
+                         building_name=room['building__building_name'], campus_name=room['campus__campus_name'])
+        if changes.get('instructor_id') is not None:
+            instructor = InstructorData.objects.filter(instructor_id=int(changes['instructor_id'])).values(
+                'instructor_id', 'first_name', 'middle_initial', 'last_name',
+            ).first()
+            if instructor is None:
+                raise LookupError(f"Instructor {changes['instructor_id']} does not exist.")
+            state.update(instructor_id=instructor['instructor_id'], instructor_name=instructor_name(
+                instructor['first_name'], instructor['middle_initial'], instructor['last_name'],
+            ))
+        for field in ('section', 'year_level', 'shift'):
+            if changes.get(field):
+                state[field] = str(changes[field])
+        if 'schedules' in changes:
+            schedules = [[str(day), str(start), str(end)] for day, start, end in changes['schedules']]
+            for day, start, end in schedules:
+                if day not in VALID_DAY_ORDER:
+                    raise ValueError(f"Invalid day '{day}'.")
+                if parse_time(start) >= parse_time(end):
+                    raise ValueError("End time must be later than the start time.")
+            if not schedules:
+                raise ValueError("At least one schedule is required.")
+            state['schedules'] = schedules
+
+        if state == before:
+            self.revert(entry_id)
+        else:
+            self.changes[entry_id] = {'before': before, 'after': state}
+            self._propose(entry_id)
+        return self.check(entry_id)
+
+    def revert(self, entry_id):
+        """Drop the proposal for one entry."""
+        if self.changes.pop(entry_id, None) is not None:
+            self.overlay.discard_entry(entry_id)
+
+    def check(self, entry_id):
+        """
+        Conflicts of one entry's proposal: the committed rows of the resources
+        it books, minus moved entries, and the other proposals. Conflicts with
+        a proposal carry 'proposed' True. Empty for an entry without changes.
+        """
+        return self.conflicts([entry_id]).get(entry_id, [])
+
+    def conflicts(self, entry_ids):
+        """{entry id: check()} for the given moved entries, with one query."""
+        entry_ids = [entry_id for entry_id in entry_ids if entry_id in self.changes]
+        states = [self.changes[entry_id]['after'] for entry_id in entry_ids]
+        checks = [(state_slots(state), state_resources(state), state['course_code']) for state in states]
+        found = {entry_id: [] for entry_id in entry_ids}
+        if checks:
+            for conflict in find_batch_conflicts(checks, exclude=list(self.changes)):
+                found[entry_ids[conflict.pop('class')]].append(conflict)
+        for entry_id, (slots, resources, _) in zip(entry_ids, checks):
+            found[entry_id] += [
+                {**conflict, 'proposed': True}
+                for conflict in self.overlay.find_conflicts(slots, exclude={entry_id}, **resources)
+            ]
+            label_conflicts(found[entry_id], **resources)
+        return found
+
+    def diff(self):
+        """Every proposed change with its before and after state and its current conflicts."""
+        conflicts = self.conflicts(sorted(self.changes))
+        return [
+            {'program_schedule_id': entry_id, **change, 'conflicts': conflicts[entry_id]}
+            for entry_id, change in sorted(self.changes.items())
+        ]
+
+    def commit(self):
+        """
+        Apply every change in one transaction and return the updated entry
+        ids. Raises Stale if an entry no longer matches its 'before' state and
+        Rejected with the database's conflicts; Overload and IntegrityError
+        pass through. Nothing is written unless everything is.
+        """
+        entry_ids = sorted(self.changes)
+        afters = [self.changes[entry_id]['after'] for entry_id in entry_ids]
+        checks = [(state_slots(state), state_resources(state), state['course_code']) for state in afters]
+        keys = [
+            key
+            for entry_id in entry_ids for state in self.changes[entry_id].values()
+            for key in resource_keys(**state_resources(state))
+        ]
+
+        def save():
+            current = entry_states(entry_ids)
+            stale = [entry_id for entry_id in entry_ids if current.get(entry_id) != self.changes[entry_id]['before']]
+            if stale:
+                raise Stale(stale)
+            # The entries' own meetings go first (and their slot_occupancy rows with them),
+            # so a proposal may take over slots another moved entry gives up
+            Schedule.objects.filter(program_schedule_id__in=entry_ids).delete()
+            conflicts = find_batch_conflicts(checks) + find_batch_clashes(checks)
+            if conflicts:
+                for conflict in conflicts:
+                    conflict['program_schedule_id'] = entry_ids[conflict.pop('class')]
+                    if 'batch_class' in conflict:
+                        conflict['batch_program_schedule_id'] = entry_ids[conflict.pop('batch_class')]
+                    label_conflicts([conflict], **state_resources(self.changes[conflict['program_schedule_id']]['after']))
+                raise Rejected(conflicts)
+
+            for entry_id, state in zip(entry_ids, afters):
+                before = self.changes[entry_id]['before']
+                ProgramSchedule.objects.filter(id=entry_id).update(**{
+                    field: state[field] for field in STATE_FIELDS if state[field] != before[field]
+                })
+                if state['instructor_id'] is not None and state['instructor_id'] != before['instructor_id']:
+                    # Taking over a class must not overload the new instructor
+                    add_load(state['instructor_id'], state['semester'], state['credit_hours'] or 0,
+                             state_slots(state))
+            schedules = Schedule.objects.bulk_create([
+                Schedule(program_schedule_id=entry_id, day=day, start_time=start_time, end_time=end_time)
+                for entry_id, (slots, _, _) in zip(entry_ids, checks)
+                for day, start_time, end_time in slots
+            ])
+            occupy([
+                (ProgramSchedule(id=entry_id), [
+                    schedule for schedule in schedules if schedule.program_schedule_id == entry_id
+                ], resources)
+                for entry_id, (_, resources, _) in zip(entry_ids, checks)
+            ])
+            # Recount everything the moves touched, on both sides
+            for change in self.changes.values():
+                for state in change.values():
+                    refresh_room(state['room_id'], state['semester'])
+                    refresh_instructor(state['instructor_id'], state['semester'])
+            # The updates send no signals; the deletes only name the rooms left
+            bump_version_on_commit('schedule', [
+                ('room', state['room_id'], state['room_number']) for state in afters
+            ])
+            return schedules
+
+        locked(keys, save)
+        self.changes = {}
+        self.overlay = ConflictIndex()
+        return entry_ids
+
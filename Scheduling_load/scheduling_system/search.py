@@ -0,0 +1,285 @@
+"""
+In-process n-gram search for the autocomplete endpoints.
+
+One SearchIndex per searchable model (instructors, courses, programs, rooms)
+is built on first use and rebuilt lazily when the model's version is bumped
+(see signals.py). Each document keeps the JSON payload its search view
+returns, so a query never touches the database.
+
+Words are indexed by their padded trigrams ("it" -> "$$i", "$it", "it$"), so a
+query word finds every indexed word sharing enough trigrams with it: prefixes
+rank high and one or two typos still match. A document scores the sum over
+query words of its best-matching word, and only the best `limit` are returned.
+
+Results are paged with opaque `after` cursors: "score:id" of the last ranked
+match, or the last primary key when an empty query lists the table in id order.
+"""
+import heapq
+import re
+import threading
+
+from asgiref.sync import sync_to_async
+
+from .models import InstructorCourse, InstructorData, Program, Room
+from .versioning import get_version
+
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Minimum trigram similarity for a word to count as a (fuzzy) match
+MIN_SIMILARITY = 0.3
+# Words with fewer trigrams than this must match by prefix
+MIN_FUZZY_TRIGRAMS = 4
+
+WORD_RE = re.compile(r'[0-9a-z]+')
+
+
+def words(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+def trigrams(word):
+    padded = f'$${word}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    """`limit` query parameter clamped to 1..MAX_LIMIT; ValueError when malformed."""
+    if value in (None, ''):
+        return default
+    try:
+        return max(1, min(int(value), MAX_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+
+
+def parse_fields(value, allowed, default):
+    """Columns named in a `fields=a,b` parameter; ValueError for unknown ones."""
+    if not value:
+        return list(default)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_rank_cursor(value):
+    """(score, doc id) of a ranked search cursor, None when missing."""
+    if not value:
+        return None
+    try:
+        score, doc_id = value.split(':')
+        return float(score), int(doc_id)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+def parse_id_cursor(value):
+    """Last primary key of a listing cursor, None when missing."""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+def project(payloads, fields):
+    return [{field: payload[field] for field in fields} for payload in payloads]
+
+
+def keyset_page(rows, pk, limit, after=None):
+    """
+    One page of a .values() queryset in primary key order, and the cursor of
+    the next page (None on the last one).
+    """
+    rows = rows.order_by(pk)
+    if after is not None:
+        rows = rows.filter(**{f'{pk}__gt': after})
+    rows = list(rows[:limit + 1])
+    if len(rows) > limit:
+        return rows[:limit], str(rows[limit - 1][pk])
+    return rows, None
+
+
+async def akeyset_page(rows, pk, limit, after=None):
+    """keyset_page for async views."""
+    rows = rows.order_by(pk)
+    if after is not None:
+        rows = rows.filter(**{f'{pk}__gt': after})
+    rows = [row async for row in rows[:limit + 1]]
+    if len(rows) > limit:
+        return rows[:limit], str(rows[limit - 1][pk])
+    return rows, None
+
+
+class SearchIndex:
+    def __init__(self, version):
+        self.version = version
+        self.documents = {}     # doc id -> (payload, filter values)
+        self.word_docs = {}     # word -> set of doc ids
+        self.word_trigrams = {}  # word -> set of trigrams
+        self.trigram_words = {}  # trigram -> set of words
+
+    def add(self, doc_id, text, payload, filters=None):
+        self.documents[doc_id] = (payload, filters or {})
+        for word in set(words(text)):
+            docs = self.word_docs.get(word)
+            if docs is None:
+                docs = self.word_docs[word] = set()
+                grams = self.word_trigrams[word] = trigrams(word)
+                for gram in grams:
+                    self.trigram_words.setdefault(gram, set()).add(word)
+            docs.add(doc_id)
+
+    def similar_words(self, word):
+        """{indexed word: similarity} for one query word."""
+        grams = trigrams(word)
+        shared = {}
+        for gram in grams:
+            for candidate in self.trigram_words.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        matches = {}
+        for candidate, common in shared.items():
+            if candidate == word:
+                score = 1.0
+            elif candidate.startswith(word):
+                # Prefix of a longer word: close behind an exact match
+                score = 0.9 + 0.1 * len(word) / len(candidate)
+            elif len(grams) < MIN_FUZZY_TRIGRAMS:
+                continue
+            else:
+                score = common / (len(grams) + len(self.word_trigrams[candidate]) - common)
+                if score < MIN_SIMILARITY:
+                    continue
+                score *= 0.8
+            matches[candidate] = score
+        return matches
+
+    def search(self, query, limit=DEFAULT_LIMIT, after=None, **filters):
+        """
+        Payloads of the best `limit` documents for `query`, best first, and the
+        cursor of the next page (None on the last one). `after` is a parsed
+        cursor from parse_rank_cursor.
+        """
+        scores = {}
+        for word in set(words(query)):
+            best = {}
+            for candidate, score in self.similar_words(word).items():
+                for doc_id in self.word_docs[candidate]:
+                    if score > best.get(doc_id, 0):
+                        best[doc_id] = score
+            for doc_id, score in best.items():
+                scores[doc_id] = scores.get(doc_id, 0) + score
+
+        if filters:
+            # Case-insensitive containment, like the __icontains filters it replaces
+            wanted = {key: str(value).lower() for key, value in filters.items()}
+            scores = {
+                doc_id: score for doc_id, score in scores.items()
+                if all(value in str(self.documents[doc_id][1].get(key) or '').lower() for key, value in wanted.items())
+            }
+        # Ties keep the database order (lower id first)
+        ranked = ((-score, doc_id) for doc_id, score in scores.items())
+        if after is not None:
+            after = (-after[0], after[1])
+            ranked = (key for key in ranked if key > after)
+        best = heapq.nsmallest(limit + 1, ranked)
+        cursor = None
+        if len(best) > limit:
+            best = best[:limit]
+            cursor = f'{-best[-1][0]!r}:{best[-1][1]}'
+        return [self.documents[doc_id][0] for _, doc_id in best], cursor
+
+
+def instructor_name(first_name, middle_initial, last_name):
+    return f"{first_name} {middle_initial or ''} {last_name}".strip()
+
+
+def build_instructor_index(version):
+    index = SearchIndex(version)
+    rows = InstructorData.objects.values(
+        'instructor_id', 'first_name', 'middle_initial', 'last_name', 'employment_type', 'qualified_course',
+    ).order_by('instructor_id')
+    for row in rows.iterator(chunk_size=2000):
+        name = instructor_name(row['first_name'], row['middle_initial'], row['last_name'])
+        index.add(row['instructor_id'], name, {
+            'name': name,
+            'instructor_id': row['instructor_id'],
+            'employment_type': row['employment_type'],
+            'qualified_course': row['qualified_course'],
+        }, {'employment_type': row['employment_type']})
+    return index
+
+
+def build_course_index(version):
+    index = SearchIndex(version)
+    rows = InstructorCourse.objects.values('course_id', 'course_code', 'course_name').order_by('course_id')
+    for row in rows.iterator(chunk_size=2000):
+        # "IT101" and "IT 101" should both find "IT 101"
+        code = row['course_code'] or ''
+        text = f"{code} {code.replace(' ', '')} {row['course_name'] or ''}"
+        index.add(row['course_id'], text, {
+            'course_code': row['course_code'],
+            'course_name': row['course_name'],
+            'course_id': row['course_id'],
+        })
+    return index
+
+
+def build_program_index(version):
+    index = SearchIndex(version)
+    rows = Program.objects.values('program_id', 'program_name', 'program_code').order_by('program_id')
+    for row in rows.iterator(chunk_size=2000):
+        index.add(row['program_id'], f"{row['program_name'] or ''} {row['program_code'] or ''}", {
+            'program_id': row['program_id'],
+            'program_name': row['program_name'],
+            'program_code': row['program_code'],
+        })
+    return index
+
+
+def build_room_index(version):
+    index = SearchIndex(version)
+    rows = Room.objects.values(
+        'room_id', 'room_number', 'room_type', 'building__building_name', 'campus__campus_name',
+    ).order_by('room_id')
+    for row in rows.iterator(chunk_size=2000):
+        number = row['room_number'] or ''
+        index.add(row['room_id'], f"{number} {number.replace(' ', '')}", {
+            'room_id': row['room_id'],
+            'room_number': row['room_number'],
+            'room_type': row['room_type'],
+            'building_name': row['building__building_name'],
+            'campus_name': row['campus__campus_name'],
+        }, {'building': row['building__building_name'], 'campus': row['campus__campus_name']})
+    return index
+
+
+BUILDERS = {
+    'instructor': build_instructor_index,
+    'course': build_course_index,
+    'program': build_program_index,
+    'room': build_room_index,
+}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(name):
+    """The search index for 'instructor', 'course', 'program' or 'room', rebuilt when stale."""
+    version = get_version(name)
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None or index.version != version:
+            index = _indexes[name] = BUILDERS[name](version)
+        return index
+
+
+async def aget_search_index(name):
+    """get_search_index for async views; a rebuild runs on the sync ORM thread."""
+    return await sync_to_async(get_search_index)(name)
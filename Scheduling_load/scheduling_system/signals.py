@@ -0,0 +1,86 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .loads import refresh_instructor
+from .models import (
+    Building, Campus, InstructorCourse, InstructorData, InstructorLoad, Program, ProgramSchedule, Room, Schedule,
+)
+from .slot_occupancy import rebook
+from .utilization import refresh_room
+from .versioning import bump_version_on_commit
+
+
+# Schedule rows are written with bulk_create (no signals), always together
+# with their ProgramSchedule, so that model stands in for both on save. The
+# notes name the rooms touched (see occupancy.py): the entry's current room,
+# and through 'entry' whichever room its meetings were in before.
+@receiver(post_save, sender=ProgramSchedule)
+@receiver(post_delete, sender=ProgramSchedule)
+def schedules_changed(sender, instance, created=False, **kwargs):
+    changes = [('room', instance.room_id, instance.room_number)]
+    if not created:
+        changes.append(('entry', instance.pk))
+    bump_version_on_commit('schedule', changes)
+
+
+@receiver(post_delete, sender=Schedule)
+def schedule_deleted(sender, instance, **kwargs):
+    bump_version_on_commit('schedule', [('entry', instance.program_schedule_id)])
+
+
+# Saves book slot_occupancy themselves after their bulk_create; rows saved one
+# by one (the admin) or edited afterwards are booked again here. Deletes cascade.
+@receiver(post_save, sender=Schedule)
+def book_saved_schedule(sender, instance, **kwargs):
+    rebook(Schedule.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=ProgramSchedule)
+def rebook_edited_entry(sender, instance, created, **kwargs):
+    if not created:
+        rebook(Schedule.objects.filter(program_schedule=instance))
+
+
+# Saves add to the room and instructor totals themselves; a delete can only
+# be undone by recounting what is left.
+@receiver(post_delete, sender=ProgramSchedule)
+def refresh_totals(sender, instance, **kwargs):
+    refresh_room(instance.room_id, instance.semester)
+    refresh_instructor(instance.instructor_id, instance.semester)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=Building)
+@receiver(post_delete, sender=Building)
+@receiver(post_save, sender=Campus)
+@receiver(post_delete, sender=Campus)
+def rooms_changed(sender, **kwargs):
+    bump_version_on_commit('room')
+
+
+@receiver(post_save, sender=InstructorData)
+@receiver(post_delete, sender=InstructorData)
+def instructors_changed(sender, **kwargs):
+    bump_version_on_commit('instructor')
+
+
+# The load rows carry the employment type their overload limit depends on
+@receiver(post_save, sender=InstructorData)
+def copy_employment_type(sender, instance, created, **kwargs):
+    if not created:
+        InstructorLoad.objects.filter(instructor=instance).exclude(
+            employment_type=(instance.employment_type or 'regular').lower(),
+        ).update(employment_type=(instance.employment_type or 'regular').lower())
+
+
+@receiver(post_save, sender=InstructorCourse)
+@receiver(post_delete, sender=InstructorCourse)
+def courses_changed(sender, **kwargs):
+    bump_version_on_commit('course')
+
+
+@receiver(post_save, sender=Program)
+@receiver(post_delete, sender=Program)
+def programs_changed(sender, **kwargs):
+    bump_version_on_commit('program')
@@ -0,0 +1,354 @@
+"""
+Materialized weekly occupancy: one slot_occupancy row per resource, day and
+15-minute slot that a Schedule row books.
+
+A resource is stored under its locks.lock_key (e.g. 'room_id:12'). A clash
+is then a lookup on the unique (resource, day, slot) index instead of an
+interval overlap scan of program_schedule, and the unique
+constraint on those columns means the database refuses a double-booking even
+if every check above it were skipped. The rows are written in the saving
+transaction and go away with their Schedule row (ON DELETE CASCADE).
+
+Each entry books one key per resource: its foreign key when it is linked,
+else the text snapshot (conflicts.resource_keys gives both for linked rows).
+Lookups still ask for every key of the new entry, so a linked entry is
+caught by an unlinked holder of the same name through the text key, while
+two instructors who merely share a name no longer block each other. The
+reverse is not caught: an unlinked entry asks for text keys only, and a
+linked holder books none. Saves link posted names to their master records
+first (references.py), so an entry stays unlinked only when no record
+matches its text.
+
+Times are booked on the 15-minute grid of availability.py, which is coarser
+than the exact interval check: a class ending at 09:10 holds the 09:00-09:15
+slot, so another starting at 09:10 in the same room is reported as a clash.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from .availability import SLOT_MINUTES, VALID_DAYS
+from .conflicts import CONFLICT_FIELDS, REFERENCE_FIELDS, resource_keys, to_minutes
+from .locks import lock_key
+from .models import Schedule, SlotOccupancy
+
+
+# Text kind -> the foreign key kind that replaces it in the bookings
+LINKED_KINDS = {'instructor': 'instructor_id', 'room': 'room_id', 'section': 'section_id'}
+
+# Columns of a Schedule row needed to book it
+BOOKING_FIELDS = (
+    'id', 'day', 'start_time', 'end_time',
+    'program_schedule__instructor_name',
+    'program_schedule__room_number',
+    'program_schedule__program_name',
+    'program_schedule__section',
+    'program_schedule__year_level',
+    'program_schedule__shift',
+    'program_schedule__instructor_id',
+    'program_schedule__room_id',
+    'program_schedule__program_id',
+)
+
+
+def slot_range(start_time, end_time):
+    """The 15-minute slots touched by [start_time, end_time), like availability.span_mask."""
+    return range(to_minutes(start_time) // SLOT_MINUTES, -(-to_minutes(end_time) // SLOT_MINUTES))
+
+
+def owned_keys(**resources):
+    """The keys an entry books: resource_keys without the text keys of linked resources."""
+    keys = resource_keys(**resources)
+    kinds = {kind for kind, _ in keys}
+    return [lock_key(kind, value) for kind, value in keys if LINKED_KINDS.get(kind) not in kinds]
+
+
+def lookup_keys(**resources):
+    """The keys a check of an entry asks for: every key of resource_keys."""
+    return {lock_key(kind, value) for kind, value in resource_keys(**resources)}
+
+
+def row_resources(row):
+    """resource_keys() arguments of a row with the BOOKING_FIELDS columns."""
+    return {name: row[f'program_schedule__{name}'] for name in (
+        'instructor_name', 'room_number', 'program_name', 'section', 'year_level', 'shift',
+        'instructor_id', 'room_id', 'program_id',
+    )}
+
+
+def schedule_resources(program_schedule):
+    """resource_keys() arguments of a ProgramSchedule, saved or not."""
+    return {name: getattr(program_schedule, name) for name in (
+        'instructor_name', 'room_number', 'program_name', 'section', 'year_level', 'shift',
+        'instructor_id', 'room_id', 'program_id',
+    )}
+
+
+def occupancy_rows(schedule_id, day, start_time, end_time, keys, model=SlotOccupancy):
+    """Unsaved rows booking `keys` for one meeting; none for a day outside VALID_DAYS."""
+    if day not in VALID_DAYS:
+        return []
+    day_index = VALID_DAYS.index(day)
+    return [
+        model(schedule_id=schedule_id, resource=key, day=day_index, slot=slot)
+        for key in keys
+        for slot in slot_range(start_time, end_time)
+    ]
+
+
+def write_rows(rows, batch_size=None, ignore_conflicts=False):
+    """
+    Insert the bookings of `rows` (dicts with BOOKING_FIELDS). Raises
+    IntegrityError on a double-booking unless `ignore_conflicts`, which keeps
+    whichever booking of a slot was written first.
+    """
+    occupancy = []
+    for row in rows:
+        occupancy += occupancy_rows(row['id'], row['day'], row['start_time'], row['end_time'],
+                                    owned_keys(**row_resources(row)))
+    SlotOccupancy.objects.bulk_create(occupancy, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+    return len(occupancy)
+
+
+def occupy(bookings):
+    """
+    Book freshly created Schedule rows in the current transaction, with one
+    insert. `bookings` is a list of (program_schedule, its schedules,
+    resources). Raises IntegrityError if another entry holds one of the slots.
+    """
+    if any(schedule.pk is None for _, schedules, _ in bookings for schedule in schedules):
+        # bulk_create could not return the ids (MySQL): read back the entries' meetings not booked yet
+        rows = Schedule.objects.filter(
+            program_schedule_id__in=[program_schedule.pk for program_schedule, _, _ in bookings],
+            occupancy__isnull=True,
+        ).values(*BOOKING_FIELDS)
+        return write_rows(rows)
+    occupancy = []
+    for _, schedules, resources in bookings:
+        keys = owned_keys(**resources)
+        for schedule in schedules:
+            occupancy += occupancy_rows(schedule.pk, schedule.day, schedule.start_time, schedule.end_time, keys)
+    SlotOccupancy.objects.bulk_create(occupancy)
+    return len(occupancy)
+
+
+def occupy_entries(entry_ids, ignore_conflicts=False, batch_size=2000):
+    """Book every Schedule row of the given ProgramSchedule ids, e.g. after a bulk import."""
+    rows = Schedule.objects.filter(program_schedule_id__in=entry_ids).values(*BOOKING_FIELDS)
+    return write_rows(rows, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+
+
+def rebook(schedules):
+    """Replace the bookings of `schedules` (a Schedule queryset) after an edit."""
+    with transaction.atomic():
+        SlotOccupancy.objects.filter(schedule__in=schedules).delete()
+        return write_rows(schedules.values(*BOOKING_FIELDS))
+
+
+def rebuild_occupancy(batch_size=5000):
+    """
+    Recompute slot_occupancy from program_schedule. Returns (bookings,
+    clashes): clashes are the slots already double-booked in the data, of
+    which only the first booking is kept.
+    """
+    with transaction.atomic():
+        SlotOccupancy.objects.all().delete()
+        rows = Schedule.objects.order_by('id').values(*BOOKING_FIELDS).iterator(chunk_size=batch_size)
+        wanted, batch = 0, []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                wanted += write_rows(batch, batch_size=batch_size, ignore_conflicts=True)
+                batch = []
+        wanted += write_rows(batch, batch_size=batch_size, ignore_conflicts=True)
+        booked = SlotOccupancy.objects.count()
+    return booked, wanted - booked
+
+
+def occupancy_query(slots, **resources):
+    """The saved entries holding a slot of `slots` for one of the resources, as a .values() queryset."""
+    return holders_query(lookup_keys(**resources), slots)
+
+
+def holders_query(keys, slots, exclude=()):
+    """
+    The saved entries holding a slot of `slots` under one of `keys`, leaving
+    out the rows of the ProgramSchedule ids in `exclude`; None when nothing to
+    check.
+    """
+    keys = sorted(keys)
+    wanted = {}
+    for day, start_time, end_time in slots:
+        if day in VALID_DAYS:
+            wanted.setdefault(VALID_DAYS.index(day), set()).update(slot_range(start_time, end_time))
+    if not keys or not wanted:
+        return None
+
+    # Days with the same slots (a class meeting at one time on MWF) share a term,
+    # so most checks are a single resource IN x day IN x slot IN probe of the index
+    days_by_slots = {}
+    for day, day_slots in wanted.items():
+        days_by_slots.setdefault(tuple(sorted(day_slots)), []).append(day)
+    held = Q()
+    for day_slots, days in days_by_slots.items():
+        held |= Q(resource__in=keys, day__in=days, slot__in=day_slots)
+    holders = SlotOccupancy.objects.filter(held).values('schedule_id')
+    schedules = Schedule.objects.filter(id__in=holders)
+    if exclude:
+        schedules = schedules.exclude(program_schedule_id__in=exclude)
+    return schedules.order_by('day', 'start_time').values(*CONFLICT_FIELDS, *REFERENCE_FIELDS)
+
+
+def group_held(slots, rows):
+    """Group the holders back onto the submitted slots whose 15-minute slots they share."""
+    conflicts = []
+    for position, (day, start_time, end_time) in enumerate(slots):
+        wanted = slot_range(start_time, end_time)
+        for row in rows:
+            held = slot_range(row['start_time'], row['end_time'])
+            if row['day'] == day and held.start < wanted.stop and held.stop > wanted.start:
+                conflicts.append({**row, 'slot': position})
+    return conflicts
+
+
+def find_conflicts_in_slots(slots, **resources):
+    """
+    Return the saved entries holding any of the 15-minute slots of `slots`.
+
+    Same contract as conflicts.find_conflicts_in_db, answered from
+    slot_occupancy with one indexed query.
+    """
+    rows = occupancy_query(slots, **resources)
+    if rows is None:
+        return []
+    return group_held(slots, list(rows))
+
+
+async def afind_conflicts_in_slots(slots, **resources):
+    """find_conflicts_in_slots for async views."""
+    rows = occupancy_query(slots, **resources)
+    if rows is None:
+        return []
+    return group_held(slots, [row async for row in rows])
+
+
+def group_batch(entries, rows):
+    """
+    Group the holders of a whole batch back onto each entry: a row counts
+    against an entry when it books one of the entry's resources.
+    """
+    booked = [set(owned_keys(**row_resources(row))) for row in rows]
+    conflicts = []
+    for number, (slots, resources, _) in enumerate(entries):
+        keys = lookup_keys(**resources)
+        mine = [row for row, row_keys in zip(rows, booked) if row_keys & keys]
+        conflicts += [{**conflict, 'class': number} for conflict in group_held(slots, mine)]
+    return conflicts
+
+
+def batch_query(entries, exclude=()):
+    """One snapshot query for every resource and slot of a batch (see find_batch_conflicts)."""
+    keys, slots = set(), []
+    for entry_slots, resources, _ in entries:
+        keys |= lookup_keys(**resources)
+        slots += entry_slots
+    return holders_query(keys, slots, exclude)
+
+
+def find_batch_conflicts(entries, exclude=()):
+    """
+    find_conflicts_in_slots for several entries with one query.
+
+    `entries` is a list of (slots, resources, course_code); every conflict
+    also carries 'class', the index of the entry it belongs to. Saved rows of
+    the ProgramSchedule ids in `exclude` are left out.
+    """
+    rows = batch_query(entries, exclude)
+    if rows is None:
+        return []
+    return group_batch(entries, list(rows))
+
+
+async def afind_batch_conflicts(entries):
+    """find_batch_conflicts for async views."""
+    rows = batch_query(entries)
+    if rows is None:
+        return []
+    return group_batch(entries, [row async for row in rows])
+
+
+def find_batch_clashes(entries):
+    """
+    The clashes between the entries of a batch themselves, in memory, in the
+    shape of find_batch_conflicts; 'batch_class' is the index of the earlier
+    entry holding the slot (the same entry for two of its own meetings).
+    """
+    conflicts = []
+    for number, (slots, resources, _) in enumerate(entries):
+        keys = lookup_keys(**resources)
+        for other, (other_slots, other_resources, course_code) in enumerate(entries[:number + 1]):
+            if not keys & set(owned_keys(**other_resources)):
+                continue
+            holder = {f'program_schedule__{name}': value for name, value in other_resources.items()}
+            holder['program_schedule__course_code'] = course_code
+            for position, (day, start_time, end_time) in enumerate(other_slots):
+                row = {**holder, 'day': day, 'start_time': start_time, 'end_time': end_time}
+                for conflict in group_held(slots, [row]):
+                    # An entry's own meetings only clash with the ones before them
+                    if other < number or conflict['slot'] > position:
+                        conflicts.append({**conflict, 'class': number, 'batch_class': other})
+    return conflicts
+
+
+class PendingSlots:
+    """
+    slot_occupancy for classes not written yet: the same keys and 15-minute
+    slots, held in memory. Checking a batch against it before the insert turns
+    the clashes the unique constraint would raise for the batch as a whole into
+    conflicts of single classes.
+    """
+
+    def __init__(self):
+        self.held = {}  # (resource, day index, slot) -> holder row
+
+    def find_conflicts(self, slots, resources, course_code=''):
+        """
+        find_conflicts_in_slots against the booked classes and the earlier
+        meetings in `slots`, which `book()` would otherwise take twice.
+        """
+        keys = lookup_keys(**resources)
+        holder = self.holder(resources, course_code)
+        own, conflicts = {}, []
+        for position, (day, start_time, end_time) in enumerate(slots):
+            if day not in VALID_DAYS:
+                continue
+            day_index = VALID_DAYS.index(day)
+            found = {}
+            for slot in slot_range(start_time, end_time):
+                for key in keys:
+                    row = self.held.get((key, day_index, slot))
+                    if row is not None:
+                        found[id(row)] = row
+                if (day_index, slot) in own:
+                    found[id(own[day_index, slot])] = own[day_index, slot]
+            conflicts += [{**row, 'slot': position} for row in found.values()]
+            row = {**holder, 'day': day, 'start_time': start_time, 'end_time': end_time}
+            for slot in slot_range(start_time, end_time):
+                own.setdefault((day_index, slot), row)
+        return conflicts
+
+    def book(self, slots, resources, course_code=''):
+        keys = owned_keys(**resources)
+        holder = self.holder(resources, course_code)
+        for day, start_time, end_time in slots:
+            if day not in VALID_DAYS:
+                continue
+            row = {**holder, 'day': day, 'start_time': start_time, 'end_time': end_time}
+            for key in keys:
+                for slot in slot_range(start_time, end_time):
+                    self.held[key, VALID_DAYS.index(day), slot] = row
+
+    @staticmethod
+    def holder(resources, course_code):
+        row = {f'program_schedule__{name}': value for name, value in resources.items()}
+        row['program_schedule__course_code'] = course_code
+        return row
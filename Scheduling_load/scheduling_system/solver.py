@@ -0,0 +1,508 @@
+"""
+Automatic timetable generation for a semester.
+
+Every course section to place is a ClassRequest: a course, the section that
+takes it, and the weekly meetings its credit hours call for. A placement
+picks one qualified instructor, one room, a meeting pattern (e.g. Monday and
+Wednesday) and a common start time.
+
+The search is depth-first backtracking with forward checking. Each waiting
+class keeps a "support" placement that is still free; after every move only
+the classes whose support was hit are re-examined, and a move that leaves one
+of them without any placement is undone at once. Occupancy is tracked as
+15-minute bit masks per (resource, day), so every feasibility test is a few
+integer ANDs.
+
+The solver is incremental: pin() fixes existing assignments, solve() places
+the rest, and resolve() releases some classes (e.g. after an edit) and places
+them again without disturbing the others.
+"""
+import re
+import time
+
+from .availability import SLOT_MINUTES, qualified_course_codes, span_mask, week_masks, window_mask
+from .loads import MAX_UNITS
+from .models import InstructorCourse, InstructorData, Program, ProgramSchedule, Room
+from .references import normalize
+
+
+# Teaching hours of each shift, in minutes since midnight
+SHIFT_WINDOWS = {
+    'Day': (7 * 60, 17 * 60),
+    'Eve': (17 * 60, 21 * 60),
+    '3rd Shift': (13 * 60, 21 * 60),
+}
+
+# Day combinations tried for a class meeting n times a week, preferred first
+MEETING_PATTERNS = {
+    1: [('Monday',), ('Tuesday',), ('Wednesday',), ('Thursday',), ('Friday',), ('Saturday',)],
+    2: [('Monday', 'Wednesday'), ('Tuesday', 'Thursday'), ('Wednesday', 'Friday'),
+        ('Monday', 'Thursday'), ('Tuesday', 'Friday'), ('Thursday', 'Saturday')],
+    3: [('Monday', 'Wednesday', 'Friday'), ('Tuesday', 'Thursday', 'Saturday'),
+        ('Monday', 'Tuesday', 'Thursday')],
+}
+
+# Start times are tried every 30 minutes
+START_STEP = 30 // SLOT_MINUTES
+
+# Placements offered per time before moving to the next time
+INSTRUCTORS_PER_TIME = 2
+ROOMS_PER_TIME = 2
+
+# Weights of the soft costs that make up the objective (lower is better)
+UNPLACED_COST = 1000
+ROOM_TYPE_COST = 10
+LATE_START_COST = 1
+OVERLOAD_COST = 50
+
+LAB_KEYWORDS = ('lab',)
+
+
+def meeting_lengths(credit_hours):
+    """Split a course's weekly contact hours into meetings of 30-minute multiples."""
+    total = max(int(credit_hours or 0), 1) * 60
+    meetings = 1 if total <= 90 else 2 if total <= 240 else 3
+    length = -(-total // meetings // 30) * 30
+    return meetings, length
+
+
+def is_lab(text):
+    text = (text or '').lower()
+    return any(keyword in text for keyword in LAB_KEYWORDS)
+
+
+class Instructor:
+    def __init__(self, key, name, qualified, availability, employment_type='regular', max_units=None):
+        self.key = key
+        self.name = name
+        self.qualified = qualified
+        self.availability = availability
+        self.employment_type = employment_type
+        self.max_units = max_units if max_units is not None else MAX_UNITS.get(employment_type, 24)
+
+
+class RoomSlot:
+    def __init__(self, key, number, room_type, availability, building=None, campus=None):
+        self.key = key
+        self.number = number
+        self.room_type = room_type
+        self.availability = availability
+        self.building = building
+        self.campus = campus
+        self.is_lab = is_lab(room_type)
+
+
+class ClassRequest:
+    """One course taught to one program section."""
+
+    def __init__(self, key, course_code, course_name, credit_hours, section_key, shift='Day', lab=None,
+                 course=None, program=None):
+        self.key = key
+        # Source records, when the request was loaded from the database
+        self.course = course
+        self.program = program
+        self.course_code = course_code
+        self.course_name = course_name
+        self.credit_hours = credit_hours or 0
+        self.section_key = section_key
+        self.shift = shift
+        self.lab = is_lab(course_code) or is_lab(course_name) if lab is None else lab
+        self.meetings, self.length = meeting_lengths(credit_hours)
+
+
+class Placement:
+    __slots__ = ('request', 'instructor', 'room', 'days', 'start', 'masks', 'pinned')
+
+    def __init__(self, request, instructor, room, days, start, pinned=False):
+        self.request = request
+        self.instructor = instructor
+        self.room = room
+        self.days = days
+        self.start = start
+        self.masks = {day: span_mask(start, start + request.length) for day in days}
+        self.pinned = pinned
+
+    @property
+    def end(self):
+        return self.start + self.request.length
+
+    def collides(self, other):
+        if not (self.instructor is other.instructor or self.room is other.room
+                or self.request.section_key == other.request.section_key):
+            return False
+        return any(self.masks[day] & other.masks.get(day, 0) for day in self.days)
+
+
+class SolveResult:
+    def __init__(self, placements, unplaced, objective, elapsed, timed_out, nodes, backtracks):
+        self.placements = placements
+        self.unplaced = unplaced
+        self.objective = objective
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+        self.nodes = nodes
+        self.backtracks = backtracks
+
+
+class TimetableSolver:
+    def __init__(self, requests, instructors, rooms, max_backtracks=5000):
+        self.requests = list(requests)
+        self.instructors = list(instructors)
+        self.rooms = list(rooms)
+        self.max_backtracks = max_backtracks
+
+        self.busy = {}
+        self.units = {instructor.key: 0 for instructor in self.instructors}
+        self.placements = {}
+        self.unplaced = set()
+        # Requests already satisfied outside the solver (saved in the database)
+        self.done = set()
+        self._support = {}
+
+        self._candidates = {request.key: self._candidate_instructors(request) for request in self.requests}
+        self._rooms = {request.key: self._candidate_rooms(request) for request in self.requests}
+        self._times = {request.key: self._candidate_times(request) for request in self.requests}
+
+    # Candidate domains
+
+    def _candidate_instructors(self, request):
+        code = ' '.join((request.course_code or '').split()).upper()
+        return [instructor for instructor in self.instructors if code in instructor.qualified]
+
+    def _candidate_rooms(self, request):
+        # Labs need a lab; lectures prefer lecture rooms but may borrow a lab
+        rooms = [room for room in self.rooms if room.is_lab or not request.lab]
+        return sorted(rooms, key=lambda room: room.is_lab != request.lab)
+
+    def _candidate_times(self, request):
+        first, last = SHIFT_WINDOWS.get(request.shift, SHIFT_WINDOWS['Day'])
+        shift_mask = window_mask(first, last)
+        patterns = MEETING_PATTERNS.get(request.meetings, MEETING_PATTERNS[3])
+        times = []
+        for start in range(first, last - request.length + 1, START_STEP * SLOT_MINUTES):
+            mask = span_mask(start, start + request.length)
+            if mask & shift_mask != mask:
+                continue
+            for days in patterns:
+                times.append((days, start, mask))
+        # Earlier starts first, then preferred day patterns
+        return times
+
+    # Occupancy
+
+    def _free(self, key, day, mask):
+        return not self.busy.get((key, day), 0) & mask
+
+    def _occupy(self, placement, sign):
+        keys = (
+            ('instructor', placement.instructor.key),
+            ('room', placement.room.key),
+            ('section', placement.request.section_key),
+        )
+        for day, mask in placement.masks.items():
+            for key in keys:
+                if sign > 0:
+                    self.busy[(key, day)] = self.busy.get((key, day), 0) | mask
+                else:
+                    self.busy[(key, day)] = self.busy.get((key, day), 0) & ~mask
+        self.units[placement.instructor.key] = self.units.get(placement.instructor.key, 0) \
+            + sign * placement.request.credit_hours
+
+    def block(self, resource, day, start_minute, end_minute):
+        """Mark time taken by something outside the solver (e.g. another college's class)."""
+        key = (resource, day)
+        self.busy[key] = self.busy.get(key, 0) | span_mask(start_minute, end_minute)
+
+    def pin(self, request, instructor, room, days, start):
+        """Fix an existing assignment; it is never moved by solve() or resolve()."""
+        placement = Placement(request, instructor, room, tuple(days), start, pinned=True)
+        self.placements[request.key] = placement
+        self._occupy(placement, +1)
+        return placement
+
+    def _fits(self, instructor, room, days, mask):
+        for day in days:
+            if instructor.availability.get(day, 0) & mask != mask:
+                return False
+            if room.availability.get(day, 0) & mask != mask:
+                return False
+            if not (self._free(('instructor', instructor.key), day, mask)
+                    and self._free(('room', room.key), day, mask)):
+                return False
+        return True
+
+    def _options(self, request):
+        """Placements for `request` that fit the current occupancy, best first."""
+        instructors = self._candidates[request.key]
+        rooms = self._rooms[request.key]
+        section = ('section', request.section_key)
+        for days, start, mask in self._times[request.key]:
+            if not all(self._free(section, day, mask) for day in days):
+                continue
+            free_instructors = sorted(
+                (instructor for instructor in instructors
+                 if all(instructor.availability.get(day, 0) & mask == mask
+                        and self._free(('instructor', instructor.key), day, mask) for day in days)),
+                key=lambda instructor: (
+                    self.units.get(instructor.key, 0) + request.credit_hours > instructor.max_units,
+                    self.units.get(instructor.key, 0),
+                ),
+            )
+            if not free_instructors:
+                continue
+            free_rooms = [
+                room for room in rooms
+                if all(room.availability.get(day, 0) & mask == mask
+                       and self._free(('room', room.key), day, mask) for day in days)
+            ]
+            for instructor in free_instructors[:INSTRUCTORS_PER_TIME]:
+                for room in free_rooms[:ROOMS_PER_TIME]:
+                    yield Placement(request, instructor, room, days, start)
+
+    def _first_option(self, request):
+        return next(self._options(request), None)
+
+    # Forward checking
+
+    def _forward_check(self, placement, waiting):
+        """Re-check the waiting classes whose support `placement` just took."""
+        for request in waiting:
+            support = self._support.get(request.key)
+            # Classes wiped out by earlier moves are dealt with when reached
+            if support is None or not support.collides(placement):
+                continue
+            support = self._first_option(request)
+            self._support[request.key] = support
+            if support is None:
+                return False
+        return True
+
+    # Search
+
+    def solve(self, time_limit=30.0):
+        """Place every request that is not pinned yet. Returns a SolveResult."""
+        started = time.monotonic()
+        deadline = started + time_limit
+        todo = [request for request in self.requests
+                if request.key not in self.placements and request.key not in self.unplaced
+                and request.key not in self.done]
+
+        # Hardest first: fewest qualified instructors, then longest meetings
+        todo.sort(key=lambda request: (len(self._candidates[request.key]), -request.length * request.meetings))
+        for request in todo:
+            if not self._candidates[request.key]:
+                self.unplaced.add(request.key)
+        todo = [request for request in todo if request.key not in self.unplaced]
+
+        self._support = {request.key: self._first_option(request) for request in todo}
+
+        frames = []
+        floor = 0
+        nodes = backtracks = 0
+        timed_out = False
+        position = 0
+        while position < len(todo):
+            if time.monotonic() > deadline:
+                # Out of time: place what is left greedily, without lookahead
+                timed_out = True
+                for request in todo[position:]:
+                    placement = self._first_option(request)
+                    if placement is None:
+                        self.unplaced.add(request.key)
+                    else:
+                        self._place(placement)
+                break
+
+            request = todo[position]
+            if position == len(frames):
+                frames.append([self._options(request), None, None])
+            frame = frames[position]
+            if frame[1] is not None:
+                self._unplace(frame[1])
+                frame[1] = None
+
+            waiting = todo[position + 1:]
+            for placement in frame[0]:
+                nodes += 1
+                if frame[2] is None:
+                    frame[2] = placement
+                self._place(placement)
+                if self._forward_check(placement, waiting):
+                    frame[1] = placement
+                    break
+                self._unplace(placement)
+
+            if frame[1] is not None:
+                position += 1
+                continue
+
+            if backtracks < self.max_backtracks and position > floor:
+                # Undo the previous decision and try its next option
+                backtracks += 1
+                frames.pop()
+                position -= 1
+                continue
+
+            # Out of backtracks: keep the best placement even if it starves a
+            # later class, or give up on this one. Never backtrack past it.
+            if frame[2] is not None and self._fits_now(frame[2]):
+                self._place(frame[2])
+                frame[1] = frame[2]
+            else:
+                self.unplaced.add(request.key)
+            floor = position + 1
+            position += 1
+
+        elapsed = time.monotonic() - started
+        return SolveResult(
+            placements=dict(self.placements),
+            unplaced=sorted(self.unplaced, key=str),
+            objective=self.objective(),
+            elapsed=elapsed,
+            timed_out=timed_out,
+            nodes=nodes,
+            backtracks=backtracks,
+        )
+
+    def resolve(self, request_keys, time_limit=30.0):
+        """Release the given (non-pinned) requests and place them again."""
+        for key in request_keys:
+            placement = self.placements.get(key)
+            if placement is not None and not placement.pinned:
+                self._unplace(placement)
+            self.unplaced.discard(key)
+        return self.solve(time_limit=time_limit)
+
+    def _fits_now(self, placement):
+        section = ('section', placement.request.section_key)
+        return (all(self._free(section, day, placement.masks[day]) for day in placement.days)
+                and self._fits(placement.instructor, placement.room, placement.days,
+                               placement.masks[placement.days[0]]))
+
+    def _place(self, placement):
+        self.placements[placement.request.key] = placement
+        self._occupy(placement, +1)
+
+    def _unplace(self, placement):
+        del self.placements[placement.request.key]
+        self._occupy(placement, -1)
+
+    def objective(self):
+        """Weighted soft cost of the current timetable; lower is better."""
+        cost = UNPLACED_COST * len(self.unplaced)
+        for placement in self.placements.values():
+            request = placement.request
+            if placement.room.is_lab != request.lab:
+                cost += ROOM_TYPE_COST
+            shift_start = SHIFT_WINDOWS.get(request.shift, SHIFT_WINDOWS['Day'])[0]
+            cost += LATE_START_COST * ((placement.start - shift_start) // 60) * len(placement.days)
+        for instructor in self.instructors:
+            excess = self.units.get(instructor.key, 0) - instructor.max_units
+            if excess > 0:
+                cost += OVERLOAD_COST * excess
+        return cost
+
+
+# Loading a problem from the database
+
+YEAR_LEVELS = {1: '1st Year', 2: '2nd Year', 3: '3rd Year', 4: '4th Year'}
+
+
+def year_level_for(course_code):
+    """'2nd Year' for "IT 201": the first digit of the course number is the year."""
+    match = re.search(r'(\d)\d*', course_code or '')
+    return YEAR_LEVELS.get(int(match.group(1)) if match else 1, '1st Year')
+
+
+def load_instructors(college_id):
+    return [
+        Instructor(
+            key=instructor.instructor_id,
+            name=f"{instructor.first_name} {instructor.middle_initial or ''} {instructor.last_name}".strip(),
+            qualified=qualified_course_codes(instructor.qualified_course),
+            availability=week_masks(instructor),
+            employment_type=(instructor.employment_type or 'regular').lower(),
+        )
+        for instructor in InstructorData.objects.filter(college_id=college_id)
+    ]
+
+
+def load_rooms(campus=None):
+    rooms = Room.objects.select_related('building', 'campus')
+    if campus:
+        rooms = rooms.filter(campus__campus_name__iexact=campus)
+    return [
+        RoomSlot(
+            key=room.room_id,
+            number=room.room_number,
+            room_type=room.room_type,
+            availability=week_masks(room),
+            building=room.building.building_name,
+            campus=room.campus.campus_name,
+        )
+        for room in rooms
+    ]
+
+
+def load_requests(college_id, semester, sections=('A',), shift='Day'):
+    programs = {program.program_id: program for program in Program.objects.filter(college_id=college_id)}
+    courses = InstructorCourse.objects.filter(program_id__in=programs, semester=semester).order_by('course_id')
+    requests = []
+    for course in courses:
+        program = programs[course.program_id]
+        year_level = year_level_for(course.course_code)
+        for section in sections:
+            section_key = (program.program_id, year_level, section, shift)
+            requests.append(ClassRequest(
+                key=(course.course_id,) + section_key,
+                course_code=course.course_code,
+                course_name=course.course_name,
+                credit_hours=course.credit_hours,
+                section_key=section_key,
+                shift=shift,
+                course=course,
+                program=program,
+            ))
+    return requests
+
+
+def build_solver(college_id, semester, sections=('A',), shift='Day', campus=None, max_backtracks=5000):
+    """
+    A TimetableSolver for one college and semester, with everything already in
+    ProgramSchedule blocked out and the course sections saved there left alone.
+    """
+    instructors = load_instructors(college_id)
+    rooms = load_rooms(campus)
+    requests = load_requests(college_id, semester, sections, shift)
+    solver = TimetableSolver(requests, instructors, rooms, max_backtracks=max_backtracks)
+
+    instructors_by_name = {normalize(instructor.name): instructor.key for instructor in instructors}
+    rooms_by_number = {normalize(room.number): room.key for room in rooms}
+    programs_by_name = {normalize(request.program.program_name): request.program.program_id for request in requests}
+    by_key = {request.key: request for request in requests}
+    courses_by_code = {}
+    for request in requests:
+        courses_by_code.setdefault((request.program.program_id, normalize(request.course_code)), request.course.course_id)
+
+    # Saved entries are treated exactly like save_program_schedule treats them
+    for entry in ProgramSchedule.objects.prefetch_related('schedules'):
+        instructor_key = entry.instructor_id or instructors_by_name.get(normalize(entry.instructor_name))
+        room_key = entry.room_id or rooms_by_number.get(normalize(entry.room_number))
+        program_key = entry.program_id or programs_by_name.get(normalize(entry.program_name))
+        section_key = (program_key, entry.year_level, entry.section, entry.shift)
+        for schedule in entry.schedules.all():
+            start = schedule.start_time.hour * 60 + schedule.start_time.minute
+            end = schedule.end_time.hour * 60 + schedule.end_time.minute
+            if instructor_key:
+                solver.block(('instructor', instructor_key), schedule.day, start, end)
+            if room_key:
+                solver.block(('room', room_key), schedule.day, start, end)
+            solver.block(('section', section_key), schedule.day, start, end)
+        if instructor_key in solver.units:
+            solver.units[instructor_key] += entry.credit_hours
+
+        course_key = entry.course_id or courses_by_code.get((program_key, normalize(entry.course_code)))
+        request = by_key.get((course_key,) + section_key)
+        if request is not None:
+            solver.done.add(request.key)
+    return solver
@@ -1,3 +1,1062 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from datetime import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Count
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .availability import day_masks, decode_week, encode_availability, free_starts, screen_masks
+from .benchmarks import SIZES, generate_dataset, run_benchmarks
+from .conflicts import ConflictIndex, IntervalIndex
+from .management.commands import generate_timetable
+from .models import (
+    Building, Campus, InstructorCourse, InstructorData, Program, ProgramSchedule, Room, RoomUtilization, Schedule,
+    SlotOccupancy,
+)
+from .repair import Assignment, TimetableRepair
+from .solver import ClassRequest, Instructor, RoomSlot, TimetableSolver
+from .refcache import cache_stats
+from .references import resolve_many, resolve_references
+from .versioning import bump_version
+
+
+def schedule_post_data(schedules, **overrides):
+    data = {
+        'instructor_name': 'Juan Dela Cruz',
+        'course_code': 'IT 101',
+        'course_name': 'Introduction to Computing',
+        'credit_hours': '3',
+        'semester': '1',
+        'program_name': 'Bachelor of Science in Information Technology',
+        'program_code': 'BSIT',
+        'room_number': 'ML 101',
+        'room_type': 'Laboratory',
+        'building_name': 'Main',
+        'campus_name': 'Main Campus',
+        'year_level': '1',
+        'section': 'A',
+        'shift': 'Day',
+    }
+    for i, (day, start, end) in enumerate(schedules):
+        data[f'schedules[{i}][day]'] = day
+        data[f'schedules[{i}][start_time]'] = start
+        data[f'schedules[{i}][end_time]'] = end
+    data.update(overrides)
+    return data
+
+
+def statements(queries):
+    """Captured SQL minus the SAVEPOINT/RELEASE framing around atomic blocks."""
+    return [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+
+
+LAB_LOAD = [
+    ('Monday', '07:30', '09:00'),
+    ('Monday', '09:00', '10:30'),
+    ('Wednesday', '07:30', '09:00'),
+    ('Wednesday', '09:00', '10:30'),
+    ('Friday', '07:30', '09:00'),
+    ('Friday', '09:00', '10:30'),
+]
+
+
+class SaveProgramScheduleTests(TestCase):
+    url = reverse('save_program_schedule')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = InstructorData.objects.create(first_name='Juan', middle_initial='D', last_name='Cruz')
+        cls.course = InstructorCourse.objects.create(course_code='IT 101', course_name='Introduction to Computing')
+        cls.program = Program.objects.create(
+            college_id=1, program_code='BSIT', program_name='Bachelor of Science in Information Technology'
+        )
+        campus = Campus.objects.create(campus_name='Main Campus', address='Cebu City')
+        building = Building.objects.create(campus=campus, building_name='Main')
+        cls.room = Room.objects.create(
+            building=building, campus=campus, room_number='ML 101', room_type='Laboratory',
+            availability_days=[], availability_times=[],
+        )
+
+    def references(self):
+        return {
+            'instructor_id': str(self.instructor.instructor_id),
+            'course_id': str(self.course.course_id),
+            'program_id': str(self.program.program_id),
+            'room_id': str(self.room.room_id),
+        }
+
+    def test_six_slot_save_query_count(self):
+        # One conflict query for all six slots, one ProgramSchedule insert and
+        # one bulk Schedule insert
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, schedule_post_data(LAB_LOAD, **self.references()))
+
+        saving = [
+            sql for sql in statements(queries.captured_queries)
+            if sql.startswith('SELECT') and '"slot_occupancy"' in sql
+            or sql.startswith(('INSERT INTO "scheduling_system_programschedule"', 'INSERT INTO "program_schedule"'))
+        ]
+        self.assertEqual(len(saving), 3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ProgramSchedule.objects.count(), 1)
+        self.assertEqual(Schedule.objects.count(), 6)
+
+    def test_six_slot_save_transaction_statements(self):
+        # Around those three: the resource locks (lock the existing rows; on
+        # first use insert the missing ones and lock them), the instructor's
+        # load row (lock, employment type, insert), the bulk slot_occupancy
+        # insert and the room summary (lock, insert), which all commit together
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, schedule_post_data(LAB_LOAD, **self.references()))
+
+        self.assertEqual(len(statements(queries.captured_queries)), 12)
+
+    def test_conflicts_are_reported_per_slot(self):
+        self.client.post(self.url, schedule_post_data(LAB_LOAD))
+
+        response = self.client.post(self.url, schedule_post_data(
+                [('Tuesday', '07:30', '09:00'), ('Friday', '08:00', '09:30')],
+                instructor_name='Maria Santos',
+                section='B',
+            ))
+
+        payload = response.json()
+        self.assertTrue(payload['conflict'])
+        self.assertEqual([detail['slot'] for detail in payload['details']], [1, 1])
+        self.assertEqual({detail['conflict_field'] for detail in payload['details']}, {'room_number'})
+        self.assertEqual(Schedule.objects.count(), 6)
+
+    def test_section_conflict_without_shared_instructor_or_room(self):
+        self.client.post(self.url, schedule_post_data(LAB_LOAD))
+
+        response = self.client.post(self.url, schedule_post_data(
+            [('Monday', '08:00', '09:00')],
+            instructor_name='Maria Santos',
+            room_number='ML 102',
+        ))
+
+        details = response.json()['details']
+        self.assertEqual(len(details), 1)
+        self.assertEqual(details[0]['conflict_field'], 'program_section_year_shift')
+        self.assertEqual(details[0]['start_time'], time(7, 30).isoformat())
+
+    def test_references_are_resolved_from_text(self):
+        self.client.post(self.url, schedule_post_data(LAB_LOAD, instructor_name='Juan D Cruz'))
+
+        entry = ProgramSchedule.objects.get()
+        self.assertEqual(entry.instructor_id, self.instructor.instructor_id)
+        self.assertEqual(entry.course_id, self.course.course_id)
+        self.assertEqual(entry.program_id, self.program.program_id)
+        self.assertEqual(entry.room_id, self.room.room_id)
+
+    def test_batch_references_take_one_query_per_kind(self):
+        items = [
+            schedule_post_data([], instructor_name='Juan D Cruz'),
+            schedule_post_data([], instructor_name='cruz, juan d', program_code='', room_number='ML 102'),
+            schedule_post_data([], instructor_name='Maria Santos', room_id=str(self.room.room_id)),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            references = resolve_many(items)
+
+        self.assertEqual(len(queries.captured_queries), 4)
+        self.assertEqual(references, [resolve_references(data) for data in items])
+        self.assertEqual([data['instructor_id'] for data in references], [self.instructor.instructor_id] * 2 + [None])
+
+    def test_renamed_instructor_still_conflicts(self):
+        self.client.post(self.url, schedule_post_data(LAB_LOAD, **self.references()))
+
+        response = self.client.post(self.url, schedule_post_data(
+            [('Monday', '08:00', '09:00')],
+            instructor_name='Juan D Cruz-Reyes',
+            room_number='ML 102',
+            section='B',
+            instructor_id=str(self.instructor.instructor_id),
+        ))
+
+        details = response.json()['details']
+        self.assertEqual([detail['conflict_field'] for detail in details], ['instructor_name'])
+
+    def test_unlinked_entry_is_not_checked_against_linked_text(self):
+        # Linked holder: books instructor_id, room_id and section_id only
+        self.client.post(self.url, schedule_post_data(LAB_LOAD, **self.references()))
+
+        # Same instructor text, matching no record, in another room and section
+        response = self.client.post(self.url, schedule_post_data(
+            [('Monday', '08:00', '09:00'), ('Tuesday', '08:00', '09:00')], room_number='ML 102', section='B',
+        ))
+
+        self.assertEqual(response.json(), {'message': 'Program schedule saved successfully!'})
+        self.assertIsNone(ProgramSchedule.objects.get(section='B').instructor_id)
+
+        # The other way round, a linked entry asks for the text key the unlinked one booked
+        response = self.client.post(self.url, schedule_post_data(
+            [('Tuesday', '08:00', '09:00')], room_number='ML 103', section='C',
+            instructor_id=str(self.instructor.instructor_id),
+        ))
+        details = response.json()['details']
+        self.assertEqual([(detail['program_schedule__section'], detail['conflict_field']) for detail in details],
+                         [('B', 'instructor_name')])
+
+    def test_slot_occupancy_rejects_double_booking(self):
+        self.client.post(self.url, schedule_post_data(LAB_LOAD, **self.references()))
+        # Six 90-minute meetings, six 15-minute slots each, booked for the instructor, room and section ids
+        self.assertEqual(SlotOccupancy.objects.count(), 6 * 6 * 3)
+
+        taken = SlotOccupancy.objects.get(resource=f'room_id:{self.room.room_id}', day=0, slot=30)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SlotOccupancy.objects.create(schedule=taken.schedule, resource=taken.resource, day=0, slot=30)
+
+        out = StringIO()
+        call_command('rebuild_slot_occupancy', stdout=out)
+        self.assertIn('Booked 108 resource slots.', out.getvalue())
+        self.assertEqual(SlotOccupancy.objects.count(), 108)
+
+    def test_batch_save_is_all_or_nothing(self):
+        url = reverse('save_program_schedules')
+        shared = {key: value for key, value in schedule_post_data([], **self.references()).items()
+                  if key not in ('course_code', 'course_name')}
+
+        def batch(*classes):
+            return self.client.post(url, json.dumps({'shared': shared, 'classes': [
+                {'course_code': code, 'schedules': [
+                    {'day': day, 'start_time': start, 'end_time': end} for day, start, end in meetings
+                ]} for code, meetings in classes
+            ]}), content_type='application/json')
+
+        # The section cannot take two classes at once: nothing is saved
+        response = batch(('IT 101', LAB_LOAD[:2]), ('IT 102', [('Monday', '08:00', '09:00')]))
+        details = response.json()['details']
+        self.assertEqual([(detail['class'], detail['batch_class'], detail['slot']) for detail in details], [(1, 0, 0)])
+        self.assertFalse(ProgramSchedule.objects.exists())
+
+        response = batch(('IT 101', LAB_LOAD[:2]), ('IT 102', [('Tuesday', '07:30', '09:00')]))
+        self.assertEqual(len(response.json()['ids']), 2)
+        self.assertEqual(Schedule.objects.count(), 3)
+
+        # Checked against the saved classes too
+        response = batch(('IT 103', [('Wednesday', '07:30', '09:00')]), ('IT 104', [('Tuesday', '08:00', '09:00')]))
+        self.assertEqual([detail['class'] for detail in response.json()['details']], [1])
+        self.assertEqual(ProgramSchedule.objects.count(), 2)
+
+    def test_sandbox_swap_and_commit(self):
+        self.client.post(self.url, schedule_post_data([('Monday', '07:30', '09:00')], **self.references()))
+        self.client.post(self.url, schedule_post_data([('Monday', '09:00', '10:30')], section='B', **{
+            **self.references(), 'instructor_id': '', 'instructor_name': 'Maria Santos',
+        }))
+        first, second = ProgramSchedule.objects.order_by('id').values_list('id', flat=True)
+        sandbox = self.client.post(reverse('create_sandbox')).json()['sandbox_id']
+
+        def move(entry_id, start, end):
+            return self.client.post(reverse('sandbox_move', args=[sandbox]), json.dumps({
+                'program_schedule_id': entry_id, 'schedules': [{'day': 'Monday', 'start_time': start, 'end_time': end}],
+            }), content_type='application/json').json()
+
+        # Clashes with the committed second class, then with its proposed move
+        self.assertEqual([c['conflict_field'] for c in move(first, '09:00', '10:30')['conflicts']], ['room_number'])
+        conflicts = move(second, '09:30', '11:00')['conflicts']
+        self.assertEqual([(c['conflict_field'], c['proposed']) for c in conflicts], [('room_number', True)])
+        self.assertEqual(move(second, '07:30', '09:00')['conflicts'], [])  # the slot the first class gives up
+
+        diff = self.client.get(reverse('sandbox_diff', args=[sandbox])).json()
+        self.assertEqual((len(diff['changes']), diff['conflicts']), (2, 0))
+        self.assertEqual(Schedule.objects.get(program_schedule_id=first).start_time, time(7, 30))  # nothing written yet
+
+        response = self.client.post(reverse('sandbox_commit', args=[sandbox]))
+        self.assertEqual(response.json()['ids'], [first, second])
+        self.assertEqual(Schedule.objects.get(program_schedule_id=first).start_time, time(9, 0))
+        self.assertEqual(SlotOccupancy.objects.filter(schedule__program_schedule_id=second, slot=30).count(), 3)
+        self.assertEqual(self.client.get(reverse('sandbox_diff', args=[sandbox])).status_code, 404)
+
+    def test_sandbox_sees_classes_deleted_elsewhere(self):
+        self.client.post(self.url, schedule_post_data([('Monday', '07:30', '09:00')], **self.references()))
+        self.client.post(self.url, schedule_post_data([('Monday', '09:00', '10:30')], section='B', **self.references()))
+        first, second = ProgramSchedule.objects.order_by('id').values_list('id', flat=True)
+        sandbox = self.client.post(reverse('create_sandbox')).json()['sandbox_id']
+        response = self.client.post(reverse('sandbox_move', args=[sandbox]), json.dumps({
+            'program_schedule_id': first, 'schedules': [{'day': 'Monday', 'start_time': '09:00', 'end_time': '10:30'}],
+        }), content_type='application/json')
+        self.assertTrue(response.json()['conflicts'])
+
+        # As another worker would, without touching this process's caches
+        ProgramSchedule.objects.filter(id=second).delete()
+        diff = self.client.get(reverse('sandbox_diff', args=[sandbox])).json()
+        self.assertEqual(diff['conflicts'], 0)
+
+
+class AsyncViewTests(TestCase):
+    async def test_save_and_details_through_asgi(self):
+        course = await InstructorCourse.objects.acreate(course_code='IT 101', course_name='Introduction to Computing')
+        url = reverse('save_program_schedule')
+        response = await self.async_client.post(url, schedule_post_data(LAB_LOAD[:2]))
+        self.assertEqual(response.json()['message'], 'Program schedule saved successfully!')
+        self.assertEqual(await ProgramSchedule.objects.filter(course=course).acount(), 1)  # resolved from the code
+
+        response = await self.async_client.post(url, schedule_post_data(LAB_LOAD[:1], section='B'))
+        self.assertTrue(response.json()['conflict'])  # same instructor and room
+
+        details = await self.async_client.get(reverse('course_details'), {'id': course.course_id})
+        self.assertEqual(details.json()['course_code'], 'IT 101')
+
+    async def test_repair_streams_progress(self):
+        campus = await Campus.objects.acreate(campus_name='Main Campus', address='Cebu City')
+        building = await Building.objects.acreate(campus=campus, building_name='Main')
+        closed, spare = [
+            await Room.objects.acreate(building=building, campus=campus, room_number=number, room_type='Laboratory',
+                                       availability_days=[], availability_times=[])
+            for number in ('ML 101', 'ML 102')
+        ]
+        await self.async_client.post(reverse('save_program_schedule'), schedule_post_data(
+            LAB_LOAD[:2], room_id=str(closed.room_id),
+        ))
+
+        response = await self.async_client.get(reverse('repair_timetable'), {'close_room': closed.room_id})
+
+        self.assertTrue(response.is_async)
+        events = [json.loads(line) for line in b''.join([chunk async for chunk in response.streaming_content]).splitlines()]
+        self.assertEqual((events[0]['event'], events[0]['violations']), ('progress', 1))
+        done = events[-1]
+        self.assertEqual((done['event'], done['violations']), ('done', 0))
+        entry = await ProgramSchedule.objects.aget()
+        self.assertEqual(done['changes'], [{'program_schedule_id': entry.id, 'room_id': spare.room_id}])
+        self.assertIsNotNone(done['sandbox_id'])
+
+    async def test_cached_details_read_the_version_asynchronously(self):
+        course = await InstructorCourse.objects.acreate(course_code='IT 101', course_name='Introduction to Computing')
+
+        # The sync counter lookup would block the event loop on the cache
+        with mock.patch('scheduling_system.refcache.get_version', side_effect=AssertionError):
+            for _ in range(2):
+                response = await self.async_client.get(reverse('course_details'), {'id': course.course_id})
+                self.assertEqual(response.json()['course_code'], 'IT 101')
+
+    async def test_batch_timetables_stream_asynchronously(self):
+        await self.async_client.post(reverse('save_program_schedule'), schedule_post_data(LAB_LOAD[:2]))
+
+        response = await self.async_client.get(reverse('batch_timetables'), {
+            'by': 'section', 'semester': '1', 'section': 'A',
+        })
+
+        self.assertTrue(response.is_async)  # served chunk by chunk, not collected by Django first
+        payload = json.loads(b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual(len(payload['timetables'][0]['timetable']), 2)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SERVER_TIMING=True, PROFILING_METRICS_TOKEN='scrape-token')
+class InstrumentationTests(TestCase):
+    def test_server_timing_and_metrics(self):
+        response = self.client.get(reverse('search_rooms'))
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries"$')
+
+        text = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-token'}).content.decode()
+        self.assertIn('scheduling_http_requests_total{view="search_rooms",method="GET",status="200"}', text)
+        self.assertIn('scheduling_http_request_duration_seconds_bucket{view="search_rooms",method="GET",le="+Inf"}', text)
+        self.assertRegex(text, r'scheduling_http_request_queries_total\{view="search_rooms",method="GET"\} [1-9]')
+
+    def test_metrics_are_private_outside_debug(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        wrong = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer guess'})
+        self.assertEqual(wrong.status_code, 404)
+
+        staff = User.objects.create_user('ops', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_profiling_off_adds_no_header(self):
+        response = self.client.get(reverse('search_rooms'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class ConcurrentSaveTests(TransactionTestCase):
+    def test_no_double_booking_under_concurrent_saves(self):
+        # Eight staff book different sections and instructors into one room at the same time
+        sections = 'ABCDEFGH'
+        barrier = threading.Barrier(len(sections))
+        outcomes = []
+
+        def save(section):
+            try:
+                barrier.wait()
+                response = Client().post(reverse('save_program_schedule'), schedule_post_data(
+                    LAB_LOAD[:1], section=section, instructor_name=f'Instructor {section}',
+                ))
+                outcomes.append('saved' if 'message' in response.json() else 'conflict')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=save, args=(section,)) for section in sections]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Schedule.objects.filter(program_schedule__room_number='ML 101', day='Monday').count(), 1)
+        self.assertEqual(sorted(outcomes), ['conflict'] * (len(sections) - 1) + ['saved'])
+
+    def test_generated_timetable_retry_takes_fresh_ids(self):
+        campus = Campus.objects.create(campus_name='Main Campus', address='Cebu City')
+        building = Building.objects.create(campus=campus, building_name='Main')
+        room = Room.objects.create(
+            building=building, campus=campus, room_number='LR 201', room_type='Lecture',
+            availability_days=[], availability_times=[],
+        )
+        program = Program.objects.create(college_id=1, program_code='BSIT', program_name='BS Information Technology')
+        instructor = InstructorData.objects.create(college_id=1, first_name='Juan', last_name='Cruz')
+        everyday = day_masks([], [])
+        solver = TimetableSolver(
+            [ClassRequest('IT 101', 'IT 101', 'Programming 1', 3, section_key=(program.program_id, '1st Year', 'A', 'Day'),
+                          program=program)],
+            [Instructor(instructor.instructor_id, 'Juan Cruz', {'IT 101'}, everyday)],
+            [RoomSlot(room.room_id, room.room_number, 'Lecture', everyday)],
+        )
+        placements = solver.solve(time_limit=5).placements.values()
+
+        # The first attempt deadlocks after inserting its class; while it backs
+        # off, another save takes the id that attempt had been given
+        failed = []
+
+        def occupy(rows):
+            if not failed:
+                failed.append(rows[0][0].pk)
+                raise OperationalError(1213, 'Deadlock found when trying to get lock')
+            return real_occupy(rows)
+
+        def other_save(seconds):
+            ProgramSchedule.objects.create(pk=failed[0], course_code='CS 101', section='B')
+
+        real_occupy = generate_timetable.occupy
+        with mock.patch.object(generate_timetable, 'occupy', occupy), mock.patch('time.sleep', other_save):
+            self.assertEqual(generate_timetable.Command().save(placements, 1), [])
+
+        self.assertEqual(ProgramSchedule.objects.filter(course_code='IT 101').count(), 1)
+        saved = ProgramSchedule.objects.get(course_code='IT 101')
+        self.assertNotEqual(saved.pk, failed[0])
+        self.assertEqual(Schedule.objects.filter(program_schedule=saved).count(), len(next(iter(placements)).days))
+
+
+class TimetableSolverTests(SimpleTestCase):
+    def make_solver(self, course_codes, rooms=1):
+        everyday = day_masks([], [])
+        instructors = [Instructor(1, 'Juan Cruz', set(course_codes), everyday)]
+        rooms = [RoomSlot(n, f'R{n}', 'Lecture', everyday) for n in range(rooms)]
+        requests = [
+            ClassRequest(code, code, code, 3, section_key=(1, '1st Year', 'A', 'Day'))
+            for code in course_codes
+        ]
+        return TimetableSolver(requests, instructors, rooms)
+
+    def test_places_every_class_without_overlap(self):
+        solver = self.make_solver(['IT 101', 'IT 102', 'IT 103', 'IT 104'])
+
+        result = solver.solve(time_limit=5)
+
+        self.assertEqual(result.unplaced, [])
+        placements = list(result.placements.values())
+        for i, first in enumerate(placements):
+            for second in placements[i + 1:]:
+                self.assertFalse(first.collides(second))
+
+    def test_resolve_keeps_pinned_placements(self):
+        solver = self.make_solver(['IT 101', 'IT 102'])
+        request = solver.requests[0]
+        pinned = solver.pin(request, solver.instructors[0], solver.rooms[0], ('Monday', 'Wednesday'), 7 * 60)
+
+        result = solver.resolve(['IT 102'], time_limit=5)
+
+        self.assertIs(result.placements['IT 101'], pinned)
+        self.assertFalse(result.placements['IT 102'].collides(pinned))
+
+
+class TimetableRepairTests(SimpleTestCase):
+    def test_clears_violations_with_few_moves(self):
+        everyday = day_masks([], [])
+        instructors = [Instructor(n, f'Instructor {n}', {'IT 101', 'IT 102'}, everyday) for n in (1, 2, 3)]
+        rooms = [RoomSlot(n, f'R{n}', 'Lecture', everyday, building='Main') for n in range(2)]
+        monday = [('Monday', 8 * 60, 9 * 60 + 30)]
+        # Two sections booked into one room at once, and the first one's instructor left
+        assignments = [
+            Assignment(1, 'IT 101', 3, '1', False, 'Day', (1, '1st Year', 'A', 'Day'), instructors[0], rooms[0], monday),
+            Assignment(2, 'IT 102', 3, '1', False, 'Day', (1, '1st Year', 'B', 'Day'), instructors[1], rooms[0], monday),
+        ]
+        repair = TimetableRepair(assignments, instructors, rooms, departed={1})
+        self.assertEqual(repair.initial_violations, 2)
+
+        events = list(repair.run(time_limit=5))
+
+        self.assertEqual((events[-1]['event'], repair.violations), ('done', 0))
+        moves = repair.changes()
+        self.assertLessEqual(len(moves), 2)
+        self.assertIn(moves[0]['instructor_id'], (2, 3))
+        self.assertEqual(repair.cost, sum(cost for cost, _ in repair.day_costs.values())
+                         + sum(cost for cost, _ in repair.own_costs.values()) + sum(repair.overloads.values()))
+
+
+class AvailabilityMaskTests(SimpleTestCase):
+    def test_round_trip_and_screen(self):
+        weeks = [
+            encode_availability(['M', 'W'], ['07:30-12:00']),
+            encode_availability(['Monday'], {'Monday': ['13:00-17:00']}),
+            encode_availability([], []),
+        ]
+
+        self.assertEqual(len(weeks[0]), 84)
+        self.assertEqual(set(decode_week(weeks[0])), {'Monday', 'Wednesday'})
+        self.assertEqual(list(screen_masks(weeks, 'Monday', 8 * 60, 9 * 60 + 30)), [True, False, True])
+        self.assertEqual(list(screen_masks(weeks, 'Monday', 11 * 60, 13 * 60)), [False, False, True])
+        self.assertEqual(free_starts(weeks[0], 'Wednesday', 180), [450, 480, 510, 540])
+
+
+def index_row(schedule_id, program_schedule_id, start, end, day='Monday', **references):
+    """A ConflictIndex row for ML 101 at start-end ('HH:MM')."""
+    return {
+        'id': schedule_id,
+        'program_schedule_id': program_schedule_id,
+        'program_schedule__instructor_name': references.get('instructor_name', 'Juan Dela Cruz'),
+        'program_schedule__course_code': 'IT 101',
+        'program_schedule__room_number': references.get('room_number', 'ML 101'),
+        'program_schedule__program_name': 'BSIT',
+        'program_schedule__section': references.get('section', 'A'),
+        'program_schedule__year_level': 1,
+        'program_schedule__shift': 'Day',
+        'program_schedule__instructor_id': None,
+        'program_schedule__room_id': None,
+        'program_schedule__program_id': None,
+        'day': day,
+        'start_time': time(*map(int, start.split(':'))),
+        'end_time': time(*map(int, end.split(':'))),
+    }
+
+
+class ConflictIndexTests(SimpleTestCase):
+    def test_touching_intervals_do_not_overlap(self):
+        bucket = IntervalIndex()
+        bucket.add(60, 120, 1)
+
+        self.assertEqual(list(bucket.overlapping(120, 180)), [])
+        self.assertEqual(list(bucket.overlapping(0, 60)), [])
+        self.assertEqual(list(bucket.overlapping(119, 130)), [1])
+        self.assertEqual(list(bucket.overlapping(0, 61)), [1])
+
+    def test_long_interval_found_through_max_length(self):
+        bucket = IntervalIndex()
+        bucket.add(0, 600, 1)
+        for schedule_id, start in enumerate(range(100, 560, 30), start=2):
+            bucket.add(start, start + 10, schedule_id)
+
+        # Starts long before the queried range, behind many short intervals
+        self.assertEqual(list(bucket.overlapping(580, 590)), [1])
+        self.assertEqual(bucket.max_length, 600)
+
+    def test_remove_keeps_max_length(self):
+        bucket = IntervalIndex()
+        bucket.add(0, 600, 1)
+        bucket.add(300, 330, 2)
+        bucket.remove(1)
+
+        self.assertEqual(list(bucket.overlapping(0, 600)), [2])
+        self.assertEqual((len(bucket), bucket.max_length), (1, 600))
+
+    def test_find_conflicts_with_exclude_and_discard(self):
+        index = ConflictIndex()
+        index.add_row(index_row(1, 10, '07:30', '09:00'))
+        index.add_row(index_row(2, 11, '08:00', '09:30', instructor_name='Maria Santos', section='B'))
+        index.add_row(index_row(3, 12, '08:00', '09:30', day='Tuesday'))
+        slots = [('Monday', time(8, 30), time(10, 0))]
+        resources = {'instructor_name': 'Pedro Reyes', 'room_number': 'ML 101'}
+
+        self.assertEqual([row['start_time'] for row in index.find_conflicts(slots, **resources)],
+                         [time(7, 30), time(8, 0)])
+        self.assertEqual([row['start_time'] for row in index.find_conflicts(slots, exclude={10}, **resources)],
+                         [time(8, 0)])
+
+        index.discard_entry(11)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.find_conflicts(slots, exclude={10}, **resources), [])
+        self.assertEqual(index.find_conflicts([('Monday', time(9, 0), time(10, 0))], **resources), [])
+
+
+class FreeRoomsTests(TestCase):
+    url = reverse('free_rooms')
+
+    @classmethod
+    def setUpTestData(cls):
+        campus = Campus.objects.create(campus_name='Main Campus', address='Cebu City')
+        building = Building.objects.create(campus=campus, building_name='Main')
+        for number, room_type in (('ML 101', 'Laboratory'), ('ML 102', 'Laboratory'), ('LR 201', 'Lecture')):
+            Room.objects.create(
+                building=building, campus=campus, room_number=number, room_type=room_type,
+                availability_days=['Monday', 'Wednesday', 'Friday'], availability_times=['07:00-17:00'],
+            )
+
+    def setUp(self):
+        # The matrix is cached per process; start each test from this test's data
+        bump_version('room')
+
+    def free_room_numbers(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [room['room_number'] for room in response.json()['rooms']]
+
+    def test_booked_and_unavailable_rooms_are_excluded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('save_program_schedule'), schedule_post_data(LAB_LOAD))
+
+        self.assertEqual(
+            self.free_room_numbers(day='Monday', start='08:00', end='09:00', room_type='lab'), ['ML 102']
+        )
+        self.assertEqual(self.free_room_numbers(day='Monday', start='10:30', end='12:00'),
+                         ['ML 101', 'ML 102', 'LR 201'])
+        self.assertEqual(self.free_room_numbers(day='Tuesday', start='08:00', end='09:00'), [])
+
+    def test_saves_and_deletes_recompute_only_their_room(self):
+        window = {'day': 'Monday', 'start': '08:00', 'end': '09:00'}
+        self.assertEqual(self.free_room_numbers(**window), ['ML 101', 'ML 102', 'LR 201'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('save_program_schedule'), schedule_post_data(LAB_LOAD))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.free_room_numbers(**window), ['ML 102', 'LR 201'])
+        # No rebuild: the rooms are not read again, only the saved room's schedules
+        self.assertFalse([query for query in queries.captured_queries if 'FROM "room"' in query['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProgramSchedule.objects.get().delete()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.free_room_numbers(**window), ['ML 101', 'ML 102', 'LR 201'])
+        self.assertFalse([query for query in queries.captured_queries if 'FROM "room"' in query['sql']])
+
+    def test_invalid_window(self):
+        response = self.client.get(self.url, {'day': 'Monday', 'start': '10:00', 'end': '09:00'})
+        self.assertEqual(response.status_code, 400)
+
+
+class QualifiedInstructorsTests(TestCase):
+    url = reverse('qualified_instructors')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = InstructorCourse.objects.create(course_code='IT 101', course_name='Introduction to Computing')
+        qualified = {'IT 101': 'Introduction to Computing'}
+        cls.busy = InstructorData.objects.create(first_name='Juan', last_name='Cruz', qualified_course=qualified)
+        cls.loaded = InstructorData.objects.create(first_name='Maria', last_name='Santos', qualified_course=qualified)
+        cls.free = InstructorData.objects.create(first_name='Jose', last_name='Reyes', qualified_course=['IT 101'])
+        InstructorData.objects.create(
+            first_name='Ana', last_name='Lim', qualified_course=qualified,
+            availability_days=['Tuesday'], availability_times=['07:00-17:00'],
+        )
+        InstructorData.objects.create(first_name='Pedro', last_name='Tan', qualified_course={'IT 202': True})
+
+    def setUp(self):
+        bump_version('instructor')
+
+    def save(self, instructor, schedules):
+        self.client.post(reverse('save_program_schedule'), schedule_post_data(
+            schedules, instructor_name=f'{instructor.first_name}  {instructor.last_name}',
+            instructor_id=str(instructor.instructor_id), section=instructor.last_name,
+        ))
+
+    def test_ranked_by_load_without_busy_or_unavailable(self):
+        self.save(self.busy, [('Monday', '08:00', '09:30')])
+        self.save(self.loaded, [('Friday', '08:00', '09:30')])
+
+        response = self.client.get(self.url, {
+            'course_id': self.course.course_id, 'day': 'Monday', 'start': '09:00', 'end': '10:00',
+        })
+
+        names = [instructor['name'] for instructor in response.json()['results']]
+        self.assertEqual(names, ['Jose  Reyes', 'Maria  Santos'])
+
+    def test_without_window_lists_everyone_qualified(self):
+        response = self.client.get(self.url, {'course_id': self.course.course_id})
+
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_reversed_or_empty_window_is_rejected(self):
+        for start, end in (('10:00', '09:00'), ('09:00', '09:00')):
+            response = self.client.get(self.url, {
+                'course_id': self.course.course_id, 'day': 'Monday', 'start': start, 'end': end,
+            })
+            self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        InstructorData.objects.create(first_name='Juan', middle_initial='D', last_name='Cruz', employment_type='regular')
+        InstructorData.objects.create(first_name='Maria', last_name='Cruzado', employment_type='cos')
+        InstructorData.objects.create(first_name='Jose', last_name='Reyes', employment_type='regular')
+        InstructorCourse.objects.create(course_code='IT 101', course_name='Introduction to Computing')
+        InstructorCourse.objects.create(course_code='IT 102', course_name='Computer Programming 1')
+
+    def setUp(self):
+        bump_version('instructor')
+        bump_version('course')
+
+    def search(self, url_name, **params):
+        response = self.client.get(reverse(url_name), params, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_ranked_prefix_and_typo_matches(self):
+        names = [result['name'] for result in self.search('search_instructors', q='cruz')]
+        self.assertEqual(names, ['Juan D Cruz', 'Maria  Cruzado'])
+
+        names = [result['name'] for result in self.search('search_instructors', q='reyse')]
+        self.assertEqual(names, ['Jose  Reyes'])
+
+        codes = [result['course_code'] for result in self.search('search_courses', q='it101')]
+        self.assertEqual(codes[0], 'IT 101')
+
+        codes = [result['course_code'] for result in self.search('search_courses', q='compu', limit=1)]
+        self.assertEqual(len(codes), 1)
+
+    def test_filter_and_new_rows(self):
+        names = [result['name'] for result in self.search('search_instructors', q='cruz', filter='COS')]
+        self.assertEqual(names, ['Maria  Cruzado'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            InstructorData.objects.create(first_name='Ana', last_name='Cruz')
+
+        self.assertEqual(len(self.search('search_instructors', q='cruz')), 3)
+
+    def test_cursor_pages_and_fields(self):
+        url = reverse('search_courses')
+        first = self.client.get(url, {'limit': 1, 'fields': 'course_code'}).json()
+        self.assertEqual(first['results'], [{'course_code': 'IT 101'}])
+        second = self.client.get(url, {'limit': 1, 'fields': 'course_code', 'after': first['next']}).json()
+        self.assertEqual((second['results'], second['next']), ([{'course_code': 'IT 102'}], None))
+
+        ranked = self.client.get(url, {'q': 'it', 'limit': 1}).json()
+        rest = self.client.get(url, {'q': 'it', 'after': ranked['next']}).json()
+        self.assertEqual([r['course_code'] for r in ranked['results'] + rest['results']], ['IT 101', 'IT 102'])
+
+        self.assertNotIn('qualified_course', self.search('search_instructors', q='cruz')[0])
+        self.assertEqual(self.client.get(url, {'fields': 'secret'}).status_code, 400)
+
+
+class RoomQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        campus = Campus.objects.create(campus_name='Main Campus', address='Cebu City')
+        building = Building.objects.create(campus=campus, building_name='Main')
+        cls.rooms = [
+            Room.objects.create(
+                building=building, campus=campus, room_number=f'LR {number}', room_type='Lecture',
+                availability_days=[], availability_times=[],
+            )
+            for number in (201, 202, 203)
+        ]
+
+    def setUp(self):
+        bump_version('room')
+
+    def test_room_details_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('room_details'), {'room_id': self.rooms[0].room_id})
+        self.assertEqual(response.json()['room']['building_name'], 'Main')
+
+    def test_room_details_is_cached_until_a_save(self):
+        params = {'room_id': self.rooms[0].room_id}
+        self.client.get(reverse('room_details'), params)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('room_details'), params)
+        self.assertGreaterEqual(cache_stats()['room']['hits'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            room = Room.objects.get(pk=self.rooms[0].pk)
+            room.room_type = 'Laboratory'
+            room.save()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('room_details'), params)
+        self.assertEqual(response.json()['room']['room_type'], 'Laboratory')
+
+    def test_search_rooms_includes_location(self):
+        with self.assertNumQueries(1):
+            rooms = self.client.get(reverse('search_rooms')).json()['rooms']
+        self.assertEqual(len(rooms), 3)
+        self.assertEqual((rooms[0]['building_name'], rooms[0]['campus_name']), ('Main', 'Main Campus'))
+
+        self.client.get(reverse('search_rooms'), {'q': 'lr'})  # builds the index
+        with self.assertNumQueries(0):
+            rooms = self.client.get(reverse('search_rooms'), {'q': 'lr 202'}).json()['rooms']
+        self.assertEqual((rooms[0]['room_number'], rooms[0]['campus_name']), ('LR 202', 'Main Campus'))
+
+
+class RoomTimetableTests(TestCase):
+    url = reverse('room_timetable')
+
+    def test_grid_and_conditional_get(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('save_program_schedule'), schedule_post_data(LAB_LOAD[:2]))
+
+        response = self.client.get(self.url, {'room_number': 'ML 101', 'semester': '1'})
+        payload = response.json()
+        self.assertEqual([entry['start_time'] for entry in payload['timetable']], ['07:30', '09:00'])
+        self.assertEqual(payload['grid']['Monday']['08:45'], [0])
+        self.assertEqual(payload['grid']['Monday']['09:00'], [1])
+        self.assertNotIn('10:30', payload['grid']['Monday'])
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {'room_number': 'ML 101', 'semester': '1'},
+                                     headers={'If-None-Match': response['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('save_program_schedule'), schedule_post_data(
+                [('Tuesday', '07:30', '09:00')], section='B'))
+        changed = self.client.get(self.url, {'room_number': 'ML 101', 'semester': '1'},
+                                  headers={'If-None-Match': response['ETag']})
+        self.assertEqual(len(changed.json()['timetable']), 3)
+
+    def test_requires_room_and_semester(self):
+        self.assertEqual(self.client.get(self.url, {'room_number': 'ML 101'}).status_code, 400)
+
+
+class BatchTimetableTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        campus = Campus.objects.create(campus_name='Main Campus', address='Cebu City')
+        building = Building.objects.create(campus=campus, building_name='Main')
+        cls.rooms = [
+            Room.objects.create(building=building, campus=campus, room_number=number, room_type='Laboratory',
+                                availability_days=[], availability_times=[])
+            for number in ('ML 101', 'ML 102')
+        ]
+
+    def test_rooms_of_a_building_in_one_query(self):
+        for room, section, instructor in zip(self.rooms, 'AB', ('Juan Cruz', 'Maria Santos')):
+            self.client.post(reverse('save_program_schedule'), schedule_post_data(
+                LAB_LOAD[:2], room_number=room.room_number, room_id=str(room.room_id), section=section,
+                instructor_name=instructor,
+            ))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('batch_timetables'), {
+                'by': 'room', 'semester': '1', 'building_id': self.rooms[0].building_id,
+            })
+            payload = json.loads(b''.join(response.streaming_content))
+
+        self.assertEqual([group['label'] for group in payload['timetables']], ['ML 101', 'ML 102'])
+        self.assertEqual(payload['timetables'][1]['key'], {'room_id': self.rooms[1].room_id})
+        self.assertEqual(len(payload['timetables'][0]['timetable']), 2)
+
+    def test_requires_a_filter(self):
+        response = self.client.get(reverse('batch_timetables'), {'by': 'instructor', 'semester': '1'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RoomUtilizationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        campus = Campus.objects.create(campus_name='Main Campus', address='Cebu City')
+        building = Building.objects.create(campus=campus, building_name='Main')
+        cls.rooms = [
+            Room.objects.create(building=building, campus=campus, room_number=number, room_type='Laboratory',
+                                availability_days=['Monday', 'Wednesday', 'Friday'], availability_times=['07:00-17:00'])
+            for number in ('ML 101', 'ML 102')
+        ]
+
+    def save(self, schedules, **overrides):
+        room = self.rooms[0]
+        return self.client.post(reverse('save_program_schedule'), schedule_post_data(
+            schedules, room_id=str(room.room_id), **overrides))
+
+    def test_summary_follows_saves_and_deletes(self):
+        self.save(LAB_LOAD)
+        self.save([('Monday', '13:00', '14:00')], section='B')
+
+        report = self.client.get(reverse('room_utilization_summary'), {'semester': '1'}).json()
+        first = report['rooms'][0]
+        self.assertEqual((first['room_number'], first['class_count'], first['booked_hours']), ('ML 101', 2, 10.0))
+        self.assertEqual(first['available_hours'], 30.0)
+        self.assertEqual(report['buildings'][0]['booked_hours'], 10.0)
+        self.assertEqual(report['campuses'][0]['available_hours'], 60.0)
+        self.assertEqual(report['idle_rooms'], ['ML 102'])
+        self.assertEqual(report['peak_slots'][0], {
+            'day': 'Monday', 'start_time': '07:30', 'end_time': '07:45', 'rooms_booked': 1,
+        })
+
+        ProgramSchedule.objects.get(section='B').delete()
+        summary = RoomUtilization.objects.get(room=self.rooms[0], semester='1')
+        self.assertEqual((summary.class_count, summary.booked_minutes), (1, 9 * 60))
+
+        call_command('rebuild_room_utilization', stdout=StringIO())
+        rebuilt = RoomUtilization.objects.get(room=self.rooms[0], semester='1')
+        self.assertEqual(bytes(rebuilt.booked_mask), bytes(summary.booked_mask))
+
+
+class TeachingLoadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.regular = InstructorData.objects.create(first_name='Juan', last_name='Cruz', employment_type='regular')
+        cls.cos = InstructorData.objects.create(first_name='Maria', last_name='Santos', employment_type='cos')
+
+    def save(self, instructor, credit_hours, schedules, section):
+        return self.client.post(reverse('save_program_schedule'), schedule_post_data(
+            schedules, instructor_name=f'{instructor.first_name} {instructor.last_name}',
+            instructor_id=str(instructor.instructor_id), credit_hours=str(credit_hours), section=section,
+            room_number=f'R {section}',
+        ))
+
+    def test_overload_is_rejected(self):
+        self.assertEqual(self.save(self.cos, 15, LAB_LOAD[:2], 'A').status_code, 200)
+
+        response = self.save(self.cos, 6, [('Tuesday', '07:30', '09:00')], 'B')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['overload'])
+        self.assertEqual(ProgramSchedule.objects.count(), 1)
+        self.assertEqual(self.save(self.regular, 6, [('Tuesday', '07:30', '09:00')], 'B').status_code, 200)
+
+    def test_summary_and_delete(self):
+        self.save(self.regular, 3, LAB_LOAD[:2], 'A')
+        self.save(self.regular, 3, [('Tuesday', '07:30', '09:00')], 'B')
+
+        with self.assertNumQueries(1):
+            summary = self.client.get(reverse('teaching_load_summary'), {'semester': '1'}).json()
+        cruz, santos = summary['instructors']
+        self.assertEqual((cruz['units'], cruz['contact_hours'], cruz['class_count']), (6, 4.5, 2))
+        self.assertEqual((santos['units'], santos['max_units']), (0, 18))
+        self.assertEqual(summary['by_employment_type']['regular']['units'], 6)
+
+        ProgramSchedule.objects.get(section='B').delete()
+        load = self.regular.loads.get(semester='1')
+        self.assertEqual((load.units, load.contact_minutes, load.class_count), (3, 180, 1))
+
+
+class ImportDataTests(TestCase):
+    def write_csv(self, text):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        with handle:
+            handle.write(text)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def test_instructors_then_schedules(self):
+        path = self.write_csv(
+            "first_name,middle_initial,last_name,employment_type,qualified_course,availability_days\n"
+            "Juan,D,Cruz,regular,IT 101;IT 102,\n"
+            "Maria,,Santos,COS,IT 101,M;W;F\n"
+            ",,,regular,,\n"
+        )
+        errors = StringIO()
+        call_command('import_data', 'instructors', path, batch_size=2, stdout=StringIO(), stderr=errors)
+
+        self.assertEqual(InstructorData.objects.count(), 2)
+        self.assertIn('line 4', errors.getvalue())
+        santos = InstructorData.objects.get(last_name='Santos')
+        self.assertEqual(set(decode_week(santos.availability_mask)), {'Monday', 'Wednesday', 'Friday'})
+
+        columns = "instructor_name,course_code,credit_hours,semester,program_name,program_code," \
+                  "room_number,room_type,building_name,campus_name,year_level,section,shift,day,start_time,end_time\n"
+        path = self.write_csv(
+            columns
+            + "Juan D Cruz,IT 101,3,1,BSIT,BSIT,ML 101,Laboratory,Main,Main Campus,1,A,Day,Monday,07:30,09:00\n"
+            + "Juan D Cruz,IT 101,3,1,BSIT,BSIT,ML 101,Laboratory,Main,Main Campus,1,A,Day,Wednesday,07:30,09:00\n"
+            + "Maria Santos,IT 102,3,1,BSIT,BSIT,ML 101,Laboratory,Main,Main Campus,1,B,Day,Monday,08:00,09:30\n"
+            + "Maria Santos,IT 101,3,1,BSIT,BSIT,ML 102,Laboratory,Main,Main Campus,1,B,Day,Tuesday,08:00,09:30\n"
+            + "Maria Santos,IT 103,3,1,BSIT,BSIT,ML 103,Laboratory,Main,Main Campus,1,B,Day,Funday,08:00,09:30\n"
+        )
+        errors = StringIO()
+        call_command('import_data', 'schedules', path, stdout=StringIO(), stderr=errors)
+
+        self.assertEqual(ProgramSchedule.objects.count(), 2)
+        self.assertEqual(Schedule.objects.count(), 3)
+        self.assertIn('line 4', errors.getvalue())  # room ML 101 is taken
+        self.assertIn('line 6', errors.getvalue())  # invalid day
+        juan = ProgramSchedule.objects.get(course_code='IT 101', section='A')
+        self.assertEqual(juan.instructor.last_name, 'Cruz')
+        self.assertEqual(juan.instructor.loads.get(semester='1').units, 3)
+
+    def test_schedules_clashing_on_the_slot_grid_are_rejected(self):
+        # Back to back at 09:10 passes the exact check but shares the 09:00-09:15 slot
+        path = self.write_csv(
+            "instructor_name,course_code,semester,program_name,program_code,room_number,room_type,building_name,"
+            "campus_name,year_level,section,shift,day,start_time,end_time\n"
+            "Juan D Cruz,IT 101,1,BSIT,BSIT,ML 101,Laboratory,Main,Main Campus,1,A,Day,Monday,07:30,09:10\n"
+            "Maria Santos,IT 102,1,BSIT,BSIT,ML 101,Laboratory,Main,Main Campus,1,B,Day,Monday,09:10,10:30\n"
+        )
+        errors = StringIO()
+        call_command('import_data', 'schedules', path, stdout=StringIO(), stderr=errors)
+
+        self.assertEqual(list(ProgramSchedule.objects.values_list('course_code', flat=True)), ['IT 101'])
+        self.assertIn('line 3: Room schedule is already booked.', errors.getvalue())
+        self.assertEqual(SlotOccupancy.objects.filter(slot=36).count(), 3)
+
+    def test_chunks_without_returning_ids(self):
+        # One class per chunk: Juan's Wednesday meeting joins his class written two chunks earlier,
+        # and the ids come back by class key as on MySQL
+        path = self.write_csv(
+            "instructor_name,course_code,semester,program_name,program_code,room_number,room_type,building_name,"
+            "campus_name,year_level,section,shift,day,start_time,end_time\n"
+            "Juan D Cruz,IT 101,1,BSIT,BSIT,ML 101,Laboratory,Main,Main Campus,1,A,Day,Monday,07:30,09:00\n"
+            "Maria Santos,IT 102,1,BSIT,BSIT,ML 102,Laboratory,Main,Main Campus,1,B,Day,Monday,07:30,09:00\n"
+            "Juan D Cruz,IT 101,1,BSIT,BSIT,ML 101,Laboratory,Main,Main Campus,1,A,Day,Wednesday,07:30,09:00\n"
+        )
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            call_command('import_data', 'schedules', path, batch_size=1, stdout=StringIO(), stderr=StringIO())
+
+        meetings = dict(ProgramSchedule.objects.annotate(meetings=Count('schedules')).values_list('section', 'meetings'))
+        self.assertEqual(meetings, {'A': 2, 'B': 1})
+        self.assertEqual(SlotOccupancy.objects.count(), 3 * 3 * 6)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.post(reverse('save_program_schedule'), schedule_post_data(LAB_LOAD[:2]))
+
+    def test_csv_streams_every_meeting(self):
+        response = self.client.get(reverse('export_schedules'), {'semester': '1'})
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('instructor_name,course_code'))
+        self.assertIn('Monday,07:30:00,09:00:00', lines[1])
+
+    async def test_csv_streams_asynchronously_under_asgi(self):
+        response = await self.async_client.get(reverse('export_schedules'), {'semester': '1'})
+
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_room_calendar(self):
+        campus = Campus.objects.create(campus_name='Main Campus', address='Cebu City')
+        room_id = Room.objects.create(
+            building=Building.objects.create(campus=campus, building_name='Main'), campus=campus,
+            room_number='ML 101', room_type='Laboratory', availability_days=[], availability_times=[],
+        ).room_id
+        ProgramSchedule.objects.update(room_id=room_id)
+
+        response = self.client.get(reverse('export_calendar'), {'room_id': room_id, 'term_start': '2026-08-05'})
+
+        calendar = b''.join(response.streaming_content).decode()
+        self.assertEqual(calendar.count('BEGIN:VEVENT'), 2)
+        self.assertIn('DTSTART:20260810T073000\r\n', calendar)
+        self.assertIn('RRULE:FREQ=WEEKLY;COUNT=18', calendar)
+
+
+class BenchmarkTests(TestCase):
+    def test_tiny_run(self):
+        dataset = generate_dataset(seed=1, **SIZES['tiny'])
+        self.assertEqual(Schedule.objects.count(), dataset.counts['schedules'])
+        double_booked = Schedule.objects.values('program_schedule__room_id', 'day', 'start_time').annotate(
+            bookings=Count('id')).filter(bookings__gt=1)
+        self.assertFalse(double_booked.exists())
+
+        results = run_benchmarks(dataset, iterations=2, only={'search_rooms', 'save_program_schedule'}, solver_classes=10)
+
+        self.assertEqual(set(results['endpoints']), {'search_rooms', 'save_program_schedule'})
+        self.assertEqual(results['endpoints']['search_rooms']['queries_max'], 0)
+        self.assertEqual(results['solver']['unplaced'], 0)
+        self.assertEqual(json.loads(json.dumps(results))['dataset']['rooms'], 20)
 
-# Create your tests here.
@@ -0,0 +1,114 @@
+"""
+Timetables read straight from Schedule joined to ProgramSchedule.
+
+Entries are plain dicts from one .values() query; week_grid buckets them by
+day and 15-minute slot so the page can draw the grid without doing any time
+arithmetic itself. grouped_timetables splits one query ordered by room,
+instructor or section into per-group timetables as the rows stream in.
+"""
+from itertools import groupby
+from operator import itemgetter
+
+from .availability import SLOT_MINUTES, VALID_DAYS
+from .models import Schedule
+
+
+ENTRY_FIELDS = {
+    'program_schedule_id': 'program_schedule_id',
+    'course_code': 'program_schedule__course_code',
+    'course_name': 'program_schedule__course_name',
+    'instructor_name': 'program_schedule__instructor_name',
+    'program_code': 'program_schedule__program_code',
+    'room_number': 'program_schedule__room_number',
+    'year_level': 'program_schedule__year_level',
+    'section': 'program_schedule__section',
+    'shift': 'program_schedule__shift',
+}
+
+DAY_ORDER = {day: position for position, day in enumerate(VALID_DAYS)}
+
+
+# Batch grouping: key name -> Schedule column, in order
+GROUPINGS = {
+    'room': {'room_id': 'program_schedule__room_id'},
+    'instructor': {'instructor_id': 'program_schedule__instructor_id'},
+    'section': {
+        'program_id': 'program_schedule__program_id',
+        'year_level': 'program_schedule__year_level',
+        'section': 'program_schedule__section',
+        'shift': 'program_schedule__shift',
+    },
+}
+
+
+def schedule_rows(*filters, extra=(), **lookups):
+    """.values() rows of the Schedule slots matching the filters, joined to their ProgramSchedule."""
+    return Schedule.objects.filter(*filters, **lookups).values(
+        'day', 'start_time', 'end_time', *ENTRY_FIELDS.values(), *extra,
+    )
+
+
+def entry(row):
+    data = {name: row[column] for name, column in ENTRY_FIELDS.items()}
+    data['day'] = row['day']
+    data['start_time'] = row['start_time'].strftime('%H:%M')
+    data['end_time'] = row['end_time'].strftime('%H:%M')
+    return data
+
+
+def sort_entries(entries):
+    entries.sort(key=lambda data: (DAY_ORDER.get(data['day'], len(DAY_ORDER)), data['start_time'], data['end_time']))
+    return entries
+
+
+def slot_label(slot):
+    minutes = slot * SLOT_MINUTES
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def week_grid(entries):
+    """{day: {"HH:MM": [entry positions]}} for every 15-minute slot an entry covers."""
+    grid = {day: {} for day in VALID_DAYS}
+    for position, data in enumerate(entries):
+        day = grid.setdefault(data['day'], {})
+        start_hour, start_minute = map(int, data['start_time'].split(':'))
+        end_hour, end_minute = map(int, data['end_time'].split(':'))
+        first = (start_hour * 60 + start_minute) // SLOT_MINUTES
+        last = -(-(end_hour * 60 + end_minute) // SLOT_MINUTES)
+        for slot in range(first, last):
+            day.setdefault(slot_label(slot), []).append(position)
+    return grid
+
+
+def timetable(rows):
+    """{'timetable': entries, 'grid': week grid} for an iterable of schedule_rows."""
+    entries = sort_entries([entry(row) for row in rows])
+    return {'slot_minutes': SLOT_MINUTES, 'timetable': entries, 'grid': week_grid(entries)}
+
+
+def group_label(by, entries):
+    first = entries[0]
+    if by == 'room':
+        return first['room_number']
+    if by == 'instructor':
+        return first['instructor_name']
+    return f"{first['program_code']} {first['year_level']} {first['section']} {first['shift']}"
+
+
+def grouped_timetables(by, *filters, **lookups):
+    """
+    Yield {'key', 'label', 'timetable', 'grid'} per room, instructor or program
+    section, from a single query streamed in group order.
+    """
+    columns = GROUPINGS[by]
+    rows = schedule_rows(*filters, extra=columns.values(), **lookups).order_by(*columns.values())
+    group_key = itemgetter(*columns.values())
+    for _, group in groupby(rows.iterator(chunk_size=2000), key=group_key):
+        group = list(group)
+        data = timetable(group)
+        yield {
+            'key': {name: group[0][column] for name, column in columns.items()},
+            'label': group_label(by, data['timetable']),
+            'timetable': data['timetable'],
+            'grid': data['grid'],
+        }
@@ -3,27 +3,56 @@ from .views import (
     home,
     create_teaching_load,
     search_instructors,teaching_load,instructor_details,search_courses,course_details,
+    teaching_load_summary,
     room_utilization,
+    room_utilization_summary,
     search_rooms,
     room_details,
-    section,search_programs, program_details, save_program_schedule
+    cache_stats_view,
+    metrics,
+    free_rooms,
+    fetch_timetable_for_room,
+    batch_timetables,
+    export_schedules,
+    export_calendar,
+    qualified_instructors,
+    section,search_programs, program_details, save_program_schedule,
+    save_program_schedules,
+    create_sandbox, sandbox_diff, sandbox_move, sandbox_commit,
+    repair_timetable,
 )
 
 urlpatterns = [
     path('', home, name='index'),
     path('create_teaching_load/', create_teaching_load, name='create_teaching_load'),
     path('teaching_load/',teaching_load,name='teaching_load'),
+    path('teaching_load_summary/', teaching_load_summary, name='teaching_load_summary'),
     path('section/',section,name='section'),
     path('search_instructors/', search_instructors, name='search_instructors'),
     path('teaching_load/',teaching_load,name='teaching_load'),
     path('details/', instructor_details, name='instructor_details'),
     path('search_courses/',search_courses, name='search_courses'),
     path('course_details/',course_details,name='course_details'),
+    path('qualified_instructors/', qualified_instructors, name='qualified_instructors'),
     path('room-utilization/',room_utilization, name='room_utilization'),
+    path('room_utilization_summary/', room_utilization_summary, name='room_utilization_summary'),
     path('search_rooms/', search_rooms, name='search_rooms'),
     path('room_details/', room_details, name='room_details'),
+    path('cache_stats/', cache_stats_view, name='cache_stats'),
+    path('metrics/', metrics, name='metrics'),
+    path('free_rooms/', free_rooms, name='free_rooms'),
+    path('room_timetable/', fetch_timetable_for_room, name='room_timetable'),
+    path('timetables/', batch_timetables, name='batch_timetables'),
+    path('export/schedules/', export_schedules, name='export_schedules'),
+    path('export/calendar.ics', export_calendar, name='export_calendar'),
     # path('schedule-room/',schedule_room, name='schedule_room'),
     path('search_programs/', search_programs, name='search_programs'),
     path('program_details/', program_details, name='program_details'),
-    path('save_program_schedule/', save_program_schedule, name='save_program_schedule')
+    path('save_program_schedule/', save_program_schedule, name='save_program_schedule'),
+    path('save_program_schedules/', save_program_schedules, name='save_program_schedules'),
+    path('sandbox/', create_sandbox, name='create_sandbox'),
+    path('sandbox/<str:sandbox_id>/', sandbox_diff, name='sandbox_diff'),
+    path('sandbox/<str:sandbox_id>/move/', sandbox_move, name='sandbox_move'),
+    path('sandbox/<str:sandbox_id>/commit/', sandbox_commit, name='sandbox_commit'),
+    path('repair_timetable/', repair_timetable, name='repair_timetable'),
 ]
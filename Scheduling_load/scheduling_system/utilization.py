@@ -0,0 +1,183 @@
+"""
+Room utilization: hours booked against hours available, per room, building
+and campus.
+
+RoomUtilization holds one row per room and semester with the number of
+classes, the booked minutes and a packed week of booked slots. Saves add to
+that row inside their transaction (record_schedules). Deletes recompute the
+room's row from its remaining schedules (refresh_room). The report reads
+these rows plus the rooms' availability masks, so a dashboard view never
+aggregates program_schedule itself.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .availability import SLOT_MINUTES, SLOTS_PER_DAY, VALID_DAYS, encode_week, slot_count, slot_totals, span_mask, union_weeks
+from .conflicts import to_minutes
+from .models import Room, RoomUtilization, Schedule
+
+
+PEAK_SLOTS = 5
+
+
+def booked_week(slots):
+    """Packed week of the slots covered by (day, start_time, end_time) tuples."""
+    masks = {}
+    for day, start_time, end_time in slots:
+        masks[day] = masks.get(day, 0) | span_mask(to_minutes(start_time), to_minutes(end_time))
+    return encode_week(masks)
+
+
+def booked_minutes(slots):
+    return sum(to_minutes(end_time) - to_minutes(start_time) for _, start_time, end_time in slots)
+
+
+def record_schedules(room_id, semester, slots, classes=1):
+    """
+    Add `classes` newly saved classes meeting at `slots` to the room's summary.
+    Call inside the transaction that saves them; the row is locked until it commits.
+    """
+    if room_id is None:
+        return
+    minutes, week = booked_minutes(slots), booked_week(slots)
+    summary = RoomUtilization.objects.select_for_update().filter(room_id=room_id, semester=semester).first()
+    if summary is None:
+        try:
+            with transaction.atomic():
+                RoomUtilization.objects.create(
+                    room_id=room_id, semester=semester, class_count=classes, booked_minutes=minutes, booked_mask=week,
+                )
+            return
+        except IntegrityError:
+            # Another save created the row first
+            summary = RoomUtilization.objects.select_for_update().get(room_id=room_id, semester=semester)
+    summary.class_count += classes
+    summary.booked_minutes += minutes
+    summary.booked_mask = union_weeks(summary.booked_mask, week)
+    summary.save(update_fields=['class_count', 'booked_minutes', 'booked_mask', 'updated_at'])
+
+
+def refresh_room(room_id, semester):
+    """Recompute one room's summary from its schedules, e.g. after a delete."""
+    if room_id is None:
+        return
+    rows = list(Schedule.objects.filter(
+        program_schedule__room_id=room_id, program_schedule__semester=semester,
+    ).values_list('program_schedule_id', 'day', 'start_time', 'end_time'))
+    slots = [row[1:] for row in rows]
+    RoomUtilization.objects.update_or_create(room_id=room_id, semester=semester, defaults={
+        'class_count': len({row[0] for row in rows}),
+        'booked_minutes': booked_minutes(slots),
+        'booked_mask': booked_week(slots),
+    })
+
+
+@transaction.atomic
+def rebuild_summaries(semester=None):
+    """Recompute every summary (of one semester, if given) in one pass over the schedules."""
+    summaries = RoomUtilization.objects.all()
+    schedules = Schedule.objects.filter(program_schedule__room__isnull=False)
+    if semester is not None:
+        summaries = summaries.filter(semester=semester)
+        schedules = schedules.filter(program_schedule__semester=semester)
+    summaries.delete()
+
+    groups = {}
+    rows = schedules.values_list(
+        'program_schedule__room_id', 'program_schedule__semester', 'program_schedule_id', 'day', 'start_time', 'end_time',
+    )
+    for room_id, row_semester, program_schedule_id, day, start_time, end_time in rows.iterator(chunk_size=2000):
+        classes, slots = groups.setdefault((room_id, row_semester), (set(), []))
+        classes.add(program_schedule_id)
+        slots.append((day, start_time, end_time))
+
+    RoomUtilization.objects.bulk_create([
+        RoomUtilization(
+            room_id=room_id, semester=row_semester, class_count=len(classes),
+            booked_minutes=booked_minutes(slots), booked_mask=booked_week(slots),
+        )
+        for (room_id, row_semester), (classes, slots) in groups.items()
+    ], batch_size=1000)
+    return len(groups)
+
+
+def rate(booked, available):
+    return round(booked / available, 4) if available else None
+
+
+def utilization_report(semester, campus=None, building=None):
+    """Per-room, per-building and per-campus usage, peak slots and idle rooms for a semester."""
+    rooms = Room.objects.values(
+        'room_id', 'room_number', 'room_type', 'availability_mask',
+        building_name=F('building__building_name'), campus_name=F('campus__campus_name'),
+    ).order_by('campus_name', 'building_name', 'room_number')
+    summaries = RoomUtilization.objects.filter(semester=semester)
+    if campus:
+        rooms = rooms.filter(campus__campus_name__icontains=campus)
+        summaries = summaries.filter(room__campus__campus_name__icontains=campus)
+    if building:
+        rooms = rooms.filter(building__building_name__icontains=building)
+        summaries = summaries.filter(room__building__building_name__icontains=building)
+    summaries = {
+        row['room_id']: row
+        for row in summaries.values('room_id', 'class_count', 'booked_minutes', 'booked_mask')
+    }
+
+    room_rows, buildings, campuses, booked_masks = [], {}, {}, []
+    for room in rooms:
+        summary = summaries.get(room['room_id'], {})
+        available = slot_count(room['availability_mask']) * SLOT_MINUTES
+        booked = summary.get('booked_minutes', 0)
+        if summary.get('booked_mask'):
+            booked_masks.append(bytes(summary['booked_mask']))
+        room_rows.append({
+            'room_id': room['room_id'],
+            'room_number': room['room_number'],
+            'room_type': room['room_type'],
+            'building_name': room['building_name'],
+            'campus_name': room['campus_name'],
+            'class_count': summary.get('class_count', 0),
+            'booked_hours': round(booked / 60, 2),
+            'available_hours': round(available / 60, 2),
+            'utilization': rate(booked, available),
+        })
+        for totals, key in ((buildings, (room['campus_name'], room['building_name'])), (campuses, room['campus_name'])):
+            entry = totals.setdefault(key, {'rooms': 0, 'booked': 0, 'available': 0})
+            entry['rooms'] += 1
+            entry['booked'] += booked
+            entry['available'] += available
+
+    totals = slot_totals(booked_masks)
+    peaks = sorted((slot for slot, count in enumerate(totals) if count), key=lambda slot: (-totals[slot], slot))
+    return {
+        'semester': semester,
+        'rooms': room_rows,
+        'buildings': [
+            {'campus_name': campus_name, 'building_name': building_name, **aggregate(entry)}
+            for (campus_name, building_name), entry in buildings.items()
+        ],
+        'campuses': [{'campus_name': campus_name, **aggregate(entry)} for campus_name, entry in campuses.items()],
+        'peak_slots': [
+            {
+                'day': VALID_DAYS[slot // SLOTS_PER_DAY],
+                'start_time': minutes_label(slot % SLOTS_PER_DAY * SLOT_MINUTES),
+                'end_time': minutes_label((slot % SLOTS_PER_DAY + 1) * SLOT_MINUTES),
+                'rooms_booked': totals[slot],
+            }
+            for slot in peaks[:PEAK_SLOTS]
+        ],
+        'idle_rooms': [room['room_number'] for room in room_rows if not room['class_count']],
+    }
+
+
+def aggregate(entry):
+    return {
+        'rooms': entry['rooms'],
+        'booked_hours': round(entry['booked'] / 60, 2),
+        'available_hours': round(entry['available'] / 60, 2),
+        'utilization': rate(entry['booked'], entry['available']),
+    }
+
+
+def minutes_label(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
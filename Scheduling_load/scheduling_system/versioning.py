@@ -0,0 +1,96 @@
+"""
+Version counters for data that per-process caches are built from.
+
+Writers bump a named version once their transaction commits; readers compare
+it with the version their cached structure was built at. The counters live in
+Django's cache, so with a shared backend (Redis, Memcached) a save in one
+worker invalidates the caches of all of them.
+
+A bump may also say what changed. The note is kept under the new version for
+a while, so a reader a few versions behind can patch its structure from
+changes_since() instead of rebuilding it; any bump without a note (or a note
+the cache has dropped) means "rebuild".
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+
+def version_key(name):
+    return f'scheduling_system:version:{name}'
+
+
+def modified_key(name):
+    return f'scheduling_system:modified:{name}'
+
+
+def changes_key(name, version):
+    return f'scheduling_system:changes:{name}:{version}'
+
+
+# How long, and across how many bumps, changes_since() can still answer
+CHANGES_TIMEOUT = 60 * 60
+MAX_CHANGES = 200
+
+
+def get_version(name):
+    version = cache.get(version_key(name))
+    if version is None:
+        # Start from the clock rather than 1: if the counter is ever evicted,
+        # it must not come back at a value older cache entries were keyed on
+        initial = time.time_ns() // 1000
+        cache.add(version_key(name), initial, timeout=None)
+        version = cache.get(version_key(name), initial)
+    return version
+
+
+async def aget_version(name):
+    """get_version for async code, through the cache's async API."""
+    version = await cache.aget(version_key(name))
+    if version is None:
+        initial = time.time_ns() // 1000
+        await cache.aadd(version_key(name), initial, timeout=None)
+        version = await cache.aget(version_key(name), initial)
+    return version
+
+
+def get_modified(name):
+    """When `name` was last bumped (or first read, if never), for Last-Modified headers."""
+    modified = cache.get(modified_key(name))
+    if modified is None:
+        cache.add(modified_key(name), timezone.now(), timeout=None)
+        modified = cache.get(modified_key(name))
+    return modified
+
+
+def bump_version(name, changes=None):
+    """Bump `name`, noting `changes` (a list of picklable values) under the new version if given."""
+    try:
+        version = cache.incr(version_key(name))
+    except ValueError:
+        version = get_version(name) + 1
+        cache.set(version_key(name), version, timeout=None)
+    if changes is not None:
+        cache.set(changes_key(name, version), list(changes), timeout=CHANGES_TIMEOUT)
+    cache.set(modified_key(name), timezone.now(), timeout=None)
+
+
+def bump_version_on_commit(name, changes=None):
+    transaction.on_commit(lambda: bump_version(name, changes))
+
+
+def changes_since(name, since, version):
+    """
+    Everything noted by the bumps of `name` after version `since` up to
+    `version`, or None if any of them is unknown: bumped without changes,
+    dropped by the cache, or more than MAX_CHANGES bumps ago.
+    """
+    if not 0 <= version - since <= MAX_CHANGES:
+        return None
+    keys = [changes_key(name, number) for number in range(since + 1, version + 1)]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return [change for key in keys for change in found[key]]
@@ -1,13 +1,46 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
-from django.db.models import Q
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, OperationalError
+from django.db.models import F, Q, Sum
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from .models import InstructorData, InstructorCourse, Program, Room, Campus, Building, Room, ProgramSchedule, Schedule
 from .forms import ProgramScheduleForm
+from .conflicts import label_conflicts, resource_keys
+from .availability import VALID_DAYS, encode_availability, screen_masks
+from .occupancy import get_occupancy_matrix
+from .qualifications import get_qualification_index
+from .references import aresolve_many, aresolve_references
+from .repair import load_repair, propose
+from .refcache import acached, cache_stats
+from .sandbox import Rejected, Sandbox, Stale
+from .instrumentation import PROMETHEUS_CONTENT_TYPE, metrics_allowed, prometheus_text
+from .timetables import GROUPINGS, grouped_timetables, schedule_rows, timetable
+from .exports import DEFAULT_TERM_WEEKS, csv_lines, export_rows, ics_lines, xlsx_file
+from .loads import Overload, add_load, faculty_loads
+from .locks import is_retryable, locked
+from .slot_occupancy import (
+    afind_batch_conflicts, afind_conflicts_in_slots, find_batch_clashes, find_batch_conflicts, occupy,
+)
+from .utilization import record_schedules, utilization_report
+from .versioning import get_modified, get_version
+from .search import (
+    aget_search_index, akeyset_page, instructor_name, parse_fields, parse_id_cursor, parse_limit, parse_rank_cursor,
+    project,
+)
 from datetime import datetime
+from itertools import islice
+import json
+import logging
 from django.utils import timezone
 
 
+logger = logging.getLogger(__name__)
+
+
 def home(request):
     return render(request, 'instructors_frontend/index.html')  # Original home page
 
@@ -18,68 +51,74 @@ def create_teaching_load(request):
 def teaching_load(request):
     return render(request,'instructors_frontend/teaching_load.html')
 
+def teaching_load_summary(request):
+    semester = request.GET.get('semester')
+    if not semester:
+        return JsonResponse({'error': 'semester is required'}, status=400)
+
+    # Running totals kept by save_program_schedule (see loads.py), whole faculty in one query
+    filter_type = request.GET.get('filter', 'ALL')  # ALL, REGULAR or COS, as in search_instructors
+    return JsonResponse(faculty_loads(semester, employment_type=None if filter_type == 'ALL' else filter_type))
+
 def section(request):
     return render(request,'instructors_frontend/section.html')
 
-def search_instructors(request):
+INSTRUCTOR_SEARCH_FIELDS = ('name', 'instructor_id', 'employment_type', 'qualified_course')
+
+async def search_instructors(request):
     if request.method == "GET":
         query = request.GET.get('q', '').strip()  # Get the search query
         filter_type = request.GET.get('filter', 'ALL')  # Get the filter type (ALL, regular, cos)
+        try:
+            limit = parse_limit(request.GET.get('limit'))
+            # qualified_course can be large, so it is only sent when asked for
+            fields = parse_fields(request.GET.get('fields'), INSTRUCTOR_SEARCH_FIELDS, INSTRUCTOR_SEARCH_FIELDS[:3])
+            after = (parse_rank_cursor if query else parse_id_cursor)(request.GET.get('after'))
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
 
-        # Debugging: Print query and filter
-        print(f"Search Query: {query}, Filter: {filter_type}")
-
-        # Start with all instructors
-        instructors = InstructorData.objects.all()
+        logger.debug("search_instructors query=%r filter=%s", query, filter_type)
 
-        # Apply filtering logic based on employment type
-        if filter_type == 'REGULAR':
-            instructors = instructors.filter(employment_type='REGULAR')
-        elif filter_type == 'COS':
-            instructors = instructors.filter(employment_type='COS')
+        # Employment type filter, matched case-insensitively
+        filters = {'employment_type': filter_type} if filter_type in ('REGULAR', 'COS') else {}
 
-        # Apply query if present
         if query:
-            # Split the query into parts (split by spaces)
-            name_parts = query.split()
-
-            # Dynamically build the query filters based on the parts
-            filter_query = Q()
-
-            for part in name_parts:
-                filter_query |= Q(first_name__icontains=part) | Q(middle_initial__icontains=part) | Q(last_name__icontains=part)
-
-            instructors = instructors.filter(filter_query)
-
-        # Debugging: Print the number of instructors fetched
-        print(f"Found {instructors.count()} instructors matching the query.")
-
-        # Prepare the response for the search (as JSON for AJAX)
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            # Prepare the list of instructor details to return
+            # Ranked, typo-tolerant lookup in the in-memory index (see search.py)
+            data, next_cursor = (await aget_search_index('instructor')).search(query, limit, after, **filters)
+        else:
+            columns = ['instructor_id', 'first_name', 'middle_initial', 'last_name', 'employment_type']
+            if 'qualified_course' in fields:
+                columns.append('qualified_course')
+            instructors = InstructorData.objects.values(*columns)
+            if filters:
+                instructors = instructors.filter(employment_type__iexact=filters['employment_type'])
+            rows, next_cursor = await akeyset_page(instructors, 'instructor_id', limit, after)
             data = [
                 {
-                    'name': f"{instructor.first_name} {instructor.middle_initial or ''} {instructor.last_name}".strip(),
-                    'instructor_id': instructor.instructor_id,
-                    'employment_type': instructor.employment_type,
-                    'qualified_course': instructor.qualified_course,
+                    'name': instructor_name(row['first_name'], row['middle_initial'], row['last_name']),
+                    'instructor_id': row['instructor_id'],
+                    'employment_type': row['employment_type'],
+                    'qualified_course': row.get('qualified_course'),
                 }
-                for instructor in instructors
+                for row in rows
             ]
+        data = project(data, fields)
 
+        logger.debug("search_instructors results=%d", len(data))
 
-
-            return JsonResponse({'results': data})
+        # Prepare the response for the search (as JSON for AJAX)
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'results': data, 'next': next_cursor})
 
         # For non-AJAX request, render the instructor list template
         return render(request, 'instructors_frontend/teaching_load.html', {
-            'instructors': instructors,
+            'instructors': data,
             'filter': filter_type,  # Pass the employment type filter to the template
             'query': query,  # Pass the search query to the template
         })
 
 
-def instructor_details(request):
+async def instructor_details(request):
     # Get 'id' from query parameters
     instructor_id = request.GET.get('id')
 
@@ -92,7 +131,7 @@ def instructor_details(request):
         instructor_id = int(instructor_id)
 
         # Fetch the instructor record
-        instructor = InstructorData.objects.get(instructor_id=instructor_id)
+        instructor = await InstructorData.objects.aget(instructor_id=instructor_id)
 
         # Prepare the instructor details to return as JSON
         data = {
@@ -116,99 +155,204 @@ def instructor_course_list(request):
     courses = InstructorCourse.objects.all()
     return render(request, 'teaching_load.html', {'courses': courses})
 
-def search_programs(request):
-    query = request.GET.get('q', '')
+PROGRAM_SEARCH_FIELDS = ('program_id', 'program_name', 'program_code')
+
+async def search_programs(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = parse_limit(request.GET.get('limit'))
+        fields = parse_fields(request.GET.get('fields'), PROGRAM_SEARCH_FIELDS, PROGRAM_SEARCH_FIELDS)
+        after = (parse_rank_cursor if query else parse_id_cursor)(request.GET.get('after'))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
     if query:
-        programs = Program.objects.filter(program_name__icontains=query)
+        program_list, next_cursor = (await aget_search_index('program')).search(query, limit, after)
+        program_list = project(program_list, fields)
     else:
-        programs = Program.objects.all()
-
-    program_list = [
-        {
-            'program_id': program.program_id,
-            'program_name': program.program_name,
-            'program_code': program.program_code,
-        }
-        for program in programs
-    ]
+        # The cursor needs program_id even when the caller did not ask for it
+        columns = dict.fromkeys(['program_id', *fields])
+        program_list, next_cursor = await acached('program', f"page:{limit}:{after}:{','.join(fields)}", lambda: akeyset_page(
+            Program.objects.values(*columns), 'program_id', limit, after,
+        ))
+        program_list = project(program_list, fields)
 
-    return JsonResponse({'programs': program_list})
+    return JsonResponse({'programs': program_list, 'next': next_cursor})
 
-def program_details(request):
+async def program_details(request):
     program_id = request.GET.get('program_id', None)
     if program_id:
         try:
-            program = Program.objects.get(program_id=program_id)
-            program_data = {
-                'program_id': program.program_id,
-                'program_name': program.program_name,
-                'program_code': program.program_code,
-            }
-            return JsonResponse({'program': program_data})
-        except Program.DoesNotExist:
+            program_id = int(program_id)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid program_id format, must be an integer'}, status=400)
+        # Served from the reference cache until a Program is saved or deleted
+        program_data = await acached('program', f'details:{program_id}', lambda: Program.objects.filter(
+            program_id=program_id,
+        ).values('program_id', 'program_name', 'program_code').afirst())
+        if program_data is None:
             return JsonResponse({'error': 'Program not found'}, status=404)
+        return JsonResponse({'program': program_data})
     else:
         return JsonResponse({'error': 'Program ID not provided'}, status=400)
 
-def search_courses(request):
+COURSE_SEARCH_FIELDS = ('course_code', 'course_name', 'course_id')
+
+async def search_courses(request):
     if request.method == "GET":
         query = request.GET.get('q', '').strip()  # Get the query from request
-        courses = InstructorCourse.objects.all()  # Start with all courses
-
-        if query:  # Apply filtering if query exists
-            query_parts = query.split()  # Split the query into parts for flexibility
-            filter_query = Q()
-
-            # Build the filter dynamically to search in course_code and course_name
-            for part in query_parts:
-                filter_query |= Q(course_code__icontains=part) | Q(course_name__icontains=part)
-
-            courses = courses.filter(filter_query)  # Apply the filters
-
-        # Prepare the response for suggestions
-        data = [
-            {
-                'course_code': course.course_code,
-                'course_name': course.course_name,
-                'course_id': course.course_id,
-            }
-            for course in courses
-        ]
-        return JsonResponse({'results': data})  # Return the suggestions as JSON
-
-def course_details(request):
+        try:
+            limit = parse_limit(request.GET.get('limit'))
+            fields = parse_fields(request.GET.get('fields'), COURSE_SEARCH_FIELDS, COURSE_SEARCH_FIELDS)
+            after = (parse_rank_cursor if query else parse_id_cursor)(request.GET.get('after'))
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+
+        if query:  # Ranked matches on course code and name
+            data, next_cursor = (await aget_search_index('course')).search(query, limit, after)
+        else:  # Otherwise page through the table in id order
+            columns = dict.fromkeys(['course_id', *fields])
+            data, next_cursor = await acached('course', f"page:{limit}:{after}:{','.join(fields)}", lambda: akeyset_page(
+                InstructorCourse.objects.values(*columns), 'course_id', limit, after,
+            ))
+        return JsonResponse({'results': project(data, fields), 'next': next_cursor})  # Return the suggestions as JSON
+
+async def course_details(request):
     course_id = request.GET.get('id')
 
     if not course_id:
         return JsonResponse({'error': 'Course ID is required.'}, status=400)
 
     try:
-        course = InstructorCourse.objects.get(course_id=course_id)
+        course_id = int(course_id)
+    except ValueError:
+        return JsonResponse({'error': 'Course ID must be an integer.'}, status=400)
 
-        data = {
-            'course_id': course.course_id,
-            'course_code': course.course_code,
-            'course_name': course.course_name,
-            'credit_hours': course.credit_hours,
-            'semester': course.semester,
-        }
-        return JsonResponse(data)
+    data = await acached('course', f'details:{course_id}', lambda: InstructorCourse.objects.filter(
+        course_id=course_id,
+    ).values('course_id', 'course_code', 'course_name', 'credit_hours', 'semester').afirst())
+    if data is None:
+        return JsonResponse({'error': 'Course not found.'}, status=404)
+    return JsonResponse(data)
+
+def qualified_instructors(request):
+    course_id = request.GET.get('course_id')
+    day = request.GET.get('day')
+    start_time_str = request.GET.get('start')
+    end_time_str = request.GET.get('end')
+    semester = request.GET.get('semester')
 
+    if not course_id:
+        return JsonResponse({'error': 'Course ID is required.'}, status=400)
+
+    try:
+        course = InstructorCourse.objects.only('course_id', 'course_code', 'course_name').get(course_id=int(course_id))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid course_id format, must be an integer'}, status=400)
     except InstructorCourse.DoesNotExist:
         return JsonResponse({'error': 'Course not found.'}, status=404)
 
+    # Everyone qualified for the course, straight from the in-memory index
+    candidates = get_qualification_index().qualified(course.course_code)
+
+    # Optionally keep only instructors who are available and not already teaching then
+    if day or start_time_str or end_time_str:
+        if day not in VALID_DAYS:
+            return JsonResponse({"error": f"Invalid day '{day}'. Must be one of {', '.join(VALID_DAYS)}."}, status=400)
+        try:
+            start_time = datetime.strptime(start_time_str or '', "%H:%M").time()
+            end_time = datetime.strptime(end_time_str or '', "%H:%M").time()
+        except ValueError:
+            return JsonResponse({"error": "Invalid time format. Use HH:MM."}, status=400)
+        if start_time >= end_time:
+            return JsonResponse({"error": "End time must be later than the start time."}, status=400)
+
+        weeks = [
+            candidate['availability_mask']
+            or encode_availability(candidate['availability_days'], candidate['availability_times'])
+            for candidate in candidates
+        ]
+        available = screen_masks(
+            weeks, day, start_time.hour * 60 + start_time.minute, end_time.hour * 60 + end_time.minute
+        )
+        candidates = [candidate for candidate, fits in zip(candidates, available) if fits]
+
+        busy = Schedule.objects.filter(
+            Q(program_schedule__instructor_id__in=[candidate['instructor_id'] for candidate in candidates]) |
+            Q(program_schedule__instructor_name__in=[candidate['name'] for candidate in candidates]),
+            day=day,
+            start_time__lt=end_time,
+            end_time__gt=start_time,
+        ).values_list('program_schedule__instructor_id', 'program_schedule__instructor_name')
+        busy_ids, busy_names = set(), set()
+        for busy_id, busy_name in busy:
+            busy_ids.add(busy_id)
+            busy_names.add(busy_name)
+        candidates = [
+            candidate for candidate in candidates
+            if candidate['instructor_id'] not in busy_ids and candidate['name'] not in busy_names
+        ]
+
+    # Rank by current teaching load, lightest first
+    loads = ProgramSchedule.objects.filter(instructor_id__in=[candidate['instructor_id'] for candidate in candidates])
+    if semester:
+        loads = loads.filter(semester=semester)
+    units = dict(loads.values('instructor_id').annotate(units=Sum('credit_hours')).values_list('instructor_id', 'units'))
+
+    data = [
+        {
+            'instructor_id': candidate['instructor_id'],
+            'name': candidate['name'],
+            'employment_type': candidate['employment_type'],
+            'load_units': units.get(candidate['instructor_id']) or 0,
+        }
+        for candidate in candidates
+    ]
+    data.sort(key=lambda instructor: (instructor['load_units'], instructor['name']))
+
+    return JsonResponse({
+        'course': {'course_id': course.course_id, 'course_code': course.course_code, 'course_name': course.course_name},
+        'results': data,
+    })
+
 def room_utilization(request):
     return render(request, 'instructors_frontend/room_util.html')  # Update path to match your template location
 
-def search_rooms(request):
-    query = request.GET.get('q', '')  # Search query, default to empty string
-    building_name = request.GET.get('building', '')  # Optionally filter by building name
-    campus_name = request.GET.get('campus', '')  # Optionally filter by campus name
+def room_utilization_summary(request):
+    semester = request.GET.get('semester')
+    if not semester:
+        return JsonResponse({'error': 'semester is required'}, status=400)
+
+    # Precomputed per-room totals (see utilization.py), summed per building and campus
+    return JsonResponse(utilization_report(
+        semester, campus=request.GET.get('campus'), building=request.GET.get('building'),
+    ))
 
-    rooms = Room.objects.all()  # Start with all rooms
+ROOM_SEARCH_FIELDS = ('room_id', 'room_number', 'room_type', 'building_name', 'campus_name')
+ROOM_LOCATION_COLUMNS = {'building_name': F('building__building_name'), 'campus_name': F('campus__campus_name')}
 
-    if query:  # Filter by room number if query is provided
-        rooms = rooms.filter(room_number__icontains=query)
+async def search_rooms(request):
+    query = request.GET.get('q', '').strip()  # Search query, default to empty string
+    building_name = request.GET.get('building', '')  # Optionally filter by building name
+    campus_name = request.GET.get('campus', '')  # Optionally filter by campus name
+    try:
+        limit = parse_limit(request.GET.get('limit'), default=10)
+        fields = parse_fields(request.GET.get('fields'), ROOM_SEARCH_FIELDS, ROOM_SEARCH_FIELDS)
+        after = (parse_rank_cursor if query else parse_id_cursor)(request.GET.get('after'))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    if query:  # Ranked matches on room number, narrowed by building and campus
+        filters = {key: value for key, value in (('building', building_name), ('campus', campus_name)) if value}
+        rooms_data, next_cursor = (await aget_search_index('room')).search(query, limit, after, **filters)
+        return JsonResponse({'rooms': project(rooms_data, fields), 'next': next_cursor})
+
+    # Only the requested columns; building and campus names come from the same joined query
+    columns = dict.fromkeys(['room_id', *fields])
+    rooms = Room.objects.values(
+        *(field for field in columns if field not in ROOM_LOCATION_COLUMNS),
+        **{field: expression for field, expression in ROOM_LOCATION_COLUMNS.items() if field in columns},
+    )
 
     if building_name:  # Filter by building name if provided
         rooms = rooms.filter(building__building_name__icontains=building_name)
@@ -216,79 +360,242 @@ def search_rooms(request):
     if campus_name:  # Filter by campus name if provided
         rooms = rooms.filter(campus__campus_name__icontains=campus_name)
 
-    # Limit to 10 rooms and return relevant data
-    rooms_data = [{"room_id": room.room_id, "room_number": room.room_number, "room_type": room.room_type} for room in rooms[:10]]
+    # One page of rooms in id order
+    rooms_data, next_cursor = await akeyset_page(rooms, 'room_id', limit, after)
 
-    return JsonResponse({'rooms': rooms_data})
+    return JsonResponse({'rooms': project(rooms_data, fields), 'next': next_cursor})
 
 
-def room_details(request):
+async def room_details(request):
     room_id = request.GET.get('room_id')
 
     try:
-        room = Room.objects.get(room_id=room_id)
-        data = {
-            'room': {
-                'room_number': room.room_number,
-                'room_type': room.room_type,
-                'building_name': room.building.building_name,
-                'campus_name': room.campus.campus_name,
-            }
-        }
-        return JsonResponse(data)
-    except Room.DoesNotExist:
+        room_id = int(room_id)
+    except (TypeError, ValueError):
         return JsonResponse({'error': 'Room not found'}, status=404)
-    
+
+    async def load():
+        room = await Room.objects.filter(room_id=room_id).values(
+            'room_number', 'room_type',
+            building_name=F('building__building_name'), campus_name=F('campus__campus_name'),
+        ).afirst()
+        return room and {'room': room}
+
+    data = await acached('room', f'details:{room_id}', load)
+    if data is None:
+        return JsonResponse({'error': 'Room not found'}, status=404)
+    return JsonResponse(data)
+
+def cache_stats_view(request):
+    return JsonResponse({'reference_cache': cache_stats()})
+
+def metrics(request):
+    # Prometheus scrape target; see instrumentation.py
+    if not metrics_allowed(request):
+        return HttpResponse(status=404)
+    return HttpResponse(prometheus_text(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+def free_rooms(request):
+    day = request.GET.get('day')
+    start_time_str = request.GET.get('start')
+    end_time_str = request.GET.get('end')
+    room_type = request.GET.get('room_type', '')
+    campus_name = request.GET.get('campus', '')
+
+    if day not in VALID_DAYS:
+        return JsonResponse({"error": f"Invalid day '{day}'. Must be one of {', '.join(VALID_DAYS)}."}, status=400)
+
+    try:
+        start_time = datetime.strptime(start_time_str or '', "%H:%M").time()
+        end_time = datetime.strptime(end_time_str or '', "%H:%M").time()
+    except ValueError:
+        return JsonResponse({"error": "Invalid time format. Use HH:MM."}, status=400)
+
+    if start_time >= end_time:
+        return JsonResponse({"error": "End time must be later than the start time."}, status=400)
+
+    # Every room free for the whole window, from the cached occupancy matrix
+    rooms = get_occupancy_matrix().free_rooms(
+        day,
+        start_time.hour * 60 + start_time.minute,
+        end_time.hour * 60 + end_time.minute,
+        room_type=room_type,
+        campus=campus_name,
+    )
+
+    return JsonResponse({'rooms': rooms})
+
+async def aconflicts_besides(clashes, lookup):
+    """
+    The conflicts with saved classes awaited from `lookup`, followed by
+    `clashes`; just the clashes while the database is busy (SQLite).
+    """
+    try:
+        conflicts = await lookup
+    except OperationalError as error:
+        if not is_retryable(error):
+            raise
+        conflicts = []
+    return conflicts + clashes
+
+
+def store_program_schedules(entries):
+    """
+    Save the ProgramSchedule and Schedule rows of every entry in one
+    transaction, holding the locks of every resource they book (see locks.py)
+    from the conflict check to the commit. The slot_occupancy rows go in the
+    same transaction, and their unique constraint turns away any
+    double-booking the locks missed.
+
+    `entries` are dicts of references, slots, resources and values. Returns
+    (program_schedules, None) once saved, or (None, conflicts) as
+    find_batch_conflicts reports them; raises Overload and IntegrityError.
+    """
+    checks = [(entry['slots'], entry['resources'], entry['values']['course_code']) for entry in entries]
+
+    def save():
+        # Another save may have booked one of the resources since the first check
+        conflict_details = find_batch_conflicts(checks)
+        if conflict_details:
+            return None, conflict_details
+        # Reject before writing anything if the classes overload an instructor
+        loads, rooms = {}, {}
+        for entry in entries:
+            semester = entry['values']['semester']
+            load = loads.setdefault((entry['references']['instructor_id'], semester), [0, [], 0])
+            load[0] += entry['values']['credit_hours']
+            load[1] += entry['slots']
+            load[2] += 1
+            room = rooms.setdefault((entry['references']['room_id'], semester), [[], 0])
+            room[0] += entry['slots']
+            room[1] += 1
+        for (instructor_id, semester), (units, slots, classes) in loads.items():
+            add_load(instructor_id, semester, units, slots, classes=classes)
+
+        program_schedules = [
+            ProgramSchedule.objects.create(**entry['values'], **entry['references']) for entry in entries
+        ]
+        schedules = Schedule.objects.bulk_create([
+            Schedule(
+                program_schedule=program_schedule,
+                day=day,
+                start_time=start_time,
+                end_time=end_time
+            )
+            for program_schedule, entry in zip(program_schedules, entries)
+            for day, start_time, end_time in entry['slots']
+        ])
+        occupy([
+            (program_schedule, [schedule for schedule in schedules if schedule.program_schedule is program_schedule],
+             entry['resources'])
+            for program_schedule, entry in zip(program_schedules, entries)
+        ])
+        for (room_id, semester), (slots, classes) in rooms.items():
+            record_schedules(room_id, semester, slots, classes=classes)
+        return program_schedules, None
+
+    keys = [key for entry in entries for key in resource_keys(**entry['resources'])]
+    try:
+        return locked(keys, save)
+    except IntegrityError:
+        # A reference was deleted, or slot_occupancy refused a double-booking
+        conflict_details = find_batch_conflicts(checks)
+        if not conflict_details:
+            raise
+        return None, conflict_details
+
+
+def clean_entry(data, schedules):
+    """
+    Validate one class: the fields posted to save_program_schedule (or one
+    class of a batch) and its (day, start_time, end_time) strings. Returns the
+    ProgramSchedule values and the parsed slots; raises ValueError with the
+    message to show.
+    """
+    instructor_name = data.get('instructor_name')
+    if not instructor_name:
+        raise ValueError("Instructor name is required.")
+
+    course_code = data.get('course_code')
+    if not course_code:
+        raise ValueError("Course code is required.")
+
+    credit_hours = data.get('credit_hours')
+    if credit_hours is None or not str(credit_hours).isdigit():
+        raise ValueError("Credit hours must be a valid integer.")
+
+    if not data.get('year_level'):
+        raise ValueError("Year level is required.")
+
+    if len(schedules) == 0:
+        raise ValueError("At least one schedule is required.")
+
+    # Validate every slot before checking for conflicts
+    slots = []
+    for day, start_time_str, end_time_str in schedules:
+        # Validate day and time fields
+        if day not in VALID_DAYS:
+            raise ValueError(f"Invalid day '{day}'. Must be one of {', '.join(VALID_DAYS)}.")
+
+        if not start_time_str or not end_time_str:
+            raise ValueError("Both start time and end time are required.")
+
+        try:
+            start_time = datetime.strptime(start_time_str, "%H:%M").time()
+            end_time = datetime.strptime(end_time_str, "%H:%M").time()
+        except (TypeError, ValueError):
+            raise ValueError("Invalid time format. Use HH:MM.")
+
+        slots.append((day, start_time, end_time))
+
+    return {
+        'instructor_name': instructor_name,
+        'course_code': course_code,
+        'course_name': data.get('course_name', "Untitled Course"),
+        'credit_hours': int(credit_hours),
+        'semester': data.get('semester'),
+        'program_name': data.get('program_name'),
+        'program_code': data.get('program_code'),
+        'room_number': data.get('room_number'),
+        'room_type': data.get('room_type'),
+        'building_name': data.get('building_name'),
+        'campus_name': data.get('campus_name'),
+        'year_level': data.get('year_level'),
+        'section': data.get('section'),
+        'shift': data.get('shift'),
+        'bachelor_degree': data.get('bachelor_degree', ""),
+        'master_degree': data.get('master_degree', ""),
+    }, slots
+
+
+def entry_resources(values, references):
+    """The resource_keys arguments of a cleaned entry."""
+    return {
+        'instructor_name': values['instructor_name'],
+        'room_number': values['room_number'],
+        'program_name': values['program_name'],
+        'section': values['section'],
+        'year_level': values['year_level'],
+        'shift': values['shift'],
+        'instructor_id': references['instructor_id'],
+        'room_id': references['room_id'],
+        'program_id': references['program_id'],
+    }
+
+
+def overload_response(overload):
+    return JsonResponse({"error": str(overload), "overload": True, "units": overload.load.units,
+                         "instructor_id": overload.load.instructor_id}, status=400)
+
+
 @csrf_exempt
-def save_program_schedule(request):
+async def save_program_schedule(request):
     if request.method == "POST":
 
-        # Print all request data for debugging
-        print(request.POST)
-
-        # Extract and validate required fields
-        instructor_name = request.POST.get('instructor_name')
-        if not instructor_name:
-            return JsonResponse({"error": "Instructor name is required."}, status=400)
-        bachelor_degree = request.POST.get('bachelor_degree',"")
-        master_degree = request.POST.get('master_degree',"")
-
-        # # Validate inputs
-        # if not bachelor_degree:
-        #     return JsonResponse({"error": "Bachelor's Degree is required."}, status=400)
-        # if not master_degree:
-        #     return JsonResponse({"error": "Master's Degree is required."}, status=400)
-
-        course_code = request.POST.get('course_code')
-        if not course_code:
-            return JsonResponse({"error": "Course code is required."}, status=400)
-
-        course_name = request.POST.get('course_name', "Untitled Course")
-        
-        credit_hours = request.POST.get('credit_hours')
-        if credit_hours is None or not credit_hours.isdigit():
-            return JsonResponse({"error": "Credit hours must be a valid integer."}, status=400)
-        credit_hours = int(credit_hours)
-
-        semester = request.POST.get('semester')
-        program_name = request.POST.get('program_name')
-        program_code = request.POST.get('program_code')
-        room_number = request.POST.get('room_number')
-        room_type = request.POST.get('room_type')
-        building_name = request.POST.get('building_name')   
-        campus_name = request.POST.get('campus_name')
-
-        year_level = request.POST.get('year_level')
-        section = request.POST.get('section')
-        shift = request.POST.get('shift')
-
-        if not year_level:
-            return JsonResponse({"error": "Year level is required."}, status=400)
-
-         # Extracting all schedule entries
-        schedule_days = []
-        schedule_start_times = []
-        schedule_end_times = []
+        logger.debug("save_program_schedule fields=%s", sorted(request.POST))
+
+        # Extracting all schedule entries
+        schedules = []
 
         # Loop through all possible schedule indices (this assumes you have a finite, known upper limit of schedule entries, like 10)
         schedule_index = 0
@@ -300,126 +607,138 @@ def save_program_schedule(request):
             if day_key not in request.POST or start_time_key not in request.POST or end_time_key not in request.POST:
                 break  # Exit the loop if we don't find any more schedules
 
-            schedule_days.append(request.POST.get(day_key))
-            schedule_start_times.append(request.POST.get(start_time_key))
-            schedule_end_times.append(request.POST.get(end_time_key))
+            schedules.append((
+                request.POST.get(day_key), request.POST.get(start_time_key), request.POST.get(end_time_key),
+            ))
 
             schedule_index += 1
 
-        if len(schedule_days) == 0:
-            return JsonResponse({"error": "At least one schedule is required."}, status=400)
-
-        # Loop through all the schedules and extract data
-        for i in range(len(schedule_days)):
-            day = schedule_days[i]
-            start_time_str = schedule_start_times[i]
-            end_time_str = schedule_end_times[i]
+        try:
+            values, slots = clean_entry(request.POST, schedules)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
 
-            # Validate day and time fields
-            valid_days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-            if day not in valid_days:
-                return JsonResponse({"error": f"Invalid day '{day}'. Must be one of {', '.join(valid_days)}."}, status=400)
+        # Link the entry to the master records so renames don't hide conflicts
+        try:
+            # Any references not posted as ids are looked up in one trip to the ORM thread
+            references = await aresolve_references(request.POST)
+        except ValueError:
+            return JsonResponse({"error": "Instructor, course, program and room ids must be integers."}, status=400)
+
+        resources = entry_resources(values, references)
+
+        # Two of the class' own meetings at once ('batch_class' 0: this class)
+        clashes = find_batch_clashes([(slots, resources, values['course_code'])])
+        if clashes:
+            # Nothing will be saved: report the saved classes it conflicts with too,
+            # from one slot_occupancy lookup grouped back per slot
+            conflict_details = await aconflicts_besides(clashes, afind_conflicts_in_slots(slots, **resources))
+        else:
+            # The save checks conflicts once, under its locks. The transaction must
+            # stay on one thread, so the write runs on the sync ORM thread
+            try:
+                program_schedules, conflict_details = await sync_to_async(store_program_schedules)([{
+                    'references': references, 'slots': slots, 'resources': resources, 'values': values,
+                }])
+            except Overload as overload:
+                return overload_response(overload)
+            except IntegrityError:
+                return JsonResponse({"error": "Selected instructor, course, program or room no longer exists."}, status=400)
+            if program_schedules is not None:
+                return JsonResponse({"message": "Program schedule saved successfully!"})
+
+        # Add a specific conflict message
+        for conflict in conflict_details:
+            conflict.pop('class', None)
+        label_conflicts(conflict_details, **resources)
+
+        logger.info("save_program_schedule rejected conflicts=%d instructor=%r room=%r section=%r",
+                    len(conflict_details), values['instructor_name'], values['room_number'], values['section'])
+
+        return JsonResponse({"conflict": True, "details": conflict_details}, status=200)
+    else:
+        return JsonResponse({"error": "Invalid request method. Use POST."}, status=400)
 
-            if not start_time_str or not end_time_str:
-                return JsonResponse({"error": "Both start time and end time are required."}, status=400)
 
-            try:
-                start_time = datetime.strptime(start_time_str, "%H:%M").time()
-                end_time = datetime.strptime(end_time_str, "%H:%M").time()
-            except ValueError:
-                return JsonResponse({"error": "Invalid time format. Use HH:MM."}, status=400)
-    
-            # Conflict detection with the Schedule model
-            conflicts = Schedule.objects.filter(
-                program_schedule__in=ProgramSchedule.objects.filter(
-                    Q(instructor_name=instructor_name) | 
-                    Q(room_number=room_number) |
-                    (
-                        Q(program_name=program_name) & 
-                        Q(section=section) &
-                        Q(year_level=year_level) &
-                        Q(shift=shift)
-                    )
-                ),
-                day=day,
-                start_time__lt=end_time,
-                end_time__gt=start_time
-            )
+# A section's or instructor's load is about ten classes
+MAX_BATCH_CLASSES = 50
 
-            if conflicts.exists():
-                conflict_details = conflicts.values(
-                    'program_schedule__instructor_name', 
-                    'program_schedule__course_code',
-                    'program_schedule__room_number', 
-                    'program_schedule__program_name',
-                    'program_schedule__section',
-                    'program_schedule__year_level',
-                    'program_schedule__shift',
-                    'day', 
-                    'start_time', 
-                    'end_time'
-                )
-
-                # Add a specific conflict message
-                for conflict in conflict_details:
-                        if conflict['program_schedule__instructor_name'] == instructor_name:
-                            conflict['conflict_field'] = 'instructor_name'
-                            conflict['conflict_message'] = "Instructor's schedule is already booked."
-                        elif conflict['program_schedule__room_number'] == room_number:
-                            conflict['conflict_field'] = 'room_number'
-                            conflict['conflict_message'] = "Room schedule is already booked."
-                        elif (
-                            conflict['program_schedule__program_name'] == program_name and
-                            conflict['program_schedule__section'] == section and
-                            conflict['program_schedule__year_level'] == year_level and
-                            conflict['program_schedule__shift'] == shift
-                        ):
-                            conflict['conflict_field'] = 'program_section_year_shift'
-                            conflict['conflict_message'] = "Program, section, year level, or shift schedule is already booked."
-
-                # Debug print to see the structure of conflict_details
-                print(conflict_details)
-                
-                return JsonResponse({"conflict": True, "details": list(conflict_details)}, status=200)
-        
-        
-        # Save data to the ProgramSchedule model
-        program_schedule = ProgramSchedule.objects.create(
-            instructor_name=instructor_name,
-            course_code=course_code,
-            course_name=course_name,
-            credit_hours=credit_hours,
-            semester=semester,
-            program_name=program_name,
-            program_code=program_code,
-            room_number=room_number,
-            room_type=room_type,
-            building_name=building_name,
-            campus_name=campus_name,
-            year_level=year_level,
-            section=section,
-            shift=shift,
-            bachelor_degree=bachelor_degree,  # Add this
-            master_degree=master_degree       # Add this
-        )# Create the associated Schedule entries
-        for i in range(len(schedule_days)):
-            day = schedule_days[i]
-            start_time_str = schedule_start_times[i]
-            end_time_str = schedule_end_times[i]
-            start_time = datetime.strptime(start_time_str, "%H:%M").time()
-            end_time = datetime.strptime(end_time_str, "%H:%M").time()
 
-            # Create new Schedule entry for each schedule
-            Schedule.objects.create(
-                program_schedule=program_schedule,
-                day=day,
-                start_time=start_time,
-                end_time=end_time
-            )
+@csrf_exempt
+async def save_program_schedules(request):
+    """
+    Save a whole section or instructor load in one request, all or nothing.
+
+    The body is JSON: {"shared": {...}, "classes": [{..., "schedules": [{"day",
+    "start_time", "end_time"}, ...]}, ...]} where each class takes the fields
+    of save_program_schedule, falling back to "shared" for the ones it leaves
+    out (typically the instructor, program, section or room). The classes are
+    checked against each other in memory and against the saved schedules in
+    one query, then written in one transaction. Conflict details carry
+    'class', the index of the class they belong to, and 'batch_class' when
+    the slot is held by another class of the same request.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method. Use POST."}, status=400)
+    try:
+        body = json.loads(request.body)
+        shared = body.get('shared') or {}
+        classes = [{**shared, **data} for data in body['classes']]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({"error": "Send JSON with a \"classes\" list."}, status=400)
+    if not classes:
+        return JsonResponse({"error": "At least one class is required."}, status=400)
+    if len(classes) > MAX_BATCH_CLASSES:
+        return JsonResponse({"error": f"At most {MAX_BATCH_CLASSES} classes can be saved at once."}, status=400)
+
+    entries = []
+    for number, data in enumerate(classes):
+        try:
+            schedules = [
+                (schedule.get('day'), schedule.get('start_time'), schedule.get('end_time'))
+                for schedule in data.get('schedules') or []
+            ]
+            values, slots = clean_entry(data, schedules)
+        except (ValueError, AttributeError) as error:
+            message = str(error) if isinstance(error, ValueError) else "Each schedule must be an object."
+            return JsonResponse({"error": message, "class": number}, status=400)
+        entries.append({'data': data, 'values': values, 'slots': slots})
 
-        return JsonResponse({"message": "Program schedule saved successfully!"})
+    try:
+        # Classes of one load repeat the same instructor, program and room: one query per kind for the batch
+        all_references = await aresolve_many([entry['data'] for entry in entries])
+    except (ValueError, TypeError):
+        return JsonResponse({"error": "Instructor, course, program and room ids must be integers."}, status=400)
+    for entry, references in zip(entries, all_references):
+        del entry['data']
+        entry['references'] = references
+        entry['resources'] = entry_resources(entry['values'], references)
+
+    # Clashes within the batch; when there are some, one snapshot of the saved schedules too
+    checks = [(entry['slots'], entry['resources'], entry['values']['course_code']) for entry in entries]
+    clashes = find_batch_clashes(checks)
+    if clashes:
+        conflict_details = await aconflicts_besides(clashes, afind_batch_conflicts(checks))
     else:
-        return JsonResponse({"error": "Invalid request method. Use POST."}, status=400)
+        # The save checks conflicts with saved classes once, under its locks
+        try:
+            program_schedules, conflict_details = await sync_to_async(store_program_schedules)(entries)
+        except Overload as overload:
+            return overload_response(overload)
+        except IntegrityError:
+            return JsonResponse({"error": "Selected instructor, course, program or room no longer exists."},
+                                status=400)
+        if program_schedules is not None:
+            return JsonResponse({
+                "message": f"{len(program_schedules)} program schedules saved successfully!",
+                "ids": [program_schedule.id for program_schedule in program_schedules],
+            })
+
+    for conflict in conflict_details:
+        label_conflicts([conflict], **entries[conflict['class']]['resources'])
+    logger.info("save_program_schedules rejected conflicts=%d classes=%d", len(conflict_details), len(entries))
+    return JsonResponse({"conflict": True, "details": conflict_details}, status=200)
+
     
 # View to fetch rooms and semesters
 def fetch_room_and_semester_data(request):
@@ -441,43 +760,307 @@ def fetch_room_and_semester_data(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
     
+def room_timetable_etag(request):
+    room = request.GET.get('room_id') or request.GET.get('room_number')
+    semester = request.GET.get('semester')
+    if not room or not semester:
+        return None
+    # Any schedule save or delete bumps the version, so this changes whenever the data can
+    return f"room-{room}-{semester}-{get_version('schedule')}"
+
+
+def room_timetable_modified(request):
+    return get_modified('schedule')
+
+
+@condition(etag_func=room_timetable_etag, last_modified_func=room_timetable_modified)
 def fetch_timetable_for_room(request):
+    room_id = request.GET.get('room_id')
     room_number = request.GET.get('room_number')
     semester = request.GET.get('semester')
 
-    if not room_number or not semester:
+    if not (room_id or room_number) or not semester:
         return JsonResponse({"error": "Room number and semester are required."}, status=400)
 
-    # Fetch timetable data based on room_number and semester
-    timetable = ProgramSchedule.objects.filter(
-        room_number=room_number,
-        semester=semester
+    # One query over Schedule joined to ProgramSchedule for the room's semester
+    if room_id:
+        try:
+            rows = schedule_rows(program_schedule__room_id=int(room_id), program_schedule__semester=semester)
+        except ValueError:
+            return JsonResponse({"error": "room_id must be an integer."}, status=400)
+    else:
+        rows = schedule_rows(program_schedule__room_number=room_number, program_schedule__semester=semester)
+
+    data = timetable(rows)
+    data.update({'room_id': room_id, 'room_number': room_number, 'semester': semester})
+    return JsonResponse(data)
+
+
+# Items of a sync iterator sent per sync_to_async call when streaming under ASGI
+STREAM_CHUNK = 200
+
+
+async def aiterate(iterator, size=STREAM_CHUNK):
+    """Drain a sync iterator of text through sync_to_async, `size` items at a time."""
+    iterator = iter(iterator)
+    next_chunk = sync_to_async(lambda: list(islice(iterator, size)))
+    while chunk := await next_chunk():
+        yield ''.join(chunk)
+
+
+def streaming_response(request, iterator, size=STREAM_CHUNK, **kwargs):
+    """
+    StreamingHttpResponse over a sync iterator of text. Under ASGI, Django
+    would collect a sync iterator in full before sending anything, so there it
+    is drained by an async generator instead, each chunk going out as soon as
+    it is built. The iterator runs on the request's sync thread either way,
+    which keeps server-side cursors on their connection.
+    """
+    if isinstance(request, ASGIRequest):
+        iterator = aiterate(iterator, size)
+    return StreamingHttpResponse(iterator, **kwargs)
+
+
+def parse_ids(request, name):
+    """Integer ids from repeated ?name=1&name=2 or comma-separated ?name=1,2 values."""
+    return [int(value) for values in request.GET.getlist(name) for value in values.split(',') if value.strip()]
+
+
+def batch_timetables(request):
+    by = request.GET.get('by', 'room')
+    semester = request.GET.get('semester')
+
+    if by not in GROUPINGS:
+        return JsonResponse({"error": f"by must be one of {', '.join(GROUPINGS)}."}, status=400)
+    if not semester:
+        return JsonResponse({"error": "semester is required."}, status=400)
+
+    lookups = {'program_schedule__semester': semester}
+    try:
+        if by == 'room':
+            room_ids = parse_ids(request, 'room_id')
+            building_ids = parse_ids(request, 'building_id')
+            if room_ids:
+                lookups['program_schedule__room_id__in'] = room_ids
+            if building_ids:
+                lookups['program_schedule__room__building_id__in'] = building_ids
+        elif by == 'instructor':
+            instructor_ids = parse_ids(request, 'instructor_id')
+            if instructor_ids:
+                lookups['program_schedule__instructor_id__in'] = instructor_ids
+        else:
+            program_ids = parse_ids(request, 'program_id')
+            if program_ids:
+                lookups['program_schedule__program_id__in'] = program_ids
+            for field in ('year_level', 'section', 'shift'):
+                if request.GET.get(field):
+                    lookups[f'program_schedule__{field}'] = request.GET[field]
+    except ValueError:
+        return JsonResponse({"error": "Ids must be integers."}, status=400)
+
+    if len(lookups) == 1:
+        return JsonResponse({"error": "Give the rooms, buildings, instructors or programs to include."}, status=400)
+
+    def stream():
+        # Groups are written as they come off the cursor, one query for the whole batch
+        yield '{"by": %s, "semester": %s, "timetables": [' % (json.dumps(by), json.dumps(semester))
+        for position, group in enumerate(grouped_timetables(by, **lookups)):
+            yield (',' if position else '') + json.dumps(group, cls=DjangoJSONEncoder)
+        yield ']}'
+
+    return streaming_response(request, stream(), content_type='application/json')
+
+
+def export_filters(request):
+    """semester/instructor_id/room_id/program_id from the query string; ValueError for malformed ids."""
+    filters = {'semester': request.GET.get('semester') or None}
+    for name in ('instructor_id', 'room_id', 'program_id'):
+        value = request.GET.get(name)
+        filters[name] = int(value) if value else None
+    return filters
+
+
+def export_schedules(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'xlsx'):
+        return JsonResponse({"error": "format must be csv or xlsx."}, status=400)
+    try:
+        rows = export_rows(**export_filters(request))
+    except ValueError:
+        return JsonResponse({"error": "Ids must be integers."}, status=400)
+
+    filename = f"timetable-{request.GET.get('semester') or 'all'}.{export_format}"
+    if export_format == 'csv':
+        response = streaming_response(request, csv_lines(rows), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    try:
+        handle = xlsx_file(rows)
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=501)
+    return FileResponse(
+        handle, as_attachment=True, filename=filename,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+
+def export_calendar(request):
+    try:
+        filters = export_filters(request)
+    except ValueError:
+        return JsonResponse({"error": "Ids must be integers."}, status=400)
+    if not (filters['instructor_id'] or filters['room_id']):
+        return JsonResponse({"error": "instructor_id or room_id is required."}, status=400)
+
+    try:
+        term_start = datetime.strptime(request.GET.get('term_start', ''), "%Y-%m-%d").date()
+        weeks = int(request.GET.get('weeks', DEFAULT_TERM_WEEKS))
+    except ValueError:
+        return JsonResponse({"error": "term_start (YYYY-MM-DD) is required and weeks must be an integer."}, status=400)
+
+    name = 'Instructor timetable' if filters['instructor_id'] else 'Room timetable'
+    response = streaming_response(
+        request, ics_lines(export_rows(**filters), term_start, weeks=weeks, name=name), content_type='text/calendar',
     )
+    kind, key = ('instructor', filters['instructor_id']) if filters['instructor_id'] else ('room', filters['room_id'])
+    response['Content-Disposition'] = f'attachment; filename="{kind}-{key}.ics"'
+    return response
+
 
-    # Prepare timetable data with proper time conversion
-    timetable_data = []
-    for entry in timetable:
+def sandbox_or_404(sandbox_id):
+    sandbox = Sandbox.load(sandbox_id)
+    if sandbox is None:
+        return None, JsonResponse({"error": "Sandbox not found or expired."}, status=404)
+    return sandbox, None
+
+
+@csrf_exempt
+def create_sandbox(request):
+    """Start an empty what-if sandbox (see sandbox.py)."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method. Use POST."}, status=400)
+    sandbox = Sandbox()
+    sandbox.save()
+    return JsonResponse({"sandbox_id": sandbox.id})
+
+
+@csrf_exempt
+def sandbox_diff(request, sandbox_id):
+    """GET: every proposed change with its conflicts. DELETE: throw the sandbox away."""
+    sandbox, error = sandbox_or_404(sandbox_id)
+    if error:
+        return error
+    if request.method == "DELETE":
+        sandbox.discard()
+        return JsonResponse({"message": "Sandbox discarded."})
+    changes = sandbox.diff()
+    return JsonResponse({
+        "sandbox_id": sandbox.id,
+        "changes": changes,
+        "conflicts": sum(len(change['conflicts']) for change in changes),
+    })
+
+
+@csrf_exempt
+def sandbox_move(request, sandbox_id):
+    """
+    Propose a move: JSON {"program_schedule_id": ..., "room_id", "instructor_id",
+    "section", "year_level", "shift", "schedules": [{"day", "start_time",
+    "end_time"}, ...]} with any of the fields, or {"program_schedule_id": ...,
+    "revert": true}. Returns the entry's change and its conflicts.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method. Use POST."}, status=400)
+    sandbox, error = sandbox_or_404(sandbox_id)
+    if error:
+        return error
+    try:
+        body = json.loads(request.body)
+        entry_id = int(body.pop('program_schedule_id'))
+        if 'schedules' in body:
+            body['schedules'] = [
+                (schedule['day'], schedule['start_time'], schedule['end_time']) for schedule in body['schedules']
+            ]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({"error": "Send JSON with a program_schedule_id and the fields to change."}, status=400)
+
+    if body.pop('revert', False):
+        sandbox.revert(entry_id)
+        conflicts = []
+    else:
         try:
-            # Convert start_time and end_time from text to datetime.time objects
-            start_time_str = entry.start_time  # '08:00'
-            end_time_str = entry.end_time     # '09:00'
-            
-            # Convert the string time to datetime.time objects
-            start_time = datetime.strptime(start_time_str, "%H:%M").time()
-            end_time = datetime.strptime(end_time_str, "%H:%M").time()
+            conflicts = sandbox.move(entry_id, body)
+        except LookupError as missing:
+            return JsonResponse({"error": str(missing)}, status=404)
+        except (ValueError, TypeError) as invalid:
+            return JsonResponse({"error": str(invalid)}, status=400)
+    sandbox.save()
+    return JsonResponse({
+        "program_schedule_id": entry_id,
+        "change": sandbox.changes.get(entry_id),
+        "conflicts": conflicts,
+    })
 
-            timetable_data.append({
-                'course_code': entry.course_code,
-                'course_name': entry.course_name,
-                'instructor_name': entry.instructor_name,
-                'day': entry.day,
-                'start_time': start_time.strftime('%H:%M'),  # Format the time for front-end
-                'end_time': end_time.strftime('%H:%M'),
-                'year_level': entry.year_level,
-                'section': entry.section,
-                'shift': entry.shift,
-            })
-        except Exception as e:
-            print(f"Error processing timetable entry: {e}")
 
-    return JsonResponse({'timetable': timetable_data})
+@csrf_exempt
+def sandbox_commit(request, sandbox_id):
+    """Apply every proposed change in one transaction, or none of them."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method. Use POST."}, status=400)
+    sandbox, error = sandbox_or_404(sandbox_id)
+    if error:
+        return error
+    if not sandbox.changes:
+        return JsonResponse({"error": "The sandbox has no changes."}, status=400)
+    try:
+        entry_ids = sandbox.commit()
+    except Stale as stale:
+        return JsonResponse({"error": "Some classes were changed since they were moved into the sandbox.",
+                             "stale": stale.entry_ids}, status=400)
+    except Rejected as rejected:
+        return JsonResponse({"conflict": True, "details": rejected.conflicts}, status=200)
+    except Overload as overload:
+        return overload_response(overload)
+    except IntegrityError:
+        return JsonResponse({"error": "Selected instructor, course, program or room no longer exists."}, status=400)
+    sandbox.discard()
+    logger.info("sandbox_commit sandbox=%s entries=%d", sandbox.id, len(entry_ids))
+    return JsonResponse({"message": f"{len(entry_ids)} program schedules updated.", "ids": entry_ids})
+
+
+# Longest repair a request may ask for, in seconds
+MAX_REPAIR_SECONDS = 60
+
+
+def repair_timetable(request):
+    """
+    Repair the saved timetable by local search (see repair.py), streaming
+    NDJSON progress events. ?semester limits the classes that may move,
+    ?close_room and ?instructor_left (ids) mark what must be moved away from,
+    ?time_limit is in seconds. The last event, "done", lists the moves and
+    the sandbox holding them, ready for review and commit.
+    """
+    try:
+        closed_rooms = parse_ids(request, 'close_room')
+        departed = parse_ids(request, 'instructor_left')
+        time_limit = min(float(request.GET.get('time_limit', 10)), MAX_REPAIR_SECONDS)
+        seed = int(request.GET.get('seed', 0))
+    except ValueError:
+        return JsonResponse({"error": "Ids, time_limit and seed must be numbers."}, status=400)
+    if time_limit <= 0:
+        return JsonResponse({"error": "time_limit must be positive."}, status=400)
+
+    def stream():
+        repair = load_repair(request.GET.get('semester') or None, closed_rooms=closed_rooms, departed=departed,
+                             seed=seed)
+        for event in repair.run(time_limit=time_limit):
+            if event['event'] == 'done':
+                moves = repair.changes()
+                event.update(initial_cost=repair.initial_cost, initial_violations=repair.initial_violations,
+                             changes=moves, sandbox_id=propose(moves).id if moves else None)
+                logger.info("repair_timetable moves=%d cost=%d->%d", len(moves), repair.initial_cost, repair.cost)
+            yield json.dumps(event) + '\n'
+
+    # One event per chunk: under ASGI each search step runs through sync_to_async and is sent when it ends
+    return streaming_response(request, stream(), size=1, content_type='application/x-ndjson')